@@ -1,6 +1,25 @@
+import asyncio
+import json
 import os
+import re
+import threading
+import time
 import google.generativeai as genai
 from dotenv import load_dotenv
+from app.cache import create_cache, make_cache_key
+from app.chunking import split_into_chunks
+from app.explanations import explanation_store
+from app.fallback import fallback_corpus
+from app.hedging import create_hedger
+from app.metrics import generate_errors, generate_seconds, postprocess_seconds, record_fallback, record_usage
+from app.postprocess import StreamCleaner, clean_response
+from app.prompt_budget import QUIZ_INPUT_TOKENS, count_tokens, output_tokens
+from app.quiz_parser import QUIZ_SCHEMA, parse_quiz
+from app.retrieval import select_context
+from app.router import router, should_try_next
+from app.semantic_cache import create_semantic_cache
+from app.scheduler import Admission, CallScheduler, PRIORITY_BATCH, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE
+from app.singleflight import SingleFlight
 
 load_dotenv()
 
@@ -8,16 +27,26 @@ load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=api_key)
 
-# Try to get available models
-def get_available_model():
-    """Get the first available model that supports generateContent"""
+def list_generation_models():
+    """Names of all models that support generateContent, or None if listing failed"""
     try:
-        # List available models
-        for model_info in genai.list_models():
-            if "generateContent" in model_info.supported_generation_methods:
-                return model_info.name.split('/')[-1]  # Extract model name
+        return [
+            model_info.name.split('/')[-1]  # Extract model name
+            for model_info in genai.list_models()
+            if "generateContent" in model_info.supported_generation_methods
+        ]
     except Exception as e:
         print(f"Warning: Could not list models: {e}")
+        return None
+
+# Try to get available models
+def get_available_model():
+    """Get the first available model that supports generateContent"""
+    names = list_generation_models()
+    # The router only sends traffic to configured tier models that are listed
+    router.set_available(names)
+    if names:
+        return names[0]
     
     # Fallback list of models to try
     models_to_try = [
@@ -39,42 +68,310 @@ def get_available_model():
     
     return None
 
-# Get available model
-available_model = get_available_model()
+# Model resolution runs lazily in a background thread so importing this module
+# never waits on the network. The resolved name is persisted so the next worker
+# to boot can start serving immediately and only re-validates in the background.
+MODEL_STATE_PATH = os.getenv("MODEL_STATE_PATH", ".cache/model_state.json")
+MODEL_RESOLVE_TIMEOUT = float(os.getenv("MODEL_RESOLVE_TIMEOUT", 10))
+
+available_model = None
+model = None
+model_source = None
+_model_ready = threading.Event()
+_model_lock = threading.Lock()
+_resolver_thread = None
+
+def _load_model_state():
+    """Read the model name persisted by a previous resolution, if any"""
+    try:
+        with open(MODEL_STATE_PATH) as f:
+            return json.load(f).get("model")
+    except (OSError, ValueError):
+        return None
 
-if available_model:
+def _save_model_state(model_name: str):
+    """Persist the resolved model name for the next worker start"""
+    try:
+        directory = os.path.dirname(MODEL_STATE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{MODEL_STATE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model_name, "resolved_at": time.time()}, f)
+        os.replace(tmp_path, MODEL_STATE_PATH)
+    except OSError as e:
+        print(f"Warning: Could not save model state: {e}")
+
+def _set_model(model_name, source: str):
+    """Swap in a new model instance; returns True on success"""
+    global available_model, model, model_source
     try:
-        model = genai.GenerativeModel(available_model)
-        print(f"Model initialized: {available_model}")
+        new_model = genai.GenerativeModel(model_name)
     except Exception as e:
-        print(f"Error initializing model: {e}")
-        model = None
-else:
-    print("No available Gemini model found. Using fallback mock responses.")
-    model = None
-
-def clean_response(text: str) -> str:
-    """Clean special characters from API response"""
-    import re
-    # Remove $...$ patterns (mathematical notation)
-    text = re.sub(r'\$[^$]*\$', '', text)
-    # Replace #### with ###
-    text = re.sub(r'#{4,}', '###', text)
-    # Replace * bullet points with • 
-    text = re.sub(r'\n\* ', '\n• ', text)
-    # Remove excessive asterisks
-    text = re.sub(r'\*\*', '', text)
-    return text
-
-def get_explanation(topic: str, difficulty: str):
-    """Generate a real-time explanation using Gemini API or fallback"""
+        print(f"Error initializing model {model_name}: {e}")
+        return False
+    with _model_lock:
+        available_model, model, model_source = model_name, new_model, source
+    router.default_model = model_name
+    print(f"Model initialized: {model_name} ({source})")
+    return True
+
+def _resolve_model():
+    """Background task: discover a usable model and persist the choice"""
     try:
-        if not model:
-            return generate_mock_explanation(topic, difficulty)
-        
-        # Adjust prompt and tokens based on difficulty
-        if difficulty.lower() == 'easy':
-            prompt = f"""Provide a comprehensive explanation of '{topic}' at Easy level.
+        model_name = get_available_model()
+        if model_name and model_name != available_model:
+            if _set_model(model_name, "discovery"):
+                _save_model_state(model_name)
+        elif model_name:
+            _save_model_state(model_name)
+        elif not model:
+            print("No available Gemini model found. Using fallback mock responses.")
+    finally:
+        _model_ready.set()
+
+def start_model_resolution():
+    """Start model discovery in the background if it has not started yet"""
+    global _resolver_thread
+    with _model_lock:
+        if _resolver_thread is not None:
+            return
+        _resolver_thread = threading.Thread(target=_resolve_model, name="model-resolver", daemon=True)
+
+    persisted = _load_model_state()
+    if persisted and _set_model(persisted, "state_file"):
+        _model_ready.set()
+    _resolver_thread.start()
+
+def get_model(timeout: float = None):
+    """Return the resolved model, waiting up to `timeout` seconds for discovery"""
+    start_model_resolution()
+    _model_ready.wait(MODEL_RESOLVE_TIMEOUT if timeout is None else timeout)
+    return model
+
+async def get_model_async(timeout: float = None):
+    """Like get_model, but waits for discovery without blocking the event loop"""
+    start_model_resolution()
+    if not _model_ready.is_set():
+        wait = MODEL_RESOLVE_TIMEOUT if timeout is None else timeout
+        await asyncio.get_running_loop().run_in_executor(None, _model_ready.wait, wait)
+    return model
+
+def use_model_factory(factory, model_name: str):
+    """Serve every call from models built by factory(name), skipping discovery (benchmarks, tests)"""
+    global available_model, model, model_source, _resolver_thread
+    with _model_lock:
+        if _resolver_thread is None:
+            _resolver_thread = threading.Thread(target=lambda: None)  # never started: no discovery
+        available_model, model, model_source = model_name, factory(model_name), "factory"
+    router.set_available(None)
+    router.default_model = model_name
+    router.reset(factory)
+    _model_ready.set()
+
+def model_status():
+    """Readiness information for the health endpoint"""
+    return {
+        "ready": _model_ready.is_set(),
+        "model": available_model,
+        "source": model_source,
+        "resolving": _resolver_thread is not None and _resolver_thread.is_alive(),
+    }
+
+# Shared cache of raw model responses, keyed on (endpoint, prompt, config, model)
+response_cache = create_cache()
+# Identical generations already in flight are awaited rather than repeated
+inflight = SingleFlight()
+# Explanation requests for a near-identical topic reuse that topic's cached response
+semantic_cache = create_semantic_cache()
+
+# Every Gemini call is admitted by one scheduler per worker: a token bucket
+# sized to the per-worker share of the RPM/TPM quota, a priority queue that lets
+# interactive requests overtake batch work, and retries with jittered backoff
+# for 429 and 5xx errors. GENERATION_CONCURRENCY bounds calls in flight; async
+# calls hold no thread while waiting, so it can be far above the threadpool size.
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", 256))
+scheduler = CallScheduler(
+    rpm=float(os.getenv("GEMINI_RPM", 60)),
+    tpm=float(os.getenv("GEMINI_TPM", 1000000)),
+    max_concurrency=GENERATION_CONCURRENCY,
+    max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", 4)),
+    base_delay=float(os.getenv("RETRY_BASE_DELAY", 0.5)),
+    max_delay=float(os.getenv("RETRY_MAX_DELAY", 8)),
+)
+# Per-endpoint deadlines, and hedged duplicates for calls slower than their p95
+hedger = create_hedger(scheduler)
+
+def _call_tokens(prompt: str, generation_config=None) -> int:
+    """Tokens a call is charged against the TPM budget (prompt + max output)"""
+    return count_tokens(prompt) + (generation_config or {}).get("max_output_tokens", 1000)
+
+def _route_key(endpoint: str, prompt: str, generation_config=None, difficulty: str = None):
+    """Cache key for a call, keyed on the route's preferred model rather than the one that served it"""
+    route_model = router.preferred(router.tier_for(endpoint, difficulty)) or available_model
+    return make_cache_key(endpoint, prompt, generation_config, route_model)
+
+def _try_next(error: Exception) -> bool:
+    """True if the next model on the ladder should be tried after this error"""
+    # response.text raises ValueError for blocked answers: the prompt, not the model
+    return not isinstance(error, ValueError) and should_try_next(error)
+
+def _model_failed(endpoint: str, model_name: str, started: float, error: BaseException):
+    if isinstance(error, asyncio.CancelledError):
+        return  # the losing side of a hedge, or past the deadline
+    generate_errors.inc(endpoint, model_name, type(error).__name__)
+    if not isinstance(error, ValueError):
+        router.record(model_name, time.perf_counter() - started, ok=False)
+
+def _model_succeeded(endpoint: str, model_name: str, started: float, prompt: str, response, text: str,
+                     difficulty: str = None):
+    elapsed = time.perf_counter() - started
+    router.record(model_name, elapsed, ok=True)
+    hedger.record(endpoint, elapsed, difficulty)
+    generate_seconds.observe(elapsed, endpoint, model_name)
+    record_usage(endpoint, response, count_tokens(prompt), count_tokens(text))
+
+def _request_options(endpoint: str, difficulty: str = None):
+    """Client-side timeout for a single call, so a hung connection cannot block forever"""
+    return {"timeout": hedger.deadline(endpoint, difficulty)}
+
+def _fallback_reason(error: Exception) -> str:
+    return "deadline" if isinstance(error, (TimeoutError, asyncio.TimeoutError)) else "api_error"
+
+async def _within_deadline(endpoint: str, awaitable, difficulty: str = None, deadline: float = None):
+    deadline = deadline or hedger.deadline(endpoint, difficulty)
+    try:
+        return await asyncio.wait_for(awaitable, deadline)
+    except asyncio.TimeoutError:
+        hedger.timeouts += 1
+        raise TimeoutError(f"{endpoint} generation exceeded its {deadline:g}s deadline") from None
+
+def _generate(endpoint: str, prompt: str, generation_config=None, difficulty: str = None):
+    """Call the model through the response cache and return the response text.
+
+    Models are tried down the router's ladder for the endpoint (and difficulty);
+    an error only moves on to the next model if another might not have it.
+    """
+    key = _route_key(endpoint, prompt, generation_config, difficulty)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def call():
+        error = RuntimeError("No Gemini model available")
+        for model_name in router.ladder(router.tier_for(endpoint, difficulty)):
+            started = time.perf_counter()
+            try:
+                response = router.model(model_name).generate_content(
+                    prompt, generation_config=generation_config,
+                    request_options=_request_options(endpoint, difficulty),
+                )
+                text = response.text
+            except Exception as e:
+                _model_failed(endpoint, model_name, started, e)
+                error = e
+                if _try_next(e):
+                    continue
+                raise
+            _model_succeeded(endpoint, model_name, started, prompt, response, text, difficulty)
+            response_cache.set(key, text)
+            return text
+        raise error
+
+    return inflight.do(key, lambda: scheduler.run_sync(call, _call_tokens(prompt, generation_config)))
+
+async def _generate_async(endpoint: str, prompt: str, generation_config=None, priority: int = PRIORITY_INTERACTIVE,
+                          difficulty: str = None, deadline: float = None):
+    """Async variant of _generate using generate_content_async.
+
+    Each step of the ladder is hedged (see app.hedging), and the whole call,
+    queueing and retries included, is cut off at the endpoint's deadline (or
+    `deadline`, for batch callers that can wait longer) with a TimeoutError
+    that callers answer from the fallbacks.
+    """
+    key = _route_key(endpoint, prompt, generation_config, difficulty)
+    cached = await response_cache.get_async(key)
+    if cached is not None:
+        return cached
+
+    async def attempt(model_name):
+        started = time.perf_counter()
+        try:
+            response = await router.model(model_name).generate_content_async(
+                prompt, generation_config=generation_config
+            )
+            text = response.text
+        except BaseException as e:
+            _model_failed(endpoint, model_name, started, e)
+            raise
+        _model_succeeded(endpoint, model_name, started, prompt, response, text, difficulty)
+        return text
+
+    tokens = _call_tokens(prompt, generation_config)
+
+    async def call():
+        await get_model_async()
+        error = RuntimeError("No Gemini model available")
+        ladder = router.ladder(router.tier_for(endpoint, difficulty))
+        for i, model_name in enumerate(ladder):
+            alternative = ladder[i + 1] if i + 1 < len(ladder) else None
+            try:
+                text = await hedger.run(endpoint, attempt, model_name, alternative, difficulty, tokens)
+            except Exception as e:
+                error = e
+                if _try_next(e):
+                    continue
+                raise
+            await response_cache.set_async(key, text)
+            return text
+        raise error
+
+    # The leader's deadline also bounds the shared call, so a hung call is
+    # cancelled rather than left running in the background. Every caller,
+    # leader or joiner, is held to its own deadline, and a more urgent joiner
+    # moves the shared call up the scheduler's queue
+    admission = Admission(priority)
+    own_deadline = deadline or hedger.deadline(endpoint, difficulty)
+    shared = inflight.do_async(
+        key,
+        lambda: asyncio.wait_for(scheduler.run(call, priority, tokens, admission), own_deadline),
+        admission,
+        lambda leader: scheduler.raise_priority(leader, priority),
+    )
+    return await _within_deadline(endpoint, shared, difficulty, own_deadline)
+
+def _chunk_text(chunk) -> str:
+    # chunk.text raises when a chunk carries no text parts (e.g. a final safety chunk)
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+def _similar_explanation(topic: str, difficulty: str):
+    """Cleaned cached explanation of a near-identical earlier topic, or None"""
+    if semantic_cache is None:
+        return None
+    key = semantic_cache.lookup(topic, difficulty)
+    text = response_cache.get(key) if key else None
+    return clean_response(text) if text is not None else None
+
+async def _similar_explanation_async(topic: str, difficulty: str):
+    """Async variant of _similar_explanation that keeps cache reads off the event loop"""
+    if semantic_cache is None:
+        return None
+    key = semantic_cache.lookup(topic, difficulty)
+    text = await response_cache.get_async(key) if key else None
+    return clean_response(text) if text is not None else None
+
+def _remember_explanation(topic: str, difficulty: str, prompt: str, generation_config):
+    if semantic_cache is not None:
+        semantic_cache.add(topic, difficulty, _route_key("explain", prompt, generation_config, difficulty))
+
+def _explanation_prompt(topic: str, difficulty: str):
+    """Build the explanation prompt and output token limit for a difficulty level"""
+    # Adjust prompt and tokens based on difficulty
+    if difficulty.lower() == 'easy':
+        prompt = f"""Provide a comprehensive explanation of '{topic}' at Easy level.
 
 REQUIREMENTS:
 - Write at least 1500 words (equivalent to half a page of dense text)
@@ -95,10 +392,10 @@ Structure:
 6. Summary and Takeaways
 
 Do NOT use mathematical symbols, dollar signs, or special characters."""
-            max_tokens = 2500
-            
-        elif difficulty.lower() == 'medium':
-            prompt = f"""Provide an in-depth explanation of '{topic}' at Medium level.
+        max_tokens = 2500
+        
+    elif difficulty.lower() == 'medium':
+        prompt = f"""Provide an in-depth explanation of '{topic}' at Medium level.
 
 REQUIREMENTS:
 - Write at least 2500-3000 words (equivalent to a full page)
@@ -123,10 +420,10 @@ Structure:
 9. Summary and Conclusion
 
 Do NOT use mathematical symbols, dollar signs, or special characters."""
-            max_tokens = 4000
-            
-        else:  # Hard
-            prompt = f"""Provide an extremely comprehensive, advanced explanation of '{topic}' at Hard level.
+        max_tokens = 4000
+        
+    else:  # Hard
+        prompt = f"""Provide an extremely comprehensive, advanced explanation of '{topic}' at Hard level.
 
 REQUIREMENTS:
 - Write at least 4000-5000 words (equivalent to 1.5-2 pages)
@@ -161,410 +458,365 @@ Structure:
 Make it detailed enough for a graduate-level course or technical interview preparation.
 Do NOT use mathematical symbols, dollar signs, or special characters.
 Use plain text formatting with clear headers and sections."""
-            max_tokens = 7000
+        max_tokens = 7000
+
+    return prompt, max_tokens
+
+def get_explanation(topic: str, difficulty: str, stream: bool = False):
+    """Generate a real-time explanation using Gemini API or fallback.
 
-        response = model.generate_content(prompt, generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens))
-        cleaned = clean_response(response.text)
+    With stream=True a generator of cleaned text chunks is returned instead.
+    """
+    if stream:
+        return _stream_explanation(topic, difficulty)
+    stored = explanation_store.get(topic, difficulty) or _similar_explanation(topic, difficulty)
+    if stored is not None:
+        return stored
+    try:
+        if not get_model():
+            record_fallback("explain", "no_model")
+            return generate_mock_explanation(topic, difficulty)
+
+        prompt, max_tokens = _explanation_prompt(topic, difficulty)
+        text = _generate("explain", prompt, {"max_output_tokens": max_tokens}, difficulty)
+        _remember_explanation(topic, difficulty, prompt, {"max_output_tokens": max_tokens})
+        with postprocess_seconds.time("clean"):
+            cleaned = clean_response(text)
         return cleaned
     except Exception as e:
         print(f"API Error: {e}")
+        record_fallback("explain", _fallback_reason(e))
         # Fallback to mock response
         return generate_mock_explanation(topic, difficulty)
 
-def generate_mock_explanation(topic: str, difficulty: str):
-    """Generate a mock explanation"""
-    explanations = {
-        "deadlock": {
-            "Easy": f"""## Deadlock in Operating System (Easy Level)
-
-### Simple Definition
-A deadlock is a situation where two or more processes are stuck waiting for each other forever. Imagine two people trying to pass through a narrow door - each waiting for the other to move first, but neither can.
-
-### Key Concepts
-- **Mutual Exclusion**: Resources can only be used by one process at a time
-- **Hold and Wait**: A process holds a resource while waiting for another
-- **Circular Waiting**: Processes wait in a circle (A waits for B, B waits for A)
-
-### Real-world Example
-Two threads in a program:
-- Thread A locks Resource 1 and waits for Resource 2
-- Thread B locks Resource 2 and waits for Resource 1
-Neither can proceed!
-
-### Summary
-Deadlock is when processes can't move forward because they're waiting for each other. It's a common problem in concurrent programs.""",
-            "Medium": f"""## Deadlock in Operating System (Medium Level)
-
-### Detailed Definition
-A deadlock is a state where two or more processes are blocked indefinitely, each waiting for a resource held by another process in the set. This creates a circular dependency that cannot be resolved without external intervention.
-
-### Four Necessary Conditions (Coffman Conditions)
-- **Mutual Exclusion**: A resource cannot be shared; only one process can use it
-- **Hold and Wait**: A process holding a resource can request additional resources
-- **No Preemption**: Resources cannot be forcefully taken from a process
-- **Circular Wait**: There exists a circular chain of processes, each holding resources needed by the next
+async def get_explanation_async(topic: str, difficulty: str):
+    """Async variant of get_explanation for use inside the event loop"""
+    stored = explanation_store.get(topic, difficulty) or await _similar_explanation_async(topic, difficulty)
+    if stored is not None:
+        return stored
+    try:
+        if not await get_model_async():
+            record_fallback("explain", "no_model")
+            return generate_mock_explanation(topic, difficulty)
 
-### Example with Code Context
-```
-Thread A: lock(L1) → wait for L2
-Thread B: lock(L2) → wait for L1
-```
-Result: Deadlock - both threads blocked indefinitely.
+        prompt, max_tokens = _explanation_prompt(topic, difficulty)
+        text = await _generate_async(
+            "explain", prompt, {"max_output_tokens": max_tokens}, PRIORITY_INTERACTIVE, difficulty
+        )
+        _remember_explanation(topic, difficulty, prompt, {"max_output_tokens": max_tokens})
+        with postprocess_seconds.time("clean"):
+            return clean_response(text)
+    except Exception as e:
+        print(f"API Error: {e}")
+        record_fallback("explain", _fallback_reason(e))
+        return generate_mock_explanation(topic, difficulty)
 
-### Prevention Strategies
-- Break one of the four conditions
-- Use timeouts for lock acquisition
-- Implement resource ordering
-- Use deadlock detection algorithms
-
-### Summary
-Understanding deadlock is crucial for writing safe multithreaded applications. Prevention is better than detection.""",
-            "Hard": f"""## Deadlock in Operating System - Advanced Analysis (Hard Level)
-
-### I. Comprehensive Formal Definition
-
-Deadlock is a situation in concurrent systems where a finite set of processes is blocked indefinitely. Each process holds at least one resource and waits for additional resources held by other processes in the set. This creates a situation where no process can proceed, and the system reaches a state of complete stagnation.
-
-In technical terms, a deadlock state can be formally represented by:
-- A set of processes: P1, P2, P3, ..., Pn
-- A set of resources: R1, R2, R3, ..., Rm  
-- A situation where each process Pi is waiting for a resource held by another process Pj in the same set
-- No process outside this set can break the chain to help resolve the deadlock
-
-From a graph perspective, deadlock corresponds to a cycle in the resource allocation graph where both processes and resources form a closed loop of dependencies.
-
-
-### II. Coffman's Four Necessary Conditions for Deadlock
-
-For deadlock to occur, ALL four conditions must be true simultaneously. If even one condition is false, deadlock cannot happen. These are known as the Coffman Conditions:
-
-**Condition 1: Mutual Exclusion**
-- A resource cannot be shared among multiple processes at the same time
-- Only one process can use a resource at any given moment
-- When one process uses the resource, all other processes must wait
-- Example: A printer can only print one job at a time. If Process A is printing, Process B must wait.
-- This is fundamental to how operating systems protect critical resources
-
-**Condition 2: Hold and Wait**
-- A process can hold some resources while waiting for other resources
-- Once a process acquires a resource, it holds onto it while requesting additional resources
-- The process does not release what it has until it gets what it needs
-- Example: Thread A locks Mutex 1, then tries to acquire Mutex 2. While waiting for Mutex 2, Thread A still holds Mutex 1.
-- This condition enables the circular dependencies that lead to deadlock
-
-**Condition 3: No Preemption**
-- Resources cannot be forcibly taken away from a process
-- A resource is released only when the process voluntarily releases it
-- The operating system cannot interrupt or steal resources from a process
-- Example: If Thread A is holding a critical section lock, the OS cannot force Thread A to release it, even if another thread needs it urgently
-- This prevents the OS from solving resource conflicts by force
-
-**Condition 4: Circular Wait**
-- A circular chain of processes exists where each process waits for a resource held by the next process
-- Process 1 waits for a resource held by Process 2
-- Process 2 waits for a resource held by Process 3
-- ... and so on ...
-- Process N waits for a resource held by Process 1, completing the cycle
-- Example: P1 waits for R1 (held by P2), P2 waits for R2 (held by P1) - This forms a cycle
-
-
-### III. Resource Allocation Graph (RAG) Modeling
-
-The Resource Allocation Graph is a visual representation of the system state:
-
-**Components of RAG:**
-- **Process Nodes**: Represented as circles (P1, P2, P3, etc.)
-- **Resource Nodes**: Represented as squares (R1, R2, R3, etc.)
-- **Request Edges**: Arrow from process to resource (Process requests a resource)
-- **Assignment Edges**: Arrow from resource to process (Resource is allocated to process)
-
-**How to Detect Deadlock with RAG:**
-- If the RAG contains a cycle, deadlock may exist
-- For single-instance resources: A cycle definitely means deadlock
-- For multiple-instance resources: A cycle is a warning sign but requires more analysis
-
-**Practical Example:**
-```
-Process P1 holds Resource R1, requests Resource R2
-Process P2 holds Resource R2, requests Resource R1
-
-Visual representation:
-P1 --holds--> R1
-R1 <--requests-- P1
-
-P2 --holds--> R2
-R2 <--requests-- P2
-
-This forms a cycle: P1 -> R2 -> P2 -> R1 -> P1
-Result: DEADLOCK!
-```
-
-
-### IV. Deadlock Prevention - Breaking the Conditions
-
-Prevention is the most direct approach. To prevent deadlock, eliminate at least ONE of the four Coffman conditions:
-
-**Strategy 1: Break Mutual Exclusion**
-- Make resources shareable whenever possible
-- Use read-write locks for shared data (multiple readers, one writer)
-- Create virtual resources (like spoolers for printers)
-- Limitation: Not all resources can be shared (e.g., database records being modified)
-
-**Strategy 2: Break Hold and Wait**
-- Option A: Request all resources at once
-  - Process must request all needed resources before starting execution
-  - If not all available, process waits without holding any resources
-  - Problem: Low resource utilization, processes wait longer
-  
-- Option B: Request one resource at a time
-  - Process can only request one resource at a time
-  - Must release current resource before requesting another
-  - Problem: Complex to implement, potential for starvation
+def _stream_explanation(topic: str, difficulty: str):
+    """Yield cleaned explanation chunks as Gemini generates them"""
+    stored = explanation_store.get(topic, difficulty) or _similar_explanation(topic, difficulty)
+    if stored is not None:
+        yield stored
+        return
+    emitted = False
+    try:
+        if not get_model():
+            record_fallback("explain_stream", "no_model")
+            yield generate_mock_explanation(topic, difficulty)
+            return
+
+        prompt, max_tokens = _explanation_prompt(topic, difficulty)
+        generation_config = {"max_output_tokens": max_tokens}
+        key = _route_key("explain", prompt, generation_config, difficulty)
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield clean_response(cached)
+            return
+
+        # A stream cannot switch models midway, so the ladder is only walked
+        # until one model starts answering
+        for model_name in router.ladder(router.tier_for("explain", difficulty)):
+            cleaner = StreamCleaner()
+            parts = []
+            started = time.perf_counter()
+            chunk = None  # the last chunk carries usage_metadata
+            try:
+                stream = router.model(model_name).generate_content(
+                    prompt, generation_config=generation_config, stream=True,
+                    request_options=_request_options("explain_stream", difficulty),
+                )
+                for chunk in stream:
+                    text = _chunk_text(chunk)
+                    parts.append(text)
+                    cleaned = cleaner.feed(text)
+                    if cleaned:
+                        emitted = True
+                        yield cleaned
+            except Exception as e:
+                _model_failed("explain_stream", model_name, started, e)
+                if _try_next(e) and not emitted:
+                    continue
+                raise
+            break
+        else:
+            raise RuntimeError("No Gemini model answered")
+        tail = cleaner.flush()
+        if tail:
+            yield tail
+        text = "".join(parts)
+        _model_succeeded("explain_stream", model_name, started, prompt, chunk, text, difficulty)
+        response_cache.set(key, text)
+        _remember_explanation(topic, difficulty, prompt, generation_config)
+    except Exception as e:
+        print(f"API Error: {e}")
+        # Only fall back if nothing was sent yet; a partial answer is kept as-is
+        if not emitted:
+            record_fallback("explain_stream", _fallback_reason(e))
+            yield generate_mock_explanation(topic, difficulty)
 
-**Strategy 3: Break No Preemption**
-- Allow the OS to take resources away from processes
-- Save the process state for later restoration
-- Works well for CPU and memory resources
-- Problem: Not practical for I/O devices like printers or databases
-- Implementation: Checkpointing and rollback mechanisms
-
-**Strategy 4: Break Circular Wait**
-- Impose a strict ordering on all resources
-- All processes must request resources in the same predetermined order
-- Example: Always request resources in order R1, then R2, then R3
-- Never go backward in the ordering
-- Effectiveness: Very effective if all processes follow the ordering
-- Challenge: Requires careful system design and programmer discipline
-
-
-### V. Deadlock Avoidance - Banker's Algorithm
-
-The Banker's Algorithm is a famous strategy that prevents deadlock by ensuring the system never enters an unsafe state.
-
-**Core Concept:**
-- Before granting a resource request, check if it would lead to a safe state
-- A safe state is one where all processes can eventually complete
-- Only grant requests that maintain safety
-- Deny requests that would create unsafe states
-
-**Data Structures:**
-- Available: How many resources are currently free
-- Maximum: Maximum resources each process claims it will need
-- Allocated: Resources currently allocated to each process
-- Need: Remaining resources each process needs (Maximum - Allocated)
-
-**Safety Algorithm:**
-1. Check if granting the resource would make the system safe
-2. Simulate releasing resources from completed processes
-3. Check if all processes can eventually finish
-4. If yes, grant the resource; if no, deny it
-
-**Advantages:**
-- Guarantees no deadlock will occur
-- Better resource utilization than prevention
-
-**Disadvantages:**
-- Requires knowing maximum resource needs in advance
-- High computational overhead (checking safety for each request)
-- Not practical for systems with dynamic resource requirements
-
-
-### VI. Deadlock Detection and Recovery
-
-Instead of preventing deadlock, detect it when it occurs and recover from it.
-
-**Detection Mechanisms:**
-
-1. **Periodic Checking**: Check for deadlock at regular intervals
-   - Run cycle detection on the resource allocation graph
-   - Balance between detection latency and overhead
-
-2. **Wait-for Graph Method**:
-   - Simplified version of the resource allocation graph
-   - Contains only processes, not resources
-   - Process Pi -> Process Pj if Pi waits for a resource held by Pj
-   - If a cycle exists in this graph, deadlock is present
-
-3. **Resource Allocation Graph Reduction**:
-   - Try to remove processes and resources from the graph
-   - If the graph becomes empty, no deadlock exists
-   - If processes remain, those processes are deadlocked
-
-**Recovery Strategies:**
-
-1. **Process Termination** (Most Common)
-   - Abort the deadlocked processes
-   - Option A: Abort all deadlocked processes at once (harsh but simple)
-   - Option B: Abort processes one at a time until deadlock is broken
-   - Considerations: Which process to abort? Priority? Loss of work?
-
-2. **Resource Preemption**:
-   - Take resources away from some processes
-   - Reassign resources to other processes
-   - Save state and rollback if needed
-   - Problem: May cause loss of work, rollback overhead
-
-3. **Combination Approach**:
-   - Terminate low-priority processes
-   - Preempt resources from non-critical operations
-   - Minimize system impact and loss of work
-
-**Recovery Challenges:**
-- Which process(es) to sacrifice?
-- How to handle partially completed work?
-- How to restore system consistency?
-- How to prevent repeated deadlock?
-
-
-### VII. Real-World Examples
-
-**Example 1: Database Transaction Deadlock**
-```
-Transaction A:
-1. Lock Table Customers
-2. Wait for Lock on Table Orders
-
-Transaction B:
-1. Lock Table Orders
-2. Wait for Lock on Table Customers
-
-Result: Both transactions are blocked, database detects and rolls back one transaction
-```
-
-**Example 2: Multithreaded Java Program**
-```
-Thread 1: lock(Account A) -> then try to lock(Account B)
-Thread 2: lock(Account B) -> then try to lock(Account A)
-
-Scenario:
-- Thread 1 gets lock on Account A
-- Thread 2 gets lock on Account B
-- Thread 1 waits for lock on Account B (held by Thread 2)
-- Thread 2 waits for lock on Account A (held by Thread 1)
--> DEADLOCK!
-
-Solution: Always lock accounts in the same order (by ID)
-```
-
-**Example 3: Network Communication Deadlock**
-```
-Process A: Send message to B, wait for reply
-Process B: Send message to A, wait for reply
-Problem: Both are waiting for messages, none are being processed
-Result: System hangs until timeout occurs
-```
-
-
-### VIII. Comparison of Deadlock Handling Strategies
-
-**Prevention:**
-- Pros: Guarantees no deadlock, simple to reason about
-- Cons: Low resource utilization, high overhead
-- Best for: Systems requiring absolute reliability
-
-**Avoidance (Banker's Algorithm):**
-- Pros: Better utilization than prevention, still guarantees safety
-- Cons: High computational cost, needs advance knowledge of needs
-- Best for: Systems with known resource requirements
-
-**Detection and Recovery:**
-- Pros: Allows higher resource utilization
-- Cons: System must deal with deadlock after it occurs
-- Best for: Systems where deadlock is rare
-
-**Timeout-Based:**
-- Pros: Simple to implement, works in distributed systems
-- Cons: May not be reliable, recovery requires care
-- Best for: Distributed systems where detection is difficult
-
-
-### IX. Modern Approaches and Best Practices
-
-**Modern Strategies:**
-1. **Lock-Free Programming**: Use atomic operations instead of locks
-2. **Resource Pooling**: Pre-allocate resources to avoid complex dependencies
-3. **Timeout Mechanisms**: Set maximum wait times for resource acquisition
-4. **Graph Monitoring**: Real-time monitoring of resource allocation graphs
-5. **Machine Learning**: Predict and prevent deadlocks before they occur
-
-**Best Practices for Developers:**
-1. Use consistent resource ordering across all code
-2. Always acquire locks in the same order
-3. Hold locks for the minimum time necessary
-4. Use try-lock with timeout instead of indefinite blocking
-5. Design APIs that encourage safe patterns
-6. Test thoroughly with concurrent scenarios
-7. Use tools that detect potential deadlock conditions
-8. Document resource acquisition order in code
-9. Consider lock-free data structures when possible
-10. Monitor and log resource usage in production
-
-**Common Pitfalls to Avoid:**
-- Nested locks in different orders
-- Holding locks during I/O operations
-- Recursive lock acquisition without careful handling
-- Assuming deadlock won't happen in your code
-- Ignoring compiler warnings about potential issues
-
-
-### X. Summary and Key Takeaways
-
-**Core Understanding:**
-- Deadlock is a serious problem that must be addressed in system design
-- It requires all four Coffman conditions to exist simultaneously
-- Eliminating any one condition prevents deadlock
-
-**Strategy Selection:**
-- Prevention: Best for safety-critical systems
-- Avoidance: Good balance but requires planning
-- Detection: Practical when deadlock is unlikely
-- Timeout: Simple for distributed systems
-
-**Implementation Advice:**
-- Choose one primary strategy based on your system needs
-- Combine strategies for robustness
-- Test thoroughly before deployment
-- Monitor in production for unexpected deadlocks
-- Be prepared with recovery procedures
-
-**Fundamental Truth:**
-Deadlock management is essential for building reliable concurrent systems. Understanding these mechanisms deeply is crucial for advanced systems programming and helps you write code that is both efficient and safe. The best approach is to prevent deadlock through careful design rather than trying to recover from it after it occurs."""
-        },
-        "class in java": {
-            "Easy": "A class in Java is like a blueprint or template. Just like a cookie cutter creates many cookies of the same shape, a class defines the structure that objects will have. Classes contain properties (data) and methods (actions).",
-            "Medium": "A class is a template for creating objects. It defines attributes (variables) and methods (functions) that describe what an object is and what it can do. Objects are instances created from the class blueprint.",
-            "Hard": "A class is a user-defined data type that serves as a blueprint for object instantiation. It encapsulates data members (attributes) and member functions (methods), providing abstraction through access modifiers. Classes support inheritance, allowing code reuse through hierarchical relationships, and polymorphism through method overriding."
-        }
-    }
-    
-    topic_lower = topic.lower()
-    
-    # Find matching explanation
-    for key in explanations:
-        if key in topic_lower:
-            level_explanations = explanations[key]
-            return level_explanations.get(difficulty, level_explanations.get("Medium", f"Explanation for {topic} at {difficulty} level"))
+async def _stream_model_async(prompt: str, generation_config, difficulty: str, out: asyncio.Queue):
+    """Stream an explanation down the router's ladder into `out` as cleaned chunks, then None.
+
+    Holds one scheduler slot while the model streams; returns the raw text.
+    """
+    emitted = False
+    try:
+        async with scheduler.slot(PRIORITY_INTERACTIVE, _call_tokens(prompt, generation_config)):
+            for model_name in router.ladder(router.tier_for("explain", difficulty)):
+                cleaner = StreamCleaner()
+                parts = []
+                started = time.perf_counter()
+                chunk = None
+                try:
+                    response = await router.model(model_name).generate_content_async(
+                        prompt, generation_config=generation_config, stream=True,
+                        request_options=_request_options("explain_stream", difficulty),
+                    )
+                    async for chunk in response:
+                        text = _chunk_text(chunk)
+                        parts.append(text)
+                        cleaned = cleaner.feed(text)
+                        if cleaned:
+                            emitted = True
+                            out.put_nowait(cleaned)
+                except Exception as e:
+                    _model_failed("explain_stream", model_name, started, e)
+                    if _try_next(e) and not emitted:
+                        continue
+                    raise
+                break
+            else:
+                raise RuntimeError("No Gemini model answered")
+        tail = cleaner.flush()
+        if tail:
+            out.put_nowait(tail)
+        text = "".join(parts)
+        _model_succeeded("explain_stream", model_name, started, prompt, chunk, text, difficulty)
+        return text
+    finally:
+        out.put_nowait(None)
+
+async def stream_explanation_async(topic: str, difficulty: str):
+    """Async generator of cleaned explanation chunks, for the SSE endpoint"""
+    stored = explanation_store.get(topic, difficulty) or await _similar_explanation_async(topic, difficulty)
+    if stored is not None:
+        yield stored
+        return
+    emitted = False
+    try:
+        if not await get_model_async():
+            record_fallback("explain_stream", "no_model")
+            yield generate_mock_explanation(topic, difficulty)
+            return
+
+        prompt, max_tokens = _explanation_prompt(topic, difficulty)
+        generation_config = {"max_output_tokens": max_tokens}
+        key = _route_key("explain", prompt, generation_config, difficulty)
+        cached = await response_cache.get_async(key)
+        if cached is not None:
+            yield clean_response(cached)
+            return
+
+        # The model streams into a buffer from its own task, so the scheduler
+        # slot is given back as soon as the model is done, however slowly the
+        # client reads
+        chunks = asyncio.Queue()
+        producer = asyncio.ensure_future(_stream_model_async(prompt, generation_config, difficulty, chunks))
+        try:
+            while (cleaned := await chunks.get()) is not None:
+                emitted = True
+                yield cleaned
+            text = await producer
+        finally:
+            producer.cancel()
+        await response_cache.set_async(key, text)
+        _remember_explanation(topic, difficulty, prompt, generation_config)
+    except Exception as e:
+        print(f"API Error: {e}")
+        if not emitted:
+            record_fallback("explain_stream", _fallback_reason(e))
+            yield generate_mock_explanation(topic, difficulty)
+
+async def get_explanation_job_async(topic: str, difficulty: str, progress):
+    """Explanation for a background job: streamed, with progress(fraction, message) as tokens arrive"""
+    _, max_tokens = _explanation_prompt(topic, difficulty)
+    parts = []
+    received = 0
+    progress(0.0, "Generating explanation")
+    async for chunk in stream_explanation_async(topic, difficulty):
+        parts.append(chunk)
+        received += count_tokens(chunk)
+        progress(min(0.95, received / max_tokens), f"{received} tokens generated")
+    return "".join(parts)
+
+def generate_mock_explanation(topic: str, difficulty: str):
+    """Generate a mock explanation"""
+    # Pre-generated syllabus content (see app.warmup), at the nearest stored level
+    stored = explanation_store.get_any(topic, difficulty)
+    if stored is not None:
+        return stored
+
+    # Offline corpus (app/data/fallback_explanations.jsonl), indexed by topic alias
+    explanation = fallback_corpus.get(topic, difficulty)
+    if explanation is not None:
+        return explanation
     
     # Default fallback
     return f"## {topic} ({difficulty} Level)\n\nThis is an explanation of {topic} at {difficulty} difficulty level. To get the best learning experience, please ensure your API key has access to Gemini models, or try a different topic."
 
+# Long documents are summarized map-reduce style: each chunk of at most
+# SUMMARY_CHUNK_TOKENS is summarized on its own (at most SUMMARY_MAP_CONCURRENCY
+# at once), then the partial summaries are merged level by level (each level
+# merging the one below, never re-summarizing it) until they fit in a single
+# prompt. Every call goes through the response cache, so a document
+# that was already summarized costs no model calls.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 3000))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 8))
+
+def _summary_prompt(text: str):
+    """Build the summary prompt"""
+    # Shortened prompt for faster response
+    return f"""Summarize this in 3-4 bullet points with key terms highlighted:
+
+{text}"""
+
+def _map_summary_prompt(chunk: str):
+    """Prompt for summarizing one section of a longer document"""
+    return f"""Summarize this section of a longer document in 3-5 concise bullet points.
+Keep important terms, names, definitions and numbers.
+
+{chunk}"""
+
+def _reduce_summary_prompt(summaries: str):
+    """Prompt for merging partial summaries into fewer, broader points"""
+    return f"""These are summaries of consecutive sections of one document.
+Merge them into 4-6 concise bullet points, keeping the most important terms.
+
+{summaries}"""
+
+def _reduce_groups(summaries):
+    """Group partial summaries so each group fits in one prompt"""
+    return split_into_chunks("\n\n".join(summaries), SUMMARY_CHUNK_TOKENS)
+
 def get_summary(text: str):
     """Generate a real-time summary using Gemini API or fallback"""
     try:
-        if not model:
+        if not get_model():
+            record_fallback("summary", "no_model")
             return generate_mock_summary(text)
-            
-        # Shortened prompt for faster response
-        prompt = f"""Summarize this in 3-4 bullet points with key terms highlighted:
 
-{text[:1000]}"""  # Limit input to first 1000 chars
-        
-        response = model.generate_content(prompt, generation_config=genai.types.GenerationConfig(max_output_tokens=300))
-        return response.text
+        chunks = split_into_chunks(text, SUMMARY_CHUNK_TOKENS) or [text]
+        if len(chunks) > 1:
+            summaries = [
+                _generate("summary_map", _map_summary_prompt(chunk), {"max_output_tokens": 300})
+                for chunk in chunks
+            ]
+            groups = _reduce_groups(summaries)
+            # Until they fit in one prompt (or merging would not shrink them any further)
+            while 1 < len(groups) < len(summaries):
+                summaries = [
+                    _generate("summary_reduce", _reduce_summary_prompt(group), {"max_output_tokens": 400})
+                    for group in groups
+                ]
+                groups = _reduce_groups(summaries)
+            chunks = ["\n\n".join(groups)]
+        return _generate("summary", _summary_prompt(chunks[0]), {"max_output_tokens": 300})
     except Exception as e:
         print(f"API Error: {e}")
+        record_fallback("summary", _fallback_reason(e))
         return generate_mock_summary(text)
 
+async def _summarize_all_async(endpoint: str, prompts, max_tokens: int, on_done=None):
+    """Run summary prompts concurrently under the map concurrency limit.
+
+    Returns (summaries, failed): failed calls are dropped and counted as long
+    as at least one succeeds, and a caller must not treat the result as
+    covering the whole document unless failed is 0. on_done(count) is called
+    with the number of prompts finished so far.
+    """
+    limit = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+    finished = 0
+
+    async def run(prompt):
+        nonlocal finished
+        async with limit:
+            try:
+                return await _generate_async(endpoint, prompt, {"max_output_tokens": max_tokens}, PRIORITY_DEFAULT)
+            finally:
+                finished += 1
+                if on_done is not None:
+                    on_done(finished)
+
+    results = await asyncio.gather(*(run(prompt) for prompt in prompts), return_exceptions=True)
+    summaries = [result for result in results if not isinstance(result, BaseException)]
+    if not summaries:
+        raise results[0]
+    return summaries, len(results) - len(summaries)
+
+async def get_summary_async(text: str, progress=None, with_complete: bool = False):
+    """Async variant of get_summary; map and reduce calls run concurrently.
+
+    progress(fraction, message), if given, is told how far the summary has got.
+    With with_complete, returns (summary, complete), complete being False for
+    the mock summary and for a summary missing sections whose calls failed.
+    """
+    progress = progress or (lambda fraction, message=None: None)
+    summary, complete = await _summary_async(text, progress)
+    return (summary, complete) if with_complete else summary
+
+async def _summary_async(text: str, progress):
+    try:
+        if not await get_model_async():
+            record_fallback("summary", "no_model")
+            return generate_mock_summary(text), False
+
+        chunks = split_into_chunks(text, SUMMARY_CHUNK_TOKENS) or [text]
+        failed = 0
+        if len(chunks) > 1:
+            total = len(chunks)
+            summaries, failed = await _summarize_all_async(
+                "summary_map", [_map_summary_prompt(chunk) for chunk in chunks], 300,
+                lambda done: progress(0.9 * done / total, f"Summarized {done} of {total} sections"),
+            )
+            groups = _reduce_groups(summaries)
+            # Until they fit in one prompt (or merging would not shrink them any further)
+            while 1 < len(groups) < len(summaries):
+                progress(0.9, "Merging section summaries")
+                summaries, failed_groups = await _summarize_all_async(
+                    "summary_reduce", [_reduce_summary_prompt(group) for group in groups], 400
+                )
+                failed += failed_groups
+                groups = _reduce_groups(summaries)
+            chunks = ["\n\n".join(groups)]
+            if failed:
+                print(f"Warning: Summary is missing sections: {failed} summary call(s) failed")
+        progress(0.9, "Writing the summary")
+        summary = await _generate_async("summary", _summary_prompt(chunks[0]), {"max_output_tokens": 300})
+        return summary, not failed
+    except Exception as e:
+        print(f"API Error: {e}")
+        record_fallback("summary", _fallback_reason(e))
+        return generate_mock_summary(text), False
+
 def generate_mock_summary(text: str):
     """Generate a mock summary"""
     return f"""## Summary
@@ -587,32 +839,56 @@ Based on your input of {len(text)} characters, the material covers important con
 ### Next Steps
 Review the key points, test your understanding, and practice applying these concepts to solidify your learning."""
 
+def _quiz_prompt(material: str, num_q: int):
+    """Build the quiz prompt"""
+    return f"""Create {num_q} multiple-choice questions based on this:
+
+{select_context(material, None, QUIZ_INPUT_TOKENS)}
+
+Answer with a JSON array. Each question is an object with "question", "options"
+(an object with keys "A", "B", "C" and "D") and "correct_answer" (one of A/B/C/D)."""
+
+def _quiz_config(num_q: int):
+    """JSON response mode, sized so the requested questions fit"""
+    return {
+        "max_output_tokens": output_tokens("quiz", num_q),
+        "response_mime_type": "application/json",
+        "response_schema": QUIZ_SCHEMA,
+    }
+
 def get_quiz(material: str, num_questions: int):
     """Generate real-time quiz questions using Gemini API or fallback"""
     try:
-        if not model:
+        if not get_model():
+            record_fallback("quiz", "no_model")
             return generate_mock_quiz(material, num_questions)
         
         # Limit questions to 3-5 for speed
         num_q = min(num_questions, 5)
         
-        prompt = f"""Create {num_q} multiple-choice questions based on this:
-
-{material[:500]}
-
-Format each as:
-Q1: [question]
-A) [option] B) [option] C) [option] D) [option]
-Ans: [A/B/C/D]"""
-        
-        response = model.generate_content(prompt, generation_config=genai.types.GenerationConfig(max_output_tokens=400))
-        text = response.text
+        text = _generate("quiz", _quiz_prompt(material, num_q), _quiz_config(num_q))
         
         # Parse the response into structured questions
         questions = parse_quiz_response(text, num_q)
         return questions
     except Exception as e:
         print(f"API Error: {e}")
+        record_fallback("quiz", _fallback_reason(e))
+        return generate_mock_quiz(material, num_questions)
+
+async def get_quiz_async(material: str, num_questions: int, priority: int = PRIORITY_INTERACTIVE):
+    """Async variant of get_quiz"""
+    try:
+        if not await get_model_async():
+            record_fallback("quiz", "no_model")
+            return generate_mock_quiz(material, num_questions)
+
+        num_q = min(num_questions, 5)
+        text = await _generate_async("quiz", _quiz_prompt(material, num_q), _quiz_config(num_q), priority)
+        return parse_quiz_response(text, num_q)
+    except Exception as e:
+        print(f"API Error: {e}")
+        record_fallback("quiz", _fallback_reason(e))
         return generate_mock_quiz(material, num_questions)
 
 def generate_mock_quiz(material: str, num_questions: int):
@@ -654,76 +930,41 @@ def generate_mock_quiz(material: str, num_questions: int):
 
 def parse_quiz_response(response_text: str, num_questions: int):
     """Parse Gemini's quiz response into structured format"""
-    questions = []
-    
     try:
-        # Split by question
-        question_blocks = response_text.split("Question ")
-        
-        for block in question_blocks[1:]:  # Skip first empty split
-            lines = block.strip().split('\n')
-            if len(lines) < 5:
-                continue
-            
-            # Extract question text
-            question_line = lines[0].split(':', 1)
-            if len(question_line) < 2:
-                continue
-            question_text = question_line[1].strip()
-            
-            # Extract options
-            options = {}
-            correct_answer = None
-            
-            for line in lines[1:]:
-                line = line.strip()
-                if line.startswith('A)') or line.startswith('A )'):
-                    options['A'] = line[2:].strip()
-                elif line.startswith('B)') or line.startswith('B )'):
-                    options['B'] = line[2:].strip()
-                elif line.startswith('C)') or line.startswith('C )'):
-                    options['C'] = line[2:].strip()
-                elif line.startswith('D)') or line.startswith('D )'):
-                    options['D'] = line[2:].strip()
-                elif 'Correct Answer:' in line:
-                    correct_answer = line.split(':')[1].strip().upper()
-            
-            # Only add if we have all parts
-            if question_text and len(options) == 4 and correct_answer:
-                questions.append({
-                    "question": question_text,
-                    "options": options,
-                    "correct_answer": correct_answer
-                })
-        
-        # If parsing failed, return empty with message
-        if not questions:
-            # Fallback: create generic questions
-            for i in range(1, num_questions + 1):
-                questions.append({
-                    "question": f"Question {i}: What is a key point from the material?",
-                    "options": {
-                        "A": "Option A",
-                        "B": "Option B",
-                        "C": "Option C",
-                        "D": "Option D"
-                    },
-                    "correct_answer": "A"
-                })
-        
-        return questions[:num_questions]
+        with postprocess_seconds.time("parse_quiz"):
+            questions = parse_quiz(response_text, num_questions)
     except Exception as e:
         print(f"Error parsing quiz: {e}")
         return []
 
-def get_flashcards(topic: str, num_cards: int):
-    """Generate real-time flashcards using Gemini API or fallback"""
-    try:
-        if not model:
-            return generate_mock_flashcards(topic, num_cards)
-            
-        prompt = f"""Create {num_cards} study flashcards about '{topic}'.
+    # If parsing failed, fall back to generic questions
+    if not questions:
+        print("Quiz response could not be parsed, using placeholder questions")
+        record_fallback("quiz", "parse_error")
+        for i in range(1, num_questions + 1):
+            questions.append({
+                "question": f"Question {i}: What is a key point from the material?",
+                "options": {
+                    "A": "Option A",
+                    "B": "Option B",
+                    "C": "Option C",
+                    "D": "Option D"
+                },
+                "correct_answer": "A"
+            })
+    return questions
 
+def _flashcards_prompt(topic: str, num_cards: int, material: str = None):
+    """Build the flashcards prompt, grounded in `material` if given"""
+    source = ""
+    if material:
+        source = f"""
+Base the flashcards on this material:
+
+{select_context(material, topic, QUIZ_INPUT_TOKENS)}
+"""
+    return f"""Create {num_cards} study flashcards about '{topic}'.
+{source}
 Format EXACTLY like this:
 Card 1
 Front: [Question or concept]
@@ -736,17 +977,51 @@ Back: [Answer or explanation]
 (repeat for all {num_cards} cards)
 
 Make the flashcards educational and focused on key concepts."""
-        
-        response = model.generate_content(prompt)
-        text = response.text
+
+def get_flashcards(topic: str, num_cards: int, material: str = None):
+    """Generate real-time flashcards using Gemini API or fallback"""
+    try:
+        if not get_model():
+            record_fallback("flashcards", "no_model")
+            return generate_mock_flashcards(topic, num_cards)
+
+        text = _generate(
+            "flashcards", _flashcards_prompt(topic, num_cards, material), {"max_output_tokens": output_tokens("flashcards", num_cards)}
+        )
         
         # Parse the response into structured flashcards
-        flashcards = parse_flashcards_response(text, num_cards)
+        with postprocess_seconds.time("parse_flashcards"):
+            flashcards = parse_flashcards_response(text, num_cards)
         return flashcards
     except Exception as e:
         print(f"API Error: {e}")
+        record_fallback("flashcards", _fallback_reason(e))
         return generate_mock_flashcards(topic, num_cards)
 
+async def get_flashcards_async(topic: str, num_cards: int, priority: int = PRIORITY_INTERACTIVE, material: str = None,
+                               with_fallback: bool = False):
+    """Async variant of get_flashcards.
+
+    With with_fallback, returns (flashcards, fallback), fallback being True
+    for the mock cards served when the model is unavailable or failed.
+    """
+    try:
+        if not await get_model_async():
+            record_fallback("flashcards", "no_model")
+            flashcards, fallback = generate_mock_flashcards(topic, num_cards), True
+        else:
+            text = await _generate_async(
+                "flashcards", _flashcards_prompt(topic, num_cards, material),
+                {"max_output_tokens": output_tokens("flashcards", num_cards)}, priority,
+            )
+            with postprocess_seconds.time("parse_flashcards"):
+                flashcards, fallback = parse_flashcards_response(text, num_cards), False
+    except Exception as e:
+        print(f"API Error: {e}")
+        record_fallback("flashcards", _fallback_reason(e))
+        flashcards, fallback = generate_mock_flashcards(topic, num_cards), True
+    return (flashcards, fallback) if with_fallback else flashcards
+
 def generate_mock_flashcards(topic: str, num_cards: int):
     """Generate mock flashcards"""
     flashcards = []
@@ -819,3 +1094,175 @@ def parse_flashcards_response(response_text: str, num_cards: int):
         print(f"Error parsing flashcards: {e}")
         return []
 
+# --- Batch generation ---
+# Batches fan out with at most BATCH_CONCURRENCY generations at a time. Small
+# requests are packed BATCH_PACK_SIZE to a prompt and split apart again by their
+# "=== Topic N ===" headers; anything missing from a packed answer is retried
+# on its own.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", 5))
+BATCH_PACK_MAX_ITEMS = 5  # cards/questions per item for it to be packable
+BATCH_PACK_MAX_MATERIAL = 150  # tokens of quiz material for it to be packable
+
+_SECTION_HEADER = re.compile(r"^\s*=+\s*(?:Topic|Material)\s+(\d+)\s*=+\s*$", re.MULTILINE | re.IGNORECASE)
+
+def _split_packed_response(text: str):
+    """Map section number -> section text for a packed response"""
+    sections = {}
+    matches = list(_SECTION_HEADER.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections[int(match.group(1))] = text[match.end():end]
+    return sections
+
+def _packed_flashcards_prompt(items):
+    topics = "\n".join(
+        f"Topic {n}: '{topic}' ({num_cards} cards)" for n, (topic, num_cards) in enumerate(items, 1)
+    )
+    return f"""Create study flashcards for each of these topics:
+
+{topics}
+
+Start each topic with its header line and format its cards EXACTLY like this:
+=== Topic 1 ===
+Card 1
+Front: [Question or concept]
+Back: [Answer or explanation]
+
+Card 2
+Front: [Question or concept]
+Back: [Answer or explanation]
+
+Make the flashcards educational and focused on key concepts."""
+
+def _packed_quiz_prompt(items):
+    materials = "\n\n".join(
+        f"=== Material {n} === ({num_q} questions)\n{material}" for n, (material, num_q) in enumerate(items, 1)
+    )
+    return f"""Create multiple-choice questions for each of these materials:
+
+{materials}
+
+Start each material's questions with its header line, formatted like this:
+=== Material 1 ===
+Q1: [question]
+A) [option] B) [option] C) [option] D) [option]
+Ans: [A/B/C/D]"""
+
+def _pack(items, packable):
+    """Split (index, item) pairs into packs of small items and single large ones"""
+    packs, singles, current = [], [], []
+    for index, item in items:
+        if not packable(item):
+            singles.append((index, item))
+            continue
+        current.append((index, item))
+        if len(current) == BATCH_PACK_SIZE:
+            packs.append(current)
+            current = []
+    if len(current) > 1:
+        packs.append(current)
+    else:
+        singles.extend(current)
+    return packs, singles
+
+async def _run_batch(items, packable, run_pack, run_single):
+    """Yield (index, result) for every item as soon as it is ready"""
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    packs, singles = _pack(list(enumerate(items)), packable)
+
+    async def single(index, item):
+        async with limit:
+            return [(index, await run_single(item))]
+
+    async def pack(entries):
+        async with limit:
+            try:
+                results = await run_pack([item for _, item in entries])
+            except Exception as e:
+                print(f"API Error: {e}")
+                results = [None] * len(entries)
+        done = [(index, result) for (index, _), result in zip(entries, results) if result]
+        retry = [(index, item) for (index, item), result in zip(entries, results) if not result]
+        for index, item in retry:
+            done.extend(await single(index, item))
+        return done
+
+    tasks = [asyncio.ensure_future(pack(entries)) for entries in packs]
+    tasks += [asyncio.ensure_future(single(index, item)) for index, item in singles]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            for index, result in await finished:
+                yield index, result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _flashcards_pack(items):
+    text = await _generate_async(
+        "flashcards_batch",
+        _packed_flashcards_prompt(items),
+        {"max_output_tokens": sum(output_tokens("flashcards", num_cards) for _, num_cards in items)},
+        PRIORITY_BATCH,
+    )
+    sections = _split_packed_response(text)
+    return [
+        parse_flashcards_response(sections[n], num_cards) if n in sections else None
+        for n, (_, num_cards) in enumerate(items, 1)
+    ]
+
+async def _quiz_pack(items):
+    text = await _generate_async(
+        "quiz_batch",
+        _packed_quiz_prompt(items),
+        {"max_output_tokens": sum(output_tokens("quiz", num_q) for _, num_q in items)},
+        PRIORITY_BATCH,
+    )
+    sections = _split_packed_response(text)
+    # Packed answers stay in the text format (JSON mode has no section headers);
+    # anything that does not parse is retried on its own
+    return [
+        parse_quiz(sections[n], num_q) or None if n in sections else None
+        for n, (_, num_q) in enumerate(items, 1)
+    ]
+
+async def get_flashcards_batch_async(items, with_fallback: bool = False):
+    """Generate flashcards for many (topic, num_cards[, material]) items; yields (index, flashcards),
+    or (index, flashcards, fallback) with with_fallback (see get_flashcards_async)"""
+    if not await get_model_async():
+        for index, (topic, num_cards, *_) in enumerate(items):
+            record_fallback("flashcards_batch", "no_model")
+            flashcards = generate_mock_flashcards(topic, num_cards)
+            yield (index, flashcards, True) if with_fallback else (index, flashcards)
+        return
+
+    async def run_pack(pack):
+        # A pack never falls back: sections it missed are retried one by one
+        return [(flashcards, False) if flashcards else None for flashcards in await _flashcards_pack(pack)]
+
+    async for index, (flashcards, fallback) in _run_batch(
+        items,
+        # Cards grounded in a document get their own prompt with its passages
+        lambda item: item[1] <= BATCH_PACK_MAX_ITEMS and len(item) == 2,
+        run_pack,
+        lambda item: get_flashcards_async(item[0], item[1], PRIORITY_BATCH, *item[2:], with_fallback=True),
+    ):
+        yield (index, flashcards, fallback) if with_fallback else (index, flashcards)
+
+async def get_quiz_batch_async(items):
+    """Generate quizzes for many (material, num_questions) pairs; yields (index, questions)"""
+    if not await get_model_async():
+        for index, (material, num_questions) in enumerate(items):
+            record_fallback("quiz_batch", "no_model")
+            yield index, generate_mock_quiz(material, num_questions)
+        return
+
+    # Same cap as get_quiz
+    items = [(material, min(num_questions, 5)) for material, num_questions in items]
+    async for index, result in _run_batch(
+        items,
+        lambda item: count_tokens(item[0]) <= BATCH_PACK_MAX_MATERIAL,
+        _quiz_pack,
+        lambda item: get_quiz_async(*item, priority=PRIORITY_BATCH),
+    ):
+        yield index, result
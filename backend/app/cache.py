@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so cosmetic whitespace differences share a cache entry"""
+    prompt = unicodedata.normalize("NFC", prompt)
+    lines = [" ".join(line.split()) for line in prompt.strip().splitlines()]
+    return "\n".join(lines)
+
+
+def make_cache_key(endpoint: str, prompt: str, generation_config=None, model_name=None) -> str:
+    """Build a content-addressed key for a generation request"""
+    payload = json.dumps(
+        {
+            "endpoint": endpoint,
+            "prompt": _normalize_prompt(prompt),
+            "config": generation_config or {},
+            "model": model_name or "",
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, bytes):
+        return len(value)
+    return len(value.encode("utf-8"))
+
+
+class ResponseCache:
+    """Base class for response caches; subclasses implement _get/_set/_clear"""
+
+    # True if get/set may wait on disk; get_async/set_async then run them in a thread
+    blocking = False
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        self._set(key, value)
+
+    async def get_async(self, key: str):
+        if not self.blocking:
+            return self.get(key)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def set_async(self, key: str, value):
+        if not self.blocking:
+            return self.set(key, value)
+        await asyncio.get_running_loop().run_in_executor(None, self.set, key, value)
+
+    def clear(self):
+        self._clear()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.__class__.__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _count(self, evictions=0, expirations=0):
+        with self._stats_lock:
+            self.evictions += evictions
+            self.expirations += expirations
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class NullCache(ResponseCache):
+    """Cache that never stores anything (RESPONSE_CACHE=off)"""
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value):
+        pass
+
+    def _clear(self):
+        pass
+
+
+class MemoryCache(ResponseCache):
+    """In-process LRU cache bounded by entry count, total bytes and TTL"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 10000, ttl: float = 86400):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self._count(expirations=1)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted += 1
+        if evicted:
+            self._count(evictions=evicted)
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+class SQLiteCache(ResponseCache):
+    """On-disk cache in a single SQLite file, shared by all workers on the host.
+
+    Triggers keep the entry count and total size in a one-row table, so a
+    write never scans the cache; eviction deletes the least recently used
+    rows a batch at a time. Reads only record the access time when the last
+    one is older than TOUCH_SECONDS, so hits are mostly read-only.
+    """
+
+    blocking = True
+    TOUCH_SECONDS = 60
+    _EVICT_BATCH = 64
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, ttl: float = 7 * 86400):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                         "entries INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+            # Seeded from the table, for caches created before the totals existed
+            conn.execute("INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM responses")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN
+                UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size; END""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN
+                UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size; END""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS responses_resize AFTER UPDATE OF size ON responses BEGIN
+                UPDATE totals SET bytes = bytes - OLD.size + NEW.size; END""")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at, accessed_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        if expires_at and expires_at < now:
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ? AND expires_at = ?", (key, expires_at))
+            self._count(expirations=1)
+            return None
+        if now - accessed_at > self.TOUCH_SECONDS:
+            with conn:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def _set(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else 0
+        conn = self._connect()
+        with conn:
+            # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete skips the triggers
+            conn.execute(
+                """INSERT INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,
+                   expires_at = excluded.expires_at, accessed_at = excluded.accessed_at""",
+                (key, value, size, expires_at, now),
+            )
+            total = conn.execute("SELECT bytes FROM totals").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def _evict(self, conn, excess: int):
+        """Delete least recently used rows until `excess` bytes are freed"""
+        evicted = 0
+        freed = 0
+        while freed < excess:
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?", (self._EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if freed >= excess:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                freed += size
+                evicted += 1
+        self._count(evictions=evicted)
+
+    def _clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        row = self._connect().execute("SELECT entries, bytes FROM totals").fetchone()
+        stats["entries"], stats["bytes"] = row
+        stats["max_bytes"] = self.max_bytes
+        stats["path"] = self.path
+        return stats
+
+
+class TieredCache(ResponseCache):
+    """Memory cache in front of a slower shared cache; hits in the second tier are promoted"""
+
+    def __init__(self, first: ResponseCache, second: ResponseCache):
+        super().__init__()
+        self.first = first
+        self.second = second
+        self.blocking = first.blocking or second.blocking
+
+    def _get(self, key):
+        value = self.first.get(key)
+        if value is None:
+            value = self.second.get(key)
+            if value is not None:
+                self.first.set(key, value)
+        return value
+
+    def _set(self, key, value):
+        self.first.set(key, value)
+        self.second.set(key, value)
+
+    def _clear(self):
+        self.first.clear()
+        self.second.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["tiers"] = [self.first.stats(), self.second.stats()]
+        return stats
+
+
+def create_cache() -> ResponseCache:
+    """Build the response cache configured by the RESPONSE_CACHE* environment variables"""
+    backend = os.getenv("RESPONSE_CACHE", "memory").lower()
+    if backend in ("off", "none", "0", "false"):
+        return NullCache()
+
+    memory = MemoryCache(
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000)),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", 86400)),
+    )
+    if backend != "sqlite":
+        return memory
+
+    disk = SQLiteCache(
+        os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3"),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024)),
+        ttl=float(os.getenv("RESPONSE_CACHE_DISK_TTL", 7 * 86400)),
+    )
+    return TieredCache(memory, disk)
@@ -0,0 +1,49 @@
+import re
+
+from app.prompt_budget import count_tokens, split_by_tokens
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n|\f")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split_oversized(paragraph: str, max_tokens: int):
+    """Split a paragraph larger than the budget on sentences, then on word boundaries"""
+    pieces = []
+    for sentence in _SENTENCE_END.split(paragraph):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        pieces.extend(split_by_tokens(sentence, max_tokens))
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int, separator: str = "\n\n"):
+    """Pack paragraphs (or pages) into chunks of at most max_tokens each.
+
+    Splits happen on blank lines and form feeds where possible so chunks follow
+    the document's own structure; only paragraphs that are too large on their
+    own are broken up further.
+    """
+    units = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) > max_tokens:
+            units.extend(_split_oversized(paragraph, max_tokens))
+        else:
+            units.append(paragraph)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        tokens = count_tokens(unit)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def hash_bytes(data: bytes) -> str:
+    """SHA-256 of an uploaded file, used as its document id"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class DocumentStore:
+    """Extracted text and derived summaries of uploaded documents.
+
+    Metadata and summaries live in SQLite; the (potentially large) extracted
+    text is kept in a plain file per document next to it.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._local = threading.local()
+
+    def _connect(self):
+        # Created on first use so importing the module has no filesystem side effects
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.root, "documents.sqlite3"), timeout=5, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS documents (
+                        hash TEXT PRIMARY KEY,
+                        filename TEXT,
+                        size INTEGER NOT NULL,
+                        total_pages INTEGER NOT NULL,
+                        pages_extracted INTEGER NOT NULL,
+                        truncated INTEGER NOT NULL,
+                        chars INTEGER NOT NULL,
+                        page_offsets TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS summaries (
+                        hash TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (hash, kind)
+                    )"""
+                )
+            self._local.conn = conn
+        return conn
+
+    def path_for(self, doc_hash: str, suffix: str = ".txt") -> str:
+        """Location of a per-document file, sharded by hash prefix"""
+        return os.path.join(self.root, doc_hash[:2], doc_hash + suffix)
+
+    def get(self, doc_hash: str):
+        """Document metadata, or None if the hash is unknown"""
+        if not _HASH_PATTERN.match(doc_hash):
+            return None
+        row = self._connect().execute("SELECT * FROM documents WHERE hash = ?", (doc_hash,)).fetchone()
+        if row is None:
+            return None
+        document = dict(row)
+        document["truncated"] = bool(document["truncated"])
+        document["page_offsets"] = json.loads(document["page_offsets"])
+        return document
+
+    def get_text(self, doc_hash: str):
+        try:
+            with open(self.path_for(doc_hash), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, doc_hash: str, filename: str, size: int, extraction):
+        """Store the extracted text of a document and return its metadata"""
+        text = extraction.text
+        # Start offset of every extracted page within the stored text
+        page_offsets = []
+        offset = 0
+        for page in extraction.pages:
+            page_offsets.append(offset)
+            offset += len(page.text) + 2  # pages are joined by a blank line
+
+        path = self.path_for(doc_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    doc_hash,
+                    filename,
+                    size,
+                    extraction.total_pages,
+                    len(extraction.pages),
+                    int(extraction.truncated),
+                    len(text),
+                    json.dumps(page_offsets),
+                    time.time(),
+                ),
+            )
+        return self.get(doc_hash)
+
+    def get_summary(self, doc_hash: str, kind: str = "summary"):
+        row = self._connect().execute(
+            "SELECT content FROM summaries WHERE hash = ? AND kind = ?", (doc_hash, kind)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_summary(self, doc_hash: str, content: str, kind: str = "summary"):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                (doc_hash, kind, content, time.time()),
+            )
+
+    def summaries(self, doc_hash: str) -> dict:
+        rows = self._connect().execute("SELECT kind, content FROM summaries WHERE hash = ?", (doc_hash,))
+        return {kind: content for kind, content in rows}
+
+
+document_store = DocumentStore(os.getenv("DOCUMENT_STORE_DIR", "data/documents"))
@@ -0,0 +1,114 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_topic(topic: str) -> str:
+    """Lookup key for a topic: lower case, punctuation and extra spaces removed"""
+    return " ".join(_NON_WORD.sub(" ", topic.lower()).split())
+
+
+def normalize_difficulty(difficulty: str) -> str:
+    """Map a requested difficulty onto the level whose prompt it gets (anything else is Hard)"""
+    level = difficulty.strip().capitalize()
+    return level if level in ("Easy", "Medium") else "Hard"
+
+
+class ExplanationStore:
+    """Pre-generated explanations, zlib-compressed in SQLite.
+
+    Filled ahead of time by app.warmup; get() is a single primary-key lookup,
+    so serving a stored explanation costs one small disk read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS explanations (
+                        topic TEXT NOT NULL,
+                        difficulty TEXT NOT NULL,
+                        content BLOB NOT NULL,
+                        model TEXT,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (topic, difficulty)
+                    )"""
+                )
+            self._local.conn = conn
+        return conn
+
+    def _lookup(self, topic: str, difficulty: str):
+        if not os.path.exists(self.path):
+            return None  # nothing warmed yet: don't create an empty store on the read path
+        row = self._connect().execute(
+            "SELECT content FROM explanations WHERE topic = ? AND difficulty = ?",
+            (normalize_topic(topic), normalize_difficulty(difficulty)),
+        ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def _count(self, text):
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def get(self, topic: str, difficulty: str):
+        """Stored explanation text, or None"""
+        return self._count(self._lookup(topic, difficulty))
+
+    def get_any(self, topic: str, difficulty: str):
+        """The requested level if stored, else the nearest stored level of the same topic"""
+        level = DIFFICULTIES.index(normalize_difficulty(difficulty))
+        for other in sorted(range(len(DIFFICULTIES)), key=lambda i: abs(i - level)):
+            text = self._lookup(topic, DIFFICULTIES[other])
+            if text is not None:
+                break
+        return self._count(text)
+
+    def has(self, topic: str, difficulty: str) -> bool:
+        return self._lookup(topic, difficulty) is not None
+
+    def put(self, topic: str, difficulty: str, content: str, model_name: str = None):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?, ?)",
+                (
+                    normalize_topic(topic),
+                    normalize_difficulty(difficulty),
+                    zlib.compress(content.encode("utf-8"), 9),
+                    model_name,
+                    time.time(),
+                ),
+            )
+
+    def stats(self) -> dict:
+        entries = stored_bytes = 0
+        if os.path.exists(self.path):
+            entries, stored_bytes = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM explanations"
+            ).fetchone()
+        return {"entries": entries, "bytes": stored_bytes, "hits": self.hits, "misses": self.misses}
+
+
+explanation_store = ExplanationStore(os.getenv("EXPLANATION_STORE_PATH", "data/explanations.sqlite3"))
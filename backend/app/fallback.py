@@ -0,0 +1,215 @@
+import json
+import mmap
+import os
+import re
+import threading
+
+from app.explanations import normalize_difficulty
+
+# One JSON object per line: {"topic": ..., "aliases": [...], "levels": {"Easy": ..., ...}}
+FALLBACK_CORPUS_PATH = os.getenv(
+    "FALLBACK_CORPUS_PATH", os.path.join(os.path.dirname(__file__), "data", "fallback_explanations.jsonl")
+)
+
+# Share of an alias's words a topic must contain (allowing one typo per word)
+# for a fuzzy match
+FUZZY_MIN_SCORE = 0.75
+
+_NON_WORD = re.compile(r"[^\w]+")
+_STOPWORDS = frozenset("a an and the of in on for to is are what how why explain about with".split())
+_MAX_TOKEN = 32
+
+
+def _stem(token: str) -> str:
+    """Fold plurals so 'classes' matches 'class' and 'deadlocks' matches 'deadlock'"""
+    if token.endswith("sses"):
+        return token[:-2]
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str):
+    return [_stem(token[:_MAX_TOKEN]) for token in _NON_WORD.sub(" ", text.lower()).split()]
+
+
+def _deletes(token: str):
+    """The token with each single character removed (symmetric-delete fuzzy index)"""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if a[i + 1:] == b[i + 1:]:
+            return True  # one substitution
+        # or two neighbours swapped
+        return i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+    return a[i:] == b[i + 1:]  # one insertion
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: every pattern occurring in a text, in one pass over it"""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]  # (value, length) of the pattern ending here
+        self._link = [0]  # nearest state on the failure chain that ends a pattern
+        for value, pattern in patterns:
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                    self._link.append(0)
+                state = nxt
+            self._out[state] = (value, len(pattern))
+
+        # Breadth-first failure links
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target
+                self._link[nxt] = target if self._out[target] else self._link[target]
+
+    def find(self, text: str):
+        """Yield (value, length) for every pattern occurrence"""
+        state = 0
+        goto, fail, out, link = self._goto, self._fail, self._out, self._link
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if out[state] else link[state]
+            while match:
+                yield out[match]
+                match = link[match]
+
+
+class FallbackCorpus:
+    """Offline explanations, memory-mapped from a JSONL file and indexed by alias.
+
+    Loading parses the file once to record each entry's byte range and build
+    the indexes; the explanation text stays in the mapped file and only the
+    matched entry is decoded. A lookup is one Aho-Corasick pass over the
+    normalized topic (aliases match as whole words, the longest wins); failing
+    that, topic words are matched to alias words allowing one typo each, via a
+    delete-neighbourhood index. Both are linear in the length of the topic.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._mmap = None
+        self._spans = []
+        self._matcher = None
+        self._alias_words = []  # alias id -> (entry id, number of content words)
+        self._word_index = {}  # word or single-deletion variant -> {(alias id, word)}
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not load fallback corpus {self.path}: {e}")
+                return
+
+            patterns = []
+            start = 0
+            size = len(self._mmap)
+            while start < size:
+                end = self._mmap.find(b"\n", start)
+                end = size if end == -1 else end
+                line = self._mmap[start:end].strip()
+                if line:
+                    entry = json.loads(line)
+                    entry_id = len(self._spans)
+                    self._spans.append((start, end))
+                    for alias in [entry["topic"]] + entry.get("aliases", []):
+                        self._add_alias(entry_id, alias, patterns)
+                start = end + 1
+            self._matcher = AhoCorasick(patterns)
+
+    def _add_alias(self, entry_id: int, alias: str, patterns):
+        words = tokenize(alias)
+        if not words:
+            return
+        alias_id = len(self._alias_words)
+        patterns.append((alias_id, f" {' '.join(words)} "))
+        content = {word for word in words if word not in _STOPWORDS} or set(words)
+        self._alias_words.append((entry_id, len(content)))
+        for word in content:
+            keys = {word} | (_deletes(word) if len(word) >= 5 else set())
+            for key in keys:
+                self._word_index.setdefault(key, set()).add((alias_id, word))
+
+    def lookup(self, topic: str):
+        """Index of the entry best matching `topic`, or None"""
+        self._load()
+        if self._matcher is None:
+            return None
+        words = tokenize(topic)
+        if not words:
+            return None
+
+        exact = max(self._matcher.find(f" {' '.join(words)} "), key=lambda match: match[1], default=None)
+        if exact is not None:
+            return self._alias_words[exact[0]][0]
+
+        matched = {}  # alias id -> alias words found in the topic
+        for word in words:
+            if word in _STOPWORDS:
+                continue
+            keys = {word} | (_deletes(word) if len(word) >= 5 else set())
+            for key in keys:
+                for alias_id, alias_word in self._word_index.get(key, ()):
+                    if _within_one_edit(word, alias_word):
+                        matched.setdefault(alias_id, set()).add(alias_word)
+        best = None
+        for alias_id, alias_words in matched.items():
+            entry_id, size = self._alias_words[alias_id]
+            score = len(alias_words) / size
+            if score >= FUZZY_MIN_SCORE and (best is None or (score, size) > best[0]):
+                best = ((score, size), entry_id)
+        return best[1] if best else None
+
+    def get(self, topic: str, difficulty: str):
+        """Explanation for the best matching entry at `difficulty` (else Medium), or None"""
+        entry_id = self.lookup(topic)
+        if entry_id is None:
+            return None
+        start, end = self._spans[entry_id]
+        levels = json.loads(self._mmap[start:end])["levels"]
+        return levels.get(normalize_difficulty(difficulty)) or levels.get("Medium")
+
+    def __len__(self):
+        self._load()
+        return len(self._spans)
+
+
+fallback_corpus = FallbackCorpus(FALLBACK_CORPUS_PATH)
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import threading
+
+from app.explanations import normalize_difficulty
+from app.router import ROUTER_MIN_SAMPLES, ModelStats
+
+# Seconds a generation may take, queueing and retries included, before the
+# caller gives up and serves a cached or fallback answer instead. An
+# "endpoint:Difficulty" entry overrides the endpoint's for that level: Hard
+# explanations run to several thousand tokens.
+DEFAULT_DEADLINES = {
+    "explain": 90.0,
+    "explain:Easy": 45.0,
+    "explain:Hard": 180.0,
+    "explain_stream": 120.0,
+    "explain_stream:Hard": 240.0,
+    "summary": 30.0,
+    "summary_map": 30.0,
+    "summary_reduce": 30.0,
+    "quiz": 30.0,
+    "quiz_batch": 60.0,
+    "flashcards": 30.0,
+    "flashcards_batch": 60.0,
+}
+GENERATION_DEADLINE = float(os.getenv("GENERATION_DEADLINE", 60))
+
+HEDGING = os.getenv("HEDGING", "on").lower() not in ("off", "none", "0", "false")
+# At most this share of calls may send a hedge, so a slow spell cannot double the load
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", 0.1))
+# Never hedge sooner than this, however fast the endpoint usually is
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 1.0))
+# Send the hedge to the next model on the router's ladder rather than the same one
+HEDGE_SECOND_MODEL = os.getenv("HEDGE_SECOND_MODEL", "on").lower() not in ("off", "none", "0", "false")
+
+
+def parse_deadlines(spec: str) -> dict:
+    """'explain=60,explain:Hard=150,quiz=20' -> deadlines, defaults for endpoints not mentioned"""
+    deadlines = dict(DEFAULT_DEADLINES)
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        endpoint, value = part.split("=", 1)
+        deadlines[endpoint.strip()] = float(value)
+    return deadlines
+
+
+class Hedger:
+    """Deadlines and hedged requests for generate_content calls.
+
+    run() starts the call on the first model; if it has not answered after the
+    endpoint's p95 latency (per difficulty, where there is one), a duplicate
+    goes to the second model (or the same one again) and whichever succeeds
+    first wins, the other is cancelled. Hedges draw on a budget refilled by
+    HEDGE_MAX_RATE per call, so they stay a bounded share of traffic, and are
+    only sent if the scheduler can admit them at once: a hedge uses quota like
+    any call, and is skipped rather than queued or pushed into a 429.
+    """
+
+    def __init__(self, deadlines: dict = None, max_rate: float = HEDGE_MAX_RATE, min_delay: float = HEDGE_MIN_DELAY,
+                 second_model: bool = HEDGE_SECOND_MODEL, enabled: bool = HEDGING, scheduler=None):
+        self.deadlines = deadlines or dict(DEFAULT_DEADLINES)
+        self.scheduler = scheduler
+        self.max_rate = max_rate
+        self.min_delay = min_delay
+        self.second_model = second_model
+        self.enabled = enabled
+        self._latency = {}  # "endpoint[:Difficulty]" -> ModelStats of successful calls
+        self._budget = 1.0
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.no_capacity = 0
+        self.timeouts = 0
+
+    def deadline(self, endpoint: str, difficulty: str = None) -> float:
+        deadline = self.deadlines.get(_key(endpoint, difficulty)) if difficulty else None
+        return deadline or self.deadlines.get(endpoint, GENERATION_DEADLINE)
+
+    def record(self, endpoint: str, seconds: float, difficulty: str = None):
+        key = _key(endpoint, difficulty)
+        stats = self._latency.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._latency.setdefault(key, ModelStats())
+        stats.record(seconds, True)
+
+    def delay(self, endpoint: str, difficulty: str = None):
+        """Seconds to wait before hedging, or None while the p95 for this endpoint and level is unknown"""
+        return self._delay(_key(endpoint, difficulty))
+
+    def _delay(self, key: str):
+        stats = self._latency.get(key)
+        snapshot = stats.snapshot() if stats else None
+        if not snapshot or snapshot["samples"] < ROUTER_MIN_SAMPLES:
+            return None
+        return max(self.min_delay, snapshot["p95_seconds"])
+
+    def _take_hedge(self, tokens: float) -> bool:
+        with self._lock:
+            if self._budget < 1.0:
+                return False
+            if self.scheduler is not None and not self.scheduler.try_acquire(tokens):
+                self.no_capacity += 1
+                return False
+            self._budget -= 1.0
+            self.fired += 1
+            return True
+
+    async def run(self, endpoint: str, attempt, model_name: str, alternative: str = None, difficulty: str = None,
+                  tokens: float = 1):
+        """Result of attempt(model_name), hedged with attempt(alternative or model_name).
+
+        `tokens` is what one call costs the scheduler's TPM bucket.
+        """
+        with self._lock:
+            self.calls += 1
+            self._budget = min(10.0, self._budget + self.max_rate)
+        delay = self.delay(endpoint, difficulty) if self.enabled else None
+        primary = asyncio.ensure_future(attempt(model_name))
+        if delay is None:
+            return await primary
+
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._take_hedge(tokens):
+                return await primary
+
+            hedge_model = alternative if self.second_model and alternative else model_name
+            hedge = asyncio.ensure_future(attempt(hedge_model))
+            if self.scheduler is not None:
+                # A callback, not a finally: it also runs if the hedge is cancelled before it starts
+                hedge.add_done_callback(lambda _: self.scheduler.release())
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedges_fired": self.fired,
+            "hedges_won": self.won,
+            "hedge_rate": round(self.fired / self.calls, 4) if self.calls else 0.0,
+            "hedges_skipped_no_capacity": self.no_capacity,
+            "deadline_exceeded": self.timeouts,
+            "hedge_delay_seconds": {key: self._delay(key) or 0.0 for key in list(self._latency)},
+        }
+
+
+def _key(endpoint: str, difficulty: str = None) -> str:
+    return f"{endpoint}:{normalize_difficulty(difficulty)}" if difficulty else endpoint
+
+
+def create_hedger(scheduler=None):
+    """Hedger configured by HEDGE_* and GENERATION_DEADLINES variables, charging hedges to `scheduler`"""
+    return Hedger(parse_deadlines(os.getenv("GENERATION_DEADLINES", "")), scheduler=scheduler)
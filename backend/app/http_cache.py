@@ -0,0 +1,176 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import threading
+
+from app.cache import MemoryCache
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as they are (headers would eat the saving)
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", 500))
+# Variants are compressed once and cached, so the slower, denser settings pay off
+GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", 9))
+BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", 9))
+# Compressed variants live in their own in-process LRU, apart from the
+# generation cache, so they never evict (or skew the stats of) model answers
+HTTP_VARIANT_CACHE_BYTES = int(os.getenv("HTTP_VARIANT_CACHE_BYTES", 16 * 1024 * 1024))
+_OFFLOAD_BYTES = 64 * 1024  # compress bodies above this off the event loop
+
+_lock = threading.Lock()
+_counts = {"not_modified": 0, "compressed": 0, "variant_hits": 0, "bytes_saved": 0}
+
+
+def _count(**increments):
+    with _lock:
+        for name, value in increments.items():
+            _counts[name] += value
+
+
+variant_cache = MemoryCache(max_bytes=HTTP_VARIANT_CACHE_BYTES, max_entries=10000, ttl=86400)
+
+
+def stats() -> dict:
+    with _lock:
+        counts = dict(_counts, brotli=brotli is not None)
+    counts["variants"] = variant_cache.stats()
+    return counts
+
+
+def etag_for(body: bytes) -> str:
+    """Content-addressed validator: the same JSON body always gets the same ETag.
+
+    Weak, because the gzip and brotli variants of a body share it.
+    """
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
+
+def add_vary(values, name: str) -> str:
+    """The Vary header from its existing values (e.g. "Origin" from CORS) with `name` added"""
+    fields = [field.strip() for value in values for field in value.split(",") if field.strip()]
+    if "*" not in fields and name.lower() not in (field.lower() for field in fields):
+        fields.append(name)
+    return ", ".join(fields)
+
+
+def choose_encoding(accept_encoding: str):
+    """The best encoding the client accepts: br (if installed), then gzip; None for identity"""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name] = q
+    for encoding in (("br",) if brotli else ()) + ("gzip",):
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class HttpCacheMiddleware:
+    """ASGI middleware adding ETags, 304 answers and compression to JSON responses.
+
+    Streams (SSE, NDJSON) pass through untouched. A JSON body gets a weak ETag
+    of its bytes; a GET whose If-None-Match holds it gets an empty 304
+    instead (RFC 9110 allows 304 for GET and HEAD only, and a POST such as
+    /flashcards may have saved something by the time its body exists).
+    Compressed variants are kept in `cache` (by default
+    the module's own bounded LRU) under the body's hash, so re-sending a
+    cached answer costs a lookup rather than a compression.
+    """
+
+    def __init__(self, app, cache=None):
+        self.app = app
+        self.cache = variant_cache if cache is None else cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "POST"):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        start = None
+        body = []
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start" and _is_json(message):
+                start = message  # held back until the body is complete
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                await self._respond(start, b"".join(body), scope["method"], request_headers, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _respond(self, start, body: bytes, method: str, request_headers: dict, send):
+        etag = etag_for(body)
+        vary = [v.decode("latin-1") for k, v in start["headers"] if k.lower() == b"vary"]
+        headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"etag", b"vary")]
+        headers += [(b"etag", etag.encode("latin-1")), (b"vary", add_vary(vary, "Accept-Encoding").encode("latin-1"))]
+
+        if method == "GET" and etag_matches(request_headers.get("if-none-match", ""), etag):
+            _count(not_modified=1, bytes_saved=len(body))
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        encoding = None
+        if len(body) >= HTTP_COMPRESS_MIN_BYTES:
+            encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding:
+            size = len(body)
+            body = await self._variant(body, etag, encoding)
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            _count(compressed=1, bytes_saved=size - len(body))
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": start["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _variant(self, body: bytes, etag: str, encoding: str) -> bytes:
+        """The body in `encoding`, from the cache or compressed (and cached) now"""
+        key = f"http:{encoding}:{etag[3:-1]}"
+        cached = await self.cache.get_async(key)
+        if cached is not None:
+            _count(variant_hits=1)
+            return cached
+        if len(body) > _OFFLOAD_BYTES:
+            variant = await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding)
+        else:
+            variant = compress(body, encoding)
+        await self.cache.set_async(key, variant)
+        return variant
+
+
+def _is_json(message) -> bool:
+    if message["status"] != 200:
+        return False
+    headers = {k.lower(): v for k, v in message.get("headers", [])}
+    return headers.get(b"content-type", b"").startswith(b"application/json") and b"content-encoding" not in headers
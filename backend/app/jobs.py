@@ -0,0 +1,353 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STORE_DIR = os.getenv("JOB_STORE_DIR", "data/jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# A running job whose worker has not reported for this long is taken to be lost
+# (crashed or restarted worker) and queued again, up to JOB_MAX_ATTEMPTS runs
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 86400))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+class JobQueue:
+    """Durable queue of background generations in SQLite (WAL mode).
+
+    Jobs survive restarts: a worker claims a job by marking it running under a
+    lease it renews while working, and any job whose lease ran out is queued
+    again by whichever worker notices first. Handlers are registered per job
+    kind as `async handler(payload, progress)`, where `progress(fraction,
+    message)` records how far the job has got; their return value (anything
+    JSON-serializable) becomes the job's result.
+
+    The workers are tasks on the web server's event loop, so they share it with
+    requests: every SQLite call they make (claims wait up to 5s for the write
+    lock) runs on the queue's own database thread, and request-side reads go
+    to the thread pool, so neither stalls the loop.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._handlers = {}
+        self._waiters = {}  # job id -> asyncio.Events of long-polling requests
+        self._wakeup = None
+        self._loop = None
+        self._tasks = []
+        # One thread for the workers' writes: they queue behind each other, not behind requests
+        self._db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-db")
+
+    async def _db(self, fn, *args):
+        """fn(*args) on the database thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._db_thread, fn, *args)
+
+    def _wake(self):
+        """Wake an idle worker; safe from any thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.root, "jobs.sqlite3"), timeout=5, check_same_thread=False,
+                                   isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, job_id: str) -> str:
+        """File for a job's input too large for its payload (e.g. an uploaded PDF)"""
+        return os.path.join(self.root, "blobs", job_id)
+
+    def put_blob(self, job_id: str, data: bytes):
+        path = self.blob_path(job_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def remove_blob(self, job_id: str):
+        try:
+            os.remove(self.blob_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def register(self, kind: str, handler):
+        self._handlers[kind] = handler
+
+    # --- submitting and reading ---
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def submit(self, kind: str, payload: dict, job_id: str = None) -> str:
+        """Queue a job (blocking: call it from a worker thread, e.g. run_in_threadpool)"""
+        job_id = job_id or self.new_id()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), QUEUED, time.time()),
+        )
+        self._wake()
+        return job_id
+
+    def get(self, job_id: str):
+        """Public view of a job, or None if the id is unknown (blocking, like submit)"""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {key: row[key] for key in ("id", "kind", "status", "progress", "message", "error", "attempts",
+                                          "created_at", "started_at", "finished_at")}
+        job["result"] = json.loads(row["result"]) if row["result"] is not None else None
+        if row["status"] == QUEUED:
+            job["queue_position"] = self._connect().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, row["created_at"])
+            ).fetchone()[0]
+        return job
+
+    async def wait(self, job_id: str, timeout: float):
+        """The job once it has finished, or as it stands after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        event = asyncio.Event()
+        self._waiters.setdefault(job_id, set()).add(event)
+        try:
+            while True:
+                job = await asyncio.get_running_loop().run_in_executor(None, self.get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in FINISHED or remaining <= 0:
+                    return job
+                # Woken by this process's workers; polling covers the others
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, JOB_POLL_INTERVAL * 4))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    def _notify(self, job_id: str):
+        for event in self._waiters.get(job_id, ()):
+            event.set()
+
+    # --- claiming and running ---
+
+    def _claim(self):
+        """Mark the oldest queued job running under this worker's lease; returns its row"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    """UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1,
+                       started_at = ?, heartbeat_at = ? WHERE id = ?""",
+                    (RUNNING, self.worker_id, now, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def recover(self) -> int:
+        """Queue again (or fail, after JOB_MAX_ATTEMPTS) running jobs whose lease ran out"""
+        conn = self._connect()
+        stale = time.time() - JOB_LEASE_SECONDS
+        with_attempts_left = conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, message = ? "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts < ?",
+            (QUEUED, "Requeued after its worker stopped", RUNNING, stale, JOB_MAX_ATTEMPTS),
+        ).rowcount
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND heartbeat_at < ?",
+            (FAILED, "Worker stopped too many times", time.time(), RUNNING, stale),
+        )
+        return with_attempts_left
+
+    def purge(self):
+        """Drop finished jobs past JOB_RETENTION_SECONDS, with any input they left behind"""
+        conn = self._connect()
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = conn.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff)
+        ).fetchall()
+        for row in expired:
+            self.remove_blob(row["id"])
+        conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff))
+
+    def _progress(self, job_id: str, fraction: float, message: str = None):
+        self._connect().execute(
+            "UPDATE jobs SET progress = ?, message = COALESCE(?, message), heartbeat_at = ? "
+            "WHERE id = ? AND worker = ?",
+            (round(max(0.0, min(1.0, fraction)), 4), message, time.time(), job_id, self.worker_id),
+        )
+
+    def _finish(self, job_id: str, status: str, result=None, error: str = None):
+        if status == DONE:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, progress = 1, result = ?, finished_at = ? WHERE id = ? AND worker = ?",
+                (DONE, json.dumps(result), time.time(), job_id, self.worker_id),
+            )
+        else:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND worker = ?",
+                (status, error, time.time(), job_id, self.worker_id),
+            )
+
+    def _beat(self, job_id: str):
+        self._connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ?", (time.time(), job_id, self.worker_id)
+        )
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await self._db(self._beat, job_id)
+            except sqlite3.Error as e:
+                print(f"Warning: Job {job_id} heartbeat failed: {e}")
+
+    async def _complete(self, job_id: str, status: str, result=None, error: str = None):
+        await self._db(self._finish, job_id, status, result, error)
+        # Only a finished job's input can go: a run cut short (shutdown,
+        # cancellation) is queued again and needs it
+        await self._db(self.remove_blob, job_id)
+        self._notify(job_id)
+
+    async def _run(self, row):
+        job_id = row["id"]
+        handler = self._handlers.get(row["kind"])
+        if handler is None:
+            await self._complete(job_id, FAILED, error=f"Unknown job kind: {row['kind']}")
+            return
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        loop = asyncio.get_running_loop()
+        last_write = 0.0
+
+        def written(future):
+            if future.exception() is not None:
+                print(f"Warning: Job {job_id} progress was not saved: {future.exception()}")
+            self._notify(job_id)
+
+        def progress(fraction: float, message: str = None):
+            # Streaming handlers report per chunk; a write every JOB_POLL_INTERVAL is plenty.
+            # Handlers call this synchronously, so the write is not waited for.
+            nonlocal last_write
+            now = time.monotonic()
+            if now - last_write >= JOB_POLL_INTERVAL:
+                last_write = now
+                loop.run_in_executor(self._db_thread, self._progress, job_id, fraction, message).add_done_callback(
+                    written
+                )
+
+        try:
+            result = await handler(json.loads(row["payload"]), progress)
+        except Exception as e:
+            print(f"Job {job_id} ({row['kind']}) failed: {e}")
+            await self._complete(job_id, FAILED, error=str(e) or type(e).__name__)
+        else:
+            await self._complete(job_id, DONE, result)
+        finally:
+            heartbeat.cancel()
+
+    async def _worker(self):
+        while True:
+            try:
+                row = await self._db(self._claim)
+            except sqlite3.Error as e:
+                print(f"Warning: Could not claim a job: {e}")
+                row = None
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self._run(row)
+
+    async def _maintain(self):
+        while True:
+            try:
+                recovered = await self._db(self.recover)
+                if recovered:
+                    print(f"Requeued {recovered} job(s) left running by a stopped worker")
+                    self._wakeup.set()
+                await self._db(self.purge)
+            except sqlite3.Error as e:
+                print(f"Warning: Job maintenance failed: {e}")
+            await asyncio.sleep(JOB_LEASE_SECONDS / 2)
+
+    def start(self, workers: int = JOB_WORKERS):
+        """Start the worker pool and lease recovery on the running event loop"""
+        if self._tasks or workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.ensure_future(self._maintain())]
+        self._tasks += [asyncio.ensure_future(self._worker()) for _ in range(workers)]
+
+    async def stop(self):
+        """Cancel the workers and hand their running jobs back to the queue"""
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        await self._db(self._requeue_mine)
+
+    def _requeue_mine(self):
+        # An interrupted run does not count as an attempt
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, worker = NULL, attempts = attempts - 1, message = ? "
+            "WHERE status = ? AND worker = ?",
+            (QUEUED, "Requeued at shutdown", RUNNING, self.worker_id),
+        )
+
+    def stats(self) -> dict:
+        if not os.path.exists(os.path.join(self.root, "jobs.sqlite3")):
+            return {}
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+job_queue = JobQueue(JOB_STORE_DIR)
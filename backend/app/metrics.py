@@ -0,0 +1,186 @@
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cached response to a long Hard explanation
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values_counts = sorted(self._values.items())
+        for values, count in values_counts:
+            yield f"{self.name}{_format_labels(self.labels, values)} {count}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions under a lock"""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((values, list(counts)) for values, counts in self._series.items())
+        for values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), values + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {counts[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+_registry = []
+
+
+def counter(name: str, help: str, labels=()) -> Counter:
+    metric = Counter(name, help, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+http_request_seconds = histogram(
+    "http_request_duration_seconds", "End-to-end request latency by route", ("method", "route", "status")
+)
+generate_seconds = histogram(
+    "gemini_generate_seconds", "Time spent in generate_content (excluding queueing)", ("endpoint", "model")
+)
+generate_tokens = histogram(
+    "gemini_tokens", "Prompt and response tokens per Gemini call", ("endpoint", "kind"), TOKEN_BUCKETS
+)
+generate_errors = counter(
+    "gemini_errors_total", "Failed Gemini calls by model and error type", ("endpoint", "model", "error")
+)
+pdf_page_seconds = histogram("pdf_page_extract_seconds", "Text extraction time per PDF page")
+postprocess_seconds = histogram(
+    "postprocess_seconds", "Time spent cleaning and parsing model output", ("stage",)
+)
+fallbacks = counter("fallback_responses_total", "Mock/placeholder responses served, by reason", ("endpoint", "reason"))
+
+
+def record_fallback(endpoint: str, reason: str):
+    fallbacks.inc(endpoint, reason)
+
+
+def record_usage(endpoint: str, response, prompt_tokens: int = None, response_tokens: int = None):
+    """Token counts from a Gemini response's usage_metadata, else the given estimates"""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or prompt_tokens
+    response_tokens = getattr(usage, "candidates_token_count", None) or response_tokens
+    if prompt_tokens:
+        generate_tokens.observe(prompt_tokens, endpoint, "prompt")
+    if response_tokens:
+        generate_tokens.observe(response_tokens, endpoint, "response")
+
+
+def _flatten(prefix: str, stats: dict):
+    for key, value in stats.items():
+        name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{key}")
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def render(gauges: dict = None) -> str:
+    """Prometheus text exposition of every metric, plus `gauges` (nested stats dicts)"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for prefix, stats in (gauges or {}).items():
+        for name, value in _flatten(prefix, stats):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every request until its last body byte is sent.
+
+    Streaming responses are therefore measured end to end, and requests are
+    labelled by route template (e.g. /documents/{doc_hash}) to bound cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.observe(time.perf_counter() - started, scope["method"], path, status)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 # 1. Explain Topic
 class ExplainRequest(BaseModel):
@@ -12,10 +12,31 @@ class TextRequest(BaseModel):
 
 # 3. Generate Quiz
 class QuizRequest(BaseModel):
-    material: str
+    material: str = ""
     num_questions: int = 5
+    # Quiz on a stored document instead (material, if also given, is what to focus on)
+    document_hash: Optional[str] = None
 
 # 4. Generate Flashcards (NEW)
 class FlashcardRequest(BaseModel):
     topic: str
     num_cards: int = 5
+    document_hash: Optional[str] = None  # base the cards on this stored document
+    # Save the cards to this user's deck for review, and reuse the deck next time
+    user_id: Optional[str] = None
+
+# 5. Batch generation (one item per topic / material)
+class FlashcardBatchRequest(BaseModel):
+    items: List[FlashcardRequest]
+
+class QuizBatchRequest(BaseModel):
+    items: List[QuizRequest]
+
+# 6. Spaced-repetition reviews (grades follow SM-2: 0 = forgot, 5 = perfect recall)
+class ReviewGrade(BaseModel):
+    card_id: int
+    grade: int = Field(ge=0, le=5)
+
+class ReviewGradesRequest(BaseModel):
+    user_id: str
+    grades: List[ReviewGrade]
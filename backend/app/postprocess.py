@@ -0,0 +1,120 @@
+import re
+from typing import Callable, Iterable, NamedTuple, Union
+
+
+class Rule(NamedTuple):
+    """One rewrite applied to model output.
+
+    Every match must contain `trigger`. Apart from text enclosed by a `span`
+    delimiter (e.g. '$...$'), a match may only contain `hold_chars`; the
+    streaming cleaner relies on this to know which tail of a chunk could still
+    grow into a match.
+    """
+    name: str
+    trigger: str
+    pattern: str
+    replacement: Union[str, Callable]
+    hold_chars: str = ""
+    span: str = ""
+
+
+# Remove $...$ patterns (mathematical notation)
+MATH = Rule("math", "$", r"\$[^$]*\$", "", "$", "$")
+# Replace #### with ### (written ####+ rather than #{4,} so the regex engine
+# can search for the literal prefix)
+HEADINGS = Rule("headings", "#", r"####+", "###", "#")
+# Replace * bullet points with •
+BULLETS = Rule("bullets", "\n", r"\n\* ", "\n• ", "\n* ")
+# Remove excessive asterisks
+BOLD = Rule("bold", "*", r"\*\*", "", "*")
+
+DEFAULT_RULES = (MATH, HEADINGS, BULLETS, BOLD)
+
+
+class PostProcessor:
+    """Applies a list of rules to model output, in order.
+
+    Patterns are compiled once. A rule whose trigger character does not occur
+    in the text is skipped without entering the regex engine, and each pass is
+    written so the engine can jump straight to its literal prefix.
+    """
+
+    def __init__(self, rules: Iterable[Rule] = DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self._passes = [(rule.trigger, re.compile(rule.pattern), rule.replacement) for rule in self.rules]
+        self.hold_chars = "".join(sorted(set("".join(rule.hold_chars for rule in self.rules))))
+        self.spans = "".join(sorted(set(rule.span for rule in self.rules if rule.span)))
+
+    def process(self, text: str) -> str:
+        for trigger, pattern, replacement in self._passes:
+            if trigger in text:
+                text = pattern.sub(replacement, text)
+        return text
+
+    def with_rules(self, *rules: Rule) -> "PostProcessor":
+        """A new processor with extra rules appended"""
+        return PostProcessor(self.rules + rules)
+
+    def stream(self) -> "StreamCleaner":
+        return StreamCleaner(self)
+
+
+class StreamCleaner:
+    """Apply a PostProcessor to a stream of chunks.
+
+    Output is only emitted up to the last character that no rule can match
+    across (not a hold character and outside any open span). Rules only ever
+    rewrite runs of hold characters, so no earlier pass can make a later one
+    match across that point either, and the cleaned stream is identical to
+    cleaning the full response at once.
+    """
+
+    # An unclosed span opened further back than this is emitted as-is rather
+    # than stalling the stream until the end of the response.
+    MAX_HOLD = 4096
+
+    def __init__(self, processor: PostProcessor = None):
+        self.processor = processor or default_processor
+        self._buffer = ""
+
+    def _open_span(self, text: str, end: int) -> int:
+        """Index of an unclosed span delimiter before `end`, or -1"""
+        for delimiter in self.processor.spans:
+            if text.count(delimiter, 0, end) % 2:
+                return text.rfind(delimiter, 0, end)
+        return -1
+
+    def _safe_cut(self, text: str) -> int:
+        hold_chars = self.processor.hold_chars
+        cut = len(text)
+        while cut:
+            opened = self._open_span(text, cut)
+            if opened != -1:
+                if len(text) - opened > self.MAX_HOLD:
+                    return cut
+                cut = opened
+            elif text[cut - 1] in hold_chars:
+                cut -= 1
+            else:
+                break
+        return cut
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        cut = self._safe_cut(self._buffer)
+        if not cut:
+            return ""
+        text, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self.processor.process(text)
+
+    def flush(self) -> str:
+        text, self._buffer = self.processor.process(self._buffer), ""
+        return text
+
+
+default_processor = PostProcessor()
+
+
+def clean_response(text: str) -> str:
+    """Clean special characters from API response"""
+    return default_processor.process(text)
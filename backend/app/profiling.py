@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+# Profiling is off unless a sample rate is set or the X-Profile header is
+# allowed; main.py only installs the middleware when it is on, so requests pay
+# nothing otherwise
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "off").lower() in ("on", "1", "true")
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "speedscope").lower()  # speedscope | collapsed
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 200))  # the slowest profiles are kept, the rest deleted
+
+_EXTENSIONS = {"speedscope": ".speedscope.json", "collapsed": ".folded"}
+# <duration ms>-<method>-<route>-<status>-<id><extension>: the listing is the index
+_NAME = re.compile(r"^(\d+)-([A-Z]+)-(.+)-(\d{3})-([0-9a-f]{32})(\.speedscope\.json|\.folded)$")
+# Threads parked in these modules are idle, not working for anyone
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+_WAITING = "(waiting)"
+
+_current = contextvars.ContextVar("profile_session", default=None)
+
+
+def enabled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 or PROFILE_HEADER
+
+
+def _label(code, cache: dict) -> str:
+    label = cache.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(os.getcwd() + os.sep):
+            filename = os.path.relpath(filename)
+        elif "site-packages" + os.sep in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[1]
+        else:
+            filename = os.path.basename(filename)
+        label = cache[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+    return label
+
+
+def _frame_stack(frame, root=None):
+    """Frames from the outermost down to `frame`, starting at `root` if it is on the stack"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            break
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _task_factory(loop, coro, **kwargs):
+    """Task factory recording the tasks a profiled request spawns (they inherit its context)"""
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    session = _current.get()
+    if session is not None:
+        session.children.append(task)
+    return task
+
+
+def _await_stack(coro):
+    """Frames of a suspended coroutine and everything it is awaiting, outermost first"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+class Session:
+    """Samples collected for one request.
+
+    The request is sampled where it runs: the real stack of whichever of its
+    tasks holds the event loop, or else the chain of awaits it is suspended
+    in (ending in "(waiting)"), so time spent waiting on Gemini shows up under
+    the call that awaited it. Tasks the request spawned (single-flight,
+    hedged attempts) are nested under the request's own await chain. Busy
+    worker threads are sampled too, under a "[thread <name>]" root; with
+    concurrent traffic those samples may include other requests' work.
+    """
+
+    def __init__(self, task, loop_thread: int):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.children = []  # tasks created while handling the request, oldest first
+        self.loop = task.get_loop()
+        self.loop_thread = loop_thread
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.samples = Counter()  # stack (tuple of labels) -> number of samples
+        self.seconds = Counter()  # stack -> wall time it stands for
+        self._labels = {}
+
+    def sample(self, frames: dict, names: dict, now: float, sampler_thread: int):
+        elapsed = now - self.last
+        self.last = now
+        if not self.task.done():
+            self._add(self._task_stack(frames.get(self.loop_thread)), elapsed)
+        for thread_id, frame in frames.items():
+            if thread_id in (self.loop_thread, sampler_thread) or frame.f_code.co_filename.endswith(_IDLE_FILES):
+                continue
+            stack = [f"[thread {names.get(thread_id, thread_id)}]"]
+            stack += [_label(f.f_code, self._labels) for f in _frame_stack(frame)]
+            self._add(tuple(stack), elapsed)
+
+    def _task_stack(self, loop_frame):
+        labels = self._labels
+        children = [task for task in self.children if not task.done()]
+        running = asyncio.current_task(self.loop)
+        if running is self.task and loop_frame is not None:
+            return tuple(_label(f.f_code, labels) for f in _frame_stack(loop_frame, self.task.get_coro().cr_frame))
+
+        stack = [_label(f.f_code, labels) for f in _await_stack(self.task.get_coro())]
+        if running in children and loop_frame is not None:
+            frames = _frame_stack(loop_frame, running.get_coro().cr_frame)
+            return tuple(stack + [_label(f.f_code, labels) for f in frames])
+        if children:
+            # The newest live task is the one doing the innermost work
+            stack += [_label(f.f_code, labels) for f in _await_stack(children[-1].get_coro())]
+        return tuple(stack + [_WAITING])
+
+    def _add(self, stack, elapsed: float):
+        self.samples[stack] += 1
+        self.seconds[stack] += elapsed
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: one "frame;frame;frame count" line per stack"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self, name: str, duration: float) -> dict:
+        frames = {}
+        samples, weights = [], []
+        for stack, seconds in self.seconds.most_common():
+            samples.append([frames.setdefault(label, len(frames)) for label in stack])
+            weights.append(round(seconds * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ai-study-buddy",
+            "shared": {"frames": [{"name": label} for label in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(duration * 1000, 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class Sampler:
+    """One background thread sampling every active session; it exits when there are none"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, session: Session):
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, session: Session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            # Sampled under the lock, so a session is never touched once remove() returns
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                now = time.perf_counter()
+                frames = sys._current_frames()
+                for session in self._sessions:
+                    session.sample(frames, names, now, me)
+
+
+sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+def _route_slug(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "unmatched"
+    return re.sub(r"[^A-Za-z0-9_.]+", "_", path.strip("/")).strip("_") or "root"
+
+
+def save(session: Session, scope, status: int, duration: float):
+    """Write the session's profile to PROFILE_DIR and prune all but the PROFILE_KEEP slowest"""
+    extension = _EXTENSIONS.get(PROFILE_FORMAT, _EXTENSIONS["speedscope"])
+    filename = f"{int(duration * 1000):09d}-{scope['method']}-{_route_slug(scope)}-{status}-{session.id}{extension}"
+    path = os.path.join(PROFILE_DIR, filename)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if extension == ".folded":
+                f.write(session.collapsed())
+            else:
+                json.dump(session.speedscope(f"{scope['method']} {scope['path']}", duration), f)
+        for old in list_profiles()[PROFILE_KEEP:]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old["file"]))
+            except FileNotFoundError:
+                pass  # pruned by another worker
+    except OSError as e:
+        print(f"Warning: Could not save profile {filename}: {e}")
+
+
+def list_profiles():
+    """Saved profiles, slowest first (shared by every worker using PROFILE_DIR)"""
+    try:
+        entries = list(os.scandir(PROFILE_DIR))
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for entry in entries:
+        match = _NAME.match(entry.name)
+        if match is None:
+            continue
+        duration, method, route, status, profile_id, _ = match.groups()
+        try:
+            created_at = entry.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        profiles.append({"id": profile_id, "file": entry.name, "duration_ms": int(duration), "method": method,
+                         "route": route, "status": int(status), "created_at": created_at})
+    profiles.sort(key=lambda profile: profile["duration_ms"], reverse=True)
+    return profiles
+
+
+def profile_path(profile_id: str):
+    """Path of the saved profile with this id, or None"""
+    for profile in list_profiles():
+        if profile["id"] == profile_id:
+            return os.path.join(PROFILE_DIR, profile["file"])
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling a share of requests (PROFILE_SAMPLE_RATE) and,
+    if PROFILE_HEADER is on, any request sent with "X-Profile: 1".
+
+    The profile covers the request until its last body byte is sent and is
+    written to PROFILE_DIR when it ends; the response carries its id in
+    X-Profile-Id (see GET /profiles).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        if PROFILE_HEADER and any(key == b"x-profile" and value not in (b"0", b"") for key, value in scope["headers"]):
+            return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        if loop.get_task_factory() is None:
+            loop.set_task_factory(_task_factory)
+        session = Session(asyncio.current_task(), threading.get_ident())
+        token = _current.set(session)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (b"x-profile-id", session.id.encode("latin-1"))
+                ])
+            await send(message)
+
+        sampler.add(session)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.remove(session)
+            _current.reset(token)
+            duration = time.perf_counter() - session.started
+            await asyncio.get_running_loop().run_in_executor(None, save, session, scope, status, duration)
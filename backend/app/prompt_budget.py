@@ -0,0 +1,55 @@
+import os
+import re
+from functools import lru_cache
+
+# Input budget for quiz and flashcard material; longer material is reduced to
+# its most relevant passages (see app.retrieval) rather than cut off
+QUIZ_INPUT_TOKENS = int(os.getenv("QUIZ_INPUT_TOKENS", 1000))
+
+# Output limit per endpoint: (base, per question/card)
+OUTPUT_TOKENS = {
+    "quiz": (100, 150),
+    "flashcards": (50, 80),
+}
+
+# Words, digit runs and single punctuation marks, roughly the pieces a
+# SentencePiece tokenizer starts from
+_PIECE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+
+@lru_cache(maxsize=65536)
+def _piece_tokens(piece: str) -> int:
+    if piece.isdigit():
+        return len(piece)  # digits are tokenized one at a time
+    if not piece.isascii():
+        return len(piece)  # CJK and other scripts: about one token per character
+    # Common words are a single token; longer ones split into ~6 character pieces
+    return 1 + (len(piece) - 1) // 6
+
+
+def count_tokens(text: str) -> int:
+    """Approximate Gemini token count of `text`, computed locally"""
+    if not text:
+        return 0
+    return sum(_piece_tokens(piece) for piece in _PIECE.findall(text))
+
+
+def split_by_tokens(text: str, max_tokens: int):
+    """Cut text into consecutive pieces of at most max_tokens each"""
+    start = end = used = 0
+    for match in _PIECE.finditer(text):
+        tokens = _piece_tokens(match.group())
+        if used and used + tokens > max_tokens:
+            yield text[start:end]
+            start, used = match.start(), 0
+        used += tokens
+        end = match.end()
+    if used:
+        yield text[start:end]
+
+
+def output_tokens(endpoint: str, items: int) -> int:
+    """max_output_tokens for a request producing `items` questions/cards"""
+    base, per_item = OUTPUT_TOKENS[endpoint]
+    return base + per_item * items
+
@@ -0,0 +1,203 @@
+import json
+import re
+
+LETTERS = ("A", "B", "C", "D")
+
+# Schema for Gemini's JSON response mode (generation_config["response_schema"])
+QUIZ_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "options": {
+                "type": "object",
+                "properties": {letter: {"type": "string"} for letter in LETTERS},
+                "required": list(LETTERS),
+            },
+            "correct_answer": {"type": "string"},
+        },
+        "required": ["question", "options", "correct_answer"],
+    },
+}
+
+# Characters that change JSON nesting state; an escape is taken with the character it escapes
+_JSON_TOKEN = re.compile(r'\\.?|[{}"]', re.DOTALL)
+
+# --- Text formats ---
+# "Q1: ...", "Question 1: ...", "1. ...", "**Q1.** ..." (markdown is stripped first)
+_QUESTION_LINE = re.compile(r"^(?:Q(?:uestion)?\s*(\d+)\s*[:.)\-]|(\d+)\s*[.)])\s*(.*)$", re.IGNORECASE)
+# "A) ...", "a. ...", "(A) ...", "A: ..." at the start of a line
+_OPTION_START = re.compile(r"^\(?([A-Da-d])\s*[).:]\s+")
+# Further options on the same line: " B) ...", " (C) ..." (upper case only)
+_OPTION_INLINE = re.compile(r"\s\(?([A-D])\s*[).]\s+")
+# "Ans: B", "Answer: (B)", "Correct Answer: B) ...", "Correct - b"
+_ANSWER_LINE = re.compile(r"^(?:Correct\s+Answer|Answer|Ans|Correct)\s*[:\-]\s*\(?([A-Da-d])\b", re.IGNORECASE)
+
+
+def _strip_markdown(line: str) -> str:
+    return line.strip().strip("*_#` ").replace("**", "")
+
+
+def _answer_letter(answer, options) -> str:
+    """Normalize an answer given as a letter, 'B) text' or the option text itself"""
+    if not isinstance(answer, str):
+        return None
+    answer = answer.strip()
+    match = re.match(r"^\(?([A-Da-d])\b", answer)
+    if match:
+        return match.group(1).upper()
+    for letter, text in options.items():
+        if text.strip().lower() == answer.lower():
+            return letter
+    return None
+
+
+def normalize_question(item):
+    """Coerce one parsed JSON object into the API's question shape, or None"""
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question") or item.get("q")
+    options = item.get("options") or item.get("choices")
+    if isinstance(options, list) and len(options) == 4:
+        options = dict(zip(LETTERS, options))
+    if not isinstance(question, str) or not isinstance(options, dict):
+        return None
+    options = {str(key).strip().upper()[:1]: str(value).strip() for key, value in options.items()}
+    if set(options) != set(LETTERS):
+        return None
+    answer = _answer_letter(item.get("correct_answer") or item.get("answer"), options)
+    if answer is None:
+        return None
+    return {
+        "question": question.strip(),
+        "options": {letter: options[letter] for letter in LETTERS},
+        "correct_answer": answer,
+    }
+
+
+class QuizParser:
+    """Incremental, tolerant parser for quiz responses.
+
+    A single pass tracks JSON string and brace state; every object is decoded
+    the moment its closing brace arrives and kept if it looks like a question.
+    A response cut off by max_output_tokens therefore still yields every
+    finished question, and code fences, a wrapping {"questions": [...]} object
+    or chatter around the JSON don't matter. If no JSON question is found,
+    close() parses the text formats instead.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._open = []  # start offsets of the enclosing unclosed objects
+        self._in_string = False
+        self._questions = []
+
+    def feed(self, chunk: str):
+        """Add text; returns questions completed by this chunk"""
+        self._buffer += chunk
+        buffer = self._buffer
+        found = []
+        start, self._pos = self._pos, len(buffer)
+        for match in _JSON_TOKEN.finditer(buffer, start):
+            token = match.group()
+            if token == "\\":
+                self._pos = match.start()  # escape split across chunks: rescan it next time
+                break
+            if self._in_string:
+                self._in_string = token != '"'
+            elif token == "{":
+                self._open.append(match.start())
+            elif not self._open:
+                continue  # quotes and braces outside JSON are plain text
+            elif token == '"':
+                self._in_string = True
+            elif token == "}":
+                opened = self._open.pop()
+                try:
+                    question = normalize_question(json.loads(buffer[opened:match.end()]))
+                except ValueError:
+                    question = None
+                if question:
+                    found.append(question)
+        self._questions.extend(found)
+        return found
+
+    def close(self):
+        """Finish parsing and return all questions"""
+        if not self._questions:
+            self._questions = parse_text_questions(self._buffer)
+        return self._questions
+
+
+def _option_markers(line: str, first_letter: str = "A"):
+    """Option markers in a line, kept only while they run A, B, C, D in order"""
+    markers = []
+    expected = LETTERS.index(first_letter)
+    candidates = []
+    start = _OPTION_START.match(line)
+    if start:
+        candidates.append(start)
+    candidates.extend(_OPTION_INLINE.finditer(line, start.end() if start else 0))
+    for match in candidates:
+        if expected < len(LETTERS) and match.group(1).upper() == LETTERS[expected]:
+            markers.append(match)
+            expected += 1
+    return markers
+
+
+def parse_text_questions(text: str):
+    """Line-by-line parser for the 'Q1: / A) / Ans:' family of text formats"""
+    questions = []
+    current = None
+
+    def finish():
+        if current and current["question"] and len(current["options"]) == 4 and current["correct_answer"]:
+            questions.append({
+                "question": current["question"],
+                "options": {letter: current["options"][letter] for letter in LETTERS},
+                "correct_answer": current["correct_answer"],
+            })
+
+    for raw_line in text.splitlines():
+        line = _strip_markdown(raw_line)
+        if not line:
+            continue
+        answer = _ANSWER_LINE.match(line)
+        if answer:
+            if current is not None:
+                current["correct_answer"] = answer.group(1).upper()
+            continue
+        question = _QUESTION_LINE.match(line)
+        if question:
+            finish()
+            line = question.group(3).strip()
+            current = {"question": line, "options": {}, "correct_answer": None}
+            markers = [m for m in _OPTION_INLINE.finditer(line) if m.group(1) == "A"][:1]
+            if not markers:
+                continue
+            # Options on the same line as the question
+            current["question"] = line[:markers[0].start()].strip()
+            line = line[markers[0].start():].strip()
+        if current is None:
+            continue
+        next_letter = LETTERS[len(current["options"])] if len(current["options"]) < 4 else "A"
+        markers = _option_markers(line, next_letter)
+        if not markers:
+            if not current["options"]:
+                current["question"] = f"{current['question']} {line}".strip()  # wrapped question
+            continue
+        for i, match in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(line)
+            current["options"][match.group(1).upper()] = line[match.end():end].strip()
+    finish()
+    return questions
+
+
+def parse_quiz(text: str, num_questions: int = None):
+    """Parse a complete quiz response (JSON or text); returns possibly fewer questions"""
+    parser = QuizParser()
+    parser.feed(text)
+    questions = parser.close()
+    return questions[:num_questions] if num_questions is not None else questions
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from app.chunking import split_into_chunks
+from app.documents import document_store
+from app.prompt_budget import count_tokens
+
+# Passages are packed paragraphs of at most this many tokens; prompts are built
+# from whole passages, so context stays coherent
+PASSAGE_TOKENS = int(os.getenv("PASSAGE_TOKENS", 200))
+BM25_K1 = 1.2
+BM25_B = 0.75
+# MMR trade-off between relevance (1.0) and novelty against passages already picked
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))
+MMR_CANDIDATES = 50
+KEY_TERMS = 20  # query terms standing in for "the whole document" when there is no query
+INDEX_VERSION = 1
+
+_TERM = re.compile(r"[^\W_]{2,}")
+_STOPWORDS = frozenset("""
+about above after again also among and any are because been before being between both but can could did
+does doing down during each either for from further had has have having here how however into its itself
+just like more most much must not now off once only other our out over own same should since some such
+than that the their them then there these they this those through too under until upon very was were
+what when where which while who whom why will with would yet you your all one may might
+""".split())
+
+
+def terms(text: str):
+    """Index terms: lower-case words of two or more characters, without stopwords, plurals folded"""
+    found = []
+    for word in _TERM.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            word = word[:-1]
+        found.append(word)
+    return found
+
+
+class PassageIndex:
+    """BM25 inverted index over the passages of one text.
+
+    add() indexes new text without touching what is already indexed, so a
+    document's index grows with it. select() picks passages for a prompt:
+    the best BM25 matches for the query, re-ranked by maximal marginal
+    relevance so near-duplicates give way to passages covering something else,
+    until the token budget is spent.
+    """
+
+    def __init__(self):
+        self.passages = []
+        self.lengths = []  # terms per passage
+        self.tokens = []  # prompt tokens per passage
+        self.postings = {}  # term -> [[passage id, term frequency], ...]
+        self.chars = 0  # length of the text indexed so far
+
+    def add(self, text: str):
+        """Index text that follows what has been indexed so far"""
+        self.chars += len(text)
+        for passage in split_into_chunks(text, PASSAGE_TOKENS):
+            passage_id = len(self.passages)
+            counts = Counter(terms(passage))
+            self.passages.append(passage)
+            self.lengths.append(sum(counts.values()))
+            self.tokens.append(count_tokens(passage))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append([passage_id, tf])
+
+    def __len__(self):
+        return len(self.passages)
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.passages) - df + 0.5) / (df + 0.5))
+
+    def key_terms(self, count: int = KEY_TERMS):
+        """Terms that characterise the whole text (total frequency times IDF)"""
+        weights = {term: sum(tf for _, tf in postings) * self._idf(term) for term, postings in self.postings.items()}
+        return sorted(weights, key=weights.get, reverse=True)[:count]
+
+    def search(self, query_terms):
+        """BM25 score of every passage matching any query term"""
+        scores = {}
+        if not self.passages:
+            return scores
+        average = sum(self.lengths) / len(self.lengths) or 1.0
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for passage_id, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[passage_id] / average)
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def select(self, query: str, budget: int):
+        """Relevant, mutually diverse passages within `budget` tokens, in text order"""
+        if not self.passages:
+            return []
+        query_terms = terms(query or "") or self.key_terms()
+        scores = self.search(query_terms)
+        if not scores:
+            # Nothing matches: spread the budget over the text instead
+            scores = {i: 1.0 for i in range(0, len(self.passages), max(1, len(self.passages) // 16))}
+        candidates = sorted(scores, key=scores.get, reverse=True)[:MMR_CANDIDATES]
+        best = scores[candidates[0]]
+        term_sets = {i: set(terms(self.passages[i])) for i in candidates}
+
+        chosen = []
+        used = 0
+        while candidates:
+            def mmr(i):
+                overlap = max(
+                    (len(term_sets[i] & term_sets[j]) / (len(term_sets[i] | term_sets[j]) or 1) for j in chosen),
+                    default=0.0,
+                )
+                return MMR_LAMBDA * scores[i] / best - (1 - MMR_LAMBDA) * overlap
+
+            pick = max(candidates, key=mmr)
+            candidates.remove(pick)
+            if used + self.tokens[pick] <= budget:
+                chosen.append(pick)
+                used += self.tokens[pick]
+        return [self.passages[i] for i in sorted(chosen)]
+
+    def to_dict(self) -> dict:
+        return {"version": INDEX_VERSION, "chars": self.chars, "passages": self.passages, "lengths": self.lengths,
+                "tokens": self.tokens, "postings": self.postings}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        index = cls()
+        if data.get("version") != INDEX_VERSION:
+            return index
+        index.chars = data["chars"]
+        index.passages = data["passages"]
+        index.lengths = data["lengths"]
+        index.tokens = data["tokens"]
+        index.postings = data["postings"]
+        return index
+
+
+_lock = threading.Lock()
+_indexes = OrderedDict()  # "doc:<hash>" or "text:<sha256>" -> PassageIndex, a small LRU
+_INDEX_CACHE_SIZE = 32
+
+
+def _cached(key: str):
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+        return index
+
+
+def _remember(key: str, index: PassageIndex):
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > _INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+
+
+def _material_index(text: str) -> PassageIndex:
+    key = "text:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+    index = _cached(key)
+    if index is None:
+        index = PassageIndex()
+        index.add(text)
+        _remember(key, index)
+    return index
+
+
+def document_index(doc_hash: str):
+    """The stored document's index, loaded from beside its text or built and saved; None if unknown"""
+    if document_store.get(doc_hash) is None:
+        return None
+    text = document_store.get_text(doc_hash)
+    if text is None:
+        return None
+    index = _cached("doc:" + doc_hash)
+    if index is not None and index.chars == len(text):
+        return index
+
+    path = document_store.path_for(doc_hash, ".bm25.json")
+    if index is None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                index = PassageIndex.from_dict(json.load(f))
+        except (OSError, ValueError):
+            index = PassageIndex()
+    if index.chars > len(text):
+        index = PassageIndex()  # the text was replaced by a shorter one
+    if index.chars < len(text):
+        # Index only what was added since the index was last saved
+        index.add(text[index.chars:])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not save retrieval index for {doc_hash}: {e}")
+    _remember("doc:" + doc_hash, index)
+    return index
+
+
+def select_context(text: str, query: str, budget: int) -> str:
+    """`text` if it fits in `budget` tokens, else its passages most relevant to `query`"""
+    if count_tokens(text) <= budget:
+        return text
+    return "\n\n".join(_material_index(text).select(query, budget))
+
+
+def document_context(doc_hash: str, query: str, budget: int):
+    """Passages of a stored document most relevant to `query`, within `budget` tokens; None if unknown"""
+    index = document_index(doc_hash)
+    if index is None:
+        return None
+    return "\n\n".join(index.select(query, budget))
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+
+from app.explanations import normalize_topic
+
+DAY = 86400
+# SM-2: grades run from 0 (blackout) to 5 (perfect recall); below 3 is a lapse
+MIN_GRADE, MAX_GRADE, PASSING_GRADE = 0, 5, 3
+START_EASE = 2.5
+MIN_EASE = 1.3
+
+_CARD_COLUMNS = ("id", "deck_id", "front", "back", "ease", "interval_days", "repetitions", "lapses", "due_at",
+                 "reviewed_at")
+
+
+def schedule(card: dict, grade: int, now: float) -> dict:
+    """The card's SM-2 state after a review graded `grade` at `now`"""
+    ease = max(MIN_EASE, card["ease"] + 0.1 - (MAX_GRADE - grade) * (0.08 + (MAX_GRADE - grade) * 0.02))
+    if grade < PASSING_GRADE:
+        repetitions, interval, lapses = 0, 1.0, card["lapses"] + 1
+    else:
+        repetitions, lapses = card["repetitions"] + 1, card["lapses"]
+        if repetitions == 1:
+            interval = 1.0
+        elif repetitions == 2:
+            interval = 6.0
+        else:
+            interval = float(round(card["interval_days"] * ease))
+    return dict(card, ease=round(ease, 4), interval_days=interval, repetitions=repetitions, lapses=lapses,
+                due_at=now + interval * DAY, reviewed_at=now)
+
+
+class ReviewStore:
+    """Saved flashcard decks and their spaced-repetition schedule, in SQLite.
+
+    A deck is one user's cards for a topic (and source document), so asking
+    for the same cards again is served from the deck instead of the model.
+    The due queue is the (user_id, due_at) index: the next due cards are a
+    range scan from its smallest key, O(log n) to reach however many cards
+    the table holds, and it is shared by every worker.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.reused = 0
+        self.saved = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS decks (
+                        id INTEGER PRIMARY KEY,
+                        user_id TEXT NOT NULL,
+                        topic TEXT NOT NULL,
+                        topic_key TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        UNIQUE (user_id, topic_key, source)
+                    )"""
+                )
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS cards (
+                        id INTEGER PRIMARY KEY,
+                        deck_id INTEGER NOT NULL REFERENCES decks (id),
+                        user_id TEXT NOT NULL,
+                        front TEXT NOT NULL,
+                        back TEXT NOT NULL,
+                        ease REAL NOT NULL,
+                        interval_days REAL NOT NULL DEFAULT 0,
+                        repetitions INTEGER NOT NULL DEFAULT 0,
+                        lapses INTEGER NOT NULL DEFAULT 0,
+                        due_at REAL NOT NULL,
+                        reviewed_at REAL
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cards_due ON cards (user_id, due_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS cards_deck ON cards (deck_id)")
+            self._local.conn = conn
+        return conn
+
+    def _deck_row(self, user_id: str, topic: str, source: str):
+        return self._connect().execute(
+            "SELECT id, topic FROM decks WHERE user_id = ? AND topic_key = ? AND source = ?",
+            (user_id, normalize_topic(topic), source or ""),
+        ).fetchone()
+
+    def _cards(self, deck_id: int):
+        rows = self._connect().execute(
+            f"SELECT {', '.join(_CARD_COLUMNS)} FROM cards WHERE deck_id = ? ORDER BY id", (deck_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_deck(self, user_id: str, topic: str, source: str = None, num_cards: int = 0):
+        """The user's saved deck for a topic, if it holds at least `num_cards` cards"""
+        if not os.path.exists(self.path):
+            return None  # nothing saved yet: don't create an empty store on the read path
+        row = self._deck_row(user_id, topic, source)
+        if row is None:
+            return None
+        cards = self._cards(row["id"])
+        if len(cards) < num_cards:
+            return None
+        self.reused += 1
+        return {"id": row["id"], "topic": row["topic"], "cards": cards}
+
+    def save_cards(self, user_id: str, topic: str, source: str, flashcards, now: float = None):
+        """Add generated cards to the user's deck (creating it) and return the deck.
+
+        Cards whose front is already in the deck are skipped; new cards are
+        due straight away.
+        """
+        now = time.time() if now is None else now
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO decks (user_id, topic, topic_key, source, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, topic, normalize_topic(topic), source or "", now),
+            )
+            deck_id = self._deck_row(user_id, topic, source)["id"]
+            known = {row[0] for row in conn.execute("SELECT front FROM cards WHERE deck_id = ?", (deck_id,))}
+            new = [card for card in flashcards if card["front"] not in known]
+            conn.executemany(
+                "INSERT INTO cards (deck_id, user_id, front, back, ease, due_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(deck_id, user_id, card["front"], card["back"], START_EASE, now) for card in new],
+            )
+        self.saved += 1
+        return {"id": deck_id, "topic": topic, "cards": self._cards(deck_id)}
+
+    def due(self, user_id: str, limit: int, now: float = None):
+        """The user's cards due by `now`, most overdue first"""
+        if not os.path.exists(self.path):
+            return []
+        now = time.time() if now is None else now
+        rows = self._connect().execute(
+            f"SELECT {', '.join(_CARD_COLUMNS)} FROM cards WHERE user_id = ? AND due_at <= ? ORDER BY due_at LIMIT ?",
+            (user_id, now, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def next_due_at(self, user_id: str):
+        """When the user's next card falls due, or None if they have no cards"""
+        if not os.path.exists(self.path):
+            return None
+        return self._connect().execute("SELECT MIN(due_at) FROM cards WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def grade(self, user_id: str, grades, now: float = None):
+        """Apply (card_id, grade) reviews in one transaction; returns (updated cards, unknown ids)"""
+        now = time.time() if now is None else now
+        ids = sorted({card_id for card_id, _ in grades})
+        conn = self._connect()
+        with conn:
+            cards = {}
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT {', '.join(_CARD_COLUMNS)} FROM cards WHERE user_id = ? AND id IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    (user_id, *chunk),
+                ).fetchall()
+                cards.update((row["id"], dict(row)) for row in rows)
+            unknown = [card_id for card_id in ids if card_id not in cards]
+            # Several grades for one card are applied in the order given
+            for card_id, grade in grades:
+                if card_id in cards:
+                    cards[card_id] = schedule(cards[card_id], grade, now)
+            conn.executemany(
+                """UPDATE cards SET ease = ?, interval_days = ?, repetitions = ?, lapses = ?, due_at = ?,
+                   reviewed_at = ? WHERE id = ?""",
+                [(c["ease"], c["interval_days"], c["repetitions"], c["lapses"], c["due_at"], c["reviewed_at"], c["id"])
+                 for c in cards.values()],
+            )
+        return list(cards.values()), unknown
+
+    def stats(self) -> dict:
+        return {"decks_reused": self.reused, "decks_saved": self.saved}
+
+
+review_store = ReviewStore(os.getenv("REVIEW_STORE_PATH", "data/reviews.sqlite3"))
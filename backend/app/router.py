@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from collections import deque
+
+from app.explanations import normalize_difficulty
+from app.scheduler import is_retryable
+
+# Model tiers, most preferred first. Short structured calls go to the fast
+# tier; long Hard explanations to the strong one.
+TIER_MODELS = {
+    "flash": [m.strip() for m in os.getenv("GEMINI_FLASH_MODELS", "gemini-2.0-flash,gemini-1.5-flash").split(",") if m.strip()],
+    "pro": [m.strip() for m in os.getenv("GEMINI_PRO_MODELS", "gemini-1.5-pro").split(",") if m.strip()],
+}
+ENDPOINT_TIERS = {
+    "explain": {"Easy": "flash", "Medium": "flash", "Hard": "pro"},
+    "summary": "flash",
+    "summary_map": "flash",
+    "summary_reduce": "flash",
+    "quiz": "flash",
+    "quiz_batch": "flash",
+    "flashcards": "flash",
+    "flashcards_batch": "flash",
+}
+
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", 300))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", 5))
+# A model is unhealthy above this error rate over the window...
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", 0.3))
+# ...and demoted behind a healthy alternative whose p95 is this many times lower
+ROUTER_SLOW_FACTOR = float(os.getenv("ROUTER_SLOW_FACTOR", 2.0))
+
+_MODEL_SPECIFIC_ERRORS = ("NotFound", "PermissionDenied", "FailedPrecondition")
+
+
+def should_try_next(error: Exception) -> bool:
+    """Errors another model might not have: quota, server, timeout or model-not-found"""
+    return is_retryable(error) or isinstance(error, TimeoutError) or type(error).__name__ in _MODEL_SPECIFIC_ERRORS
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ModelStats:
+    """Rolling latency and error record of one model over ROUTER_WINDOW_SECONDS"""
+
+    def __init__(self, max_samples: int = 500):
+        self._samples = deque(maxlen=max_samples)  # (timestamp, seconds, ok)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool):
+        self._samples.append((time.monotonic(), seconds, ok))
+        self.calls += 1
+        self.errors += not ok
+
+    def snapshot(self) -> dict:
+        cutoff = time.monotonic() - ROUTER_WINDOW_SECONDS
+        recent = [(seconds, ok) for stamp, seconds, ok in self._samples if stamp >= cutoff]
+        latencies = [seconds for seconds, ok in recent if ok]
+        errors = sum(1 for _, ok in recent if not ok)
+        error_rate = errors / len(recent) if recent else 0.0
+        return {
+            "samples": len(recent),
+            "error_rate": round(error_rate, 4),
+            "p50_seconds": round(_percentile(latencies, 0.5), 4),
+            "p95_seconds": round(_percentile(latencies, 0.95), 4),
+            "healthy": len(recent) < ROUTER_MIN_SAMPLES or error_rate <= ROUTER_MAX_ERROR_RATE,
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
+
+class ModelRouter:
+    """Picks models per endpoint and difficulty, ordered by health and latency.
+
+    ladder() starts with the route's preferred tier, then the other tiers, then
+    the model found by discovery. Unhealthy models go to the end, and a model
+    ROUTER_SLOW_FACTOR slower than the fastest healthy one moves right behind
+    it; once its samples leave the window, the model gets its place back. Model instances come from `factory` (by default
+    genai.GenerativeModel), which tests and benchmarks can replace.
+    """
+
+    def __init__(self, factory=None):
+        self.factory = factory
+        self.default_model = None
+        self.available = None  # model names known to support generateContent, if listed
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def tier_for(self, endpoint: str, difficulty: str = None) -> str:
+        route = ENDPOINT_TIERS.get(endpoint, "flash")
+        if isinstance(route, dict):
+            # Same levels as the prompts: "easy" is Easy, anything unknown is Hard
+            return route[normalize_difficulty(difficulty or "Hard")]
+        return route
+
+    def set_available(self, names):
+        self.available = set(names) if names is not None else None
+
+    def candidates(self, tier: str):
+        names = list(TIER_MODELS.get(tier, []))
+        for other, models in TIER_MODELS.items():
+            if other != tier:
+                names.extend(models)
+        if self.available is not None:
+            names = [name for name in names if name in self.available]
+        if self.default_model:
+            names.append(self.default_model)
+        return list(dict.fromkeys(names))
+
+    def preferred(self, tier: str):
+        """First configured model of a tier (stable across health changes, used in cache keys)"""
+        names = self.candidates(tier)
+        return names[0] if names else None
+
+    def ladder(self, tier: str):
+        """Models to try for a tier, best first"""
+        names = self.candidates(tier)
+        snapshots = {name: self.stats_for(name).snapshot() for name in names}
+        measured = [(s["p95_seconds"], position) for position, s in enumerate(snapshots.values())
+                    if s["healthy"] and s["samples"] >= ROUTER_MIN_SAMPLES and s["p95_seconds"] > 0]
+        fastest, fastest_position = min(measured) if measured else (None, None)
+
+        def rank(item):
+            position, name = item
+            snapshot = snapshots[name]
+            if not snapshot["healthy"]:
+                return (1, position)
+            if (
+                fastest is not None
+                and position < fastest_position
+                and snapshot["samples"] >= ROUTER_MIN_SAMPLES
+                and snapshot["p95_seconds"] > ROUTER_SLOW_FACTOR * fastest
+            ):
+                return (0, fastest_position + 0.5)  # right behind the faster model
+            return (0, position)
+
+        return [name for _, name in sorted(enumerate(names), key=rank)]
+
+    def model(self, name: str):
+        with self._lock:
+            instance = self._models.get(name)
+            if instance is None:
+                if self.factory is None:
+                    import google.generativeai as genai
+                    self.factory = genai.GenerativeModel
+                instance = self._models[name] = self.factory(name)
+            return instance
+
+    def stats_for(self, name: str) -> ModelStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(name, ModelStats())
+        return stats
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.stats_for(name).record(seconds, ok)
+
+    def reset(self, factory=None):
+        """Drop model instances (e.g. after the factory or API key changed)"""
+        with self._lock:
+            self._models.clear()
+            if factory is not None:
+                self.factory = factory
+
+    def stats(self) -> dict:
+        return {
+            "tiers": {tier: self.ladder(tier) for tier in TIER_MODELS},
+            "models": {name: stats.snapshot() for name, stats in list(self._stats.items())},
+        }
+
+
+router = ModelRouter()
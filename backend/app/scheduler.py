@@ -0,0 +1,292 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Lower numbers are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BATCH = 10
+
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_DEFAULT: "default", PRIORITY_BATCH: "batch"}
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for quota (429) and server-side (5xx) errors from the Gemini client"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in _RETRYABLE_STATUS
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                                    "InternalServerError", "DeadlineExceeded", "BadGateway")
+
+
+class TokenBucket:
+    """Continuously refilled bucket; `rate_per_minute` is also its burst capacity"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            missing = amount - self._tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        with self._lock:
+            self._refill()
+            self._tokens -= min(amount, self.capacity)
+
+
+class _WaitStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=1000)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent)
+        p95 = recent[int(len(recent) * 0.95) - 1] if recent else 0.0
+        return {
+            "count": self.count,
+            "avg_seconds": round(self.total / self.count, 4) if self.count else 0.0,
+            "p95_seconds": round(p95, 4),
+            "max_seconds": round(self.max, 4),
+        }
+
+
+class Admission:
+    """The priority of one call, which CallScheduler.raise_priority() can raise while it waits"""
+
+    def __init__(self, priority: int = PRIORITY_DEFAULT):
+        self.priority = priority
+        self._entry = None  # its heap entry while queued
+
+
+class CallScheduler:
+    """Admits Gemini calls in priority order within RPM/TPM quotas and a concurrency limit.
+
+    Calls that fail with 429/5xx are retried with full-jitter exponential
+    backoff and re-queued at their original priority.
+    """
+
+    def __init__(self, rpm: float, tpm: float, max_concurrency: int, max_attempts: int = 4,
+                 base_delay: float = 0.5, max_delay: float = 8.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._loop = None
+        self._wakeup = None
+        self._dispatcher = None
+
+        self.submitted = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self._waits = {}
+
+    # --- admission ---
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. after a restart in tests)
+            self._loop = loop
+            self._heap = []
+            self._running = 0
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            while self._heap and self._heap[0][3].done():
+                heapq.heappop(self._heap)  # waiter went away
+            if not self._heap or self._running >= self.max_concurrency:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            priority, _, amount, future, enqueued_at = self._heap[0]
+            delay = max(self.requests.delay(1), self.tokens.delay(amount))
+            if delay > 0:
+                # Re-check early if something with a higher priority arrives
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._heap)
+            self.requests.take(1)
+            self.tokens.take(amount)
+            self._running += 1
+            self._waits.setdefault(priority, _WaitStats()).add(time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    async def _acquire(self, priority: int, amount: float, admission: Admission = None):
+        self._ensure_dispatcher()
+        future = self._loop.create_future()
+        entry = (priority, next(self._seq), amount, future, time.monotonic())
+        heapq.heappush(self._heap, entry)
+        if admission is not None:
+            admission._entry = entry
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # admitted just as we were cancelled
+            raise
+
+    def _release(self):
+        self._running -= 1
+        self._wakeup.set()
+
+    def raise_priority(self, admission: Admission, priority: int):
+        """Move a call to `priority` if that is more urgent, including any retry it makes later"""
+        if priority >= admission.priority:
+            return
+        admission.priority = priority
+        entry = admission._entry
+        if entry is not None and not entry[3].done() and self._wakeup is not None:
+            # The old entry shares the future, so it is skipped once this one is admitted
+            _, _, amount, future, enqueued_at = entry
+            admission._entry = (priority, next(self._seq), amount, future, enqueued_at)
+            heapq.heappush(self._heap, admission._entry)
+            self._wakeup.set()
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take a slot and quota now if both are free and nobody is queued; never waits.
+
+        For optional extra calls (hedges): they must be paid for like any
+        other call, but are not worth queueing. Pair with release().
+        """
+        self._ensure_dispatcher()
+        if self._running >= self.max_concurrency or any(not entry[3].done() for entry in self._heap):
+            return False
+        if self.requests.delay(1) > 0 or self.tokens.delay(tokens) > 0:
+            return False
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self._running += 1
+        self.submitted += 1
+        return True
+
+    def release(self):
+        """Give back a slot taken with try_acquire()"""
+        self._release()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_DEFAULT, tokens: float = 1):
+        """Hold one admitted slot for the duration of the block (no retries)"""
+        self.submitted += 1
+        await self._acquire(priority, tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # --- execution ---
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if not is_retryable(error):
+            return False
+        if getattr(error, "code", None) == 429:
+            self.throttled += 1
+        if attempt >= self.max_attempts:
+            return False
+        self.retries += 1
+        return True
+
+    async def run(self, fn, priority: int = PRIORITY_DEFAULT, tokens: float = 1, admission: Admission = None):
+        """Await fn() once admitted, retrying quota and server errors.
+
+        With an `admission`, its priority (which may be raised meanwhile) is used instead of `priority`.
+        """
+        self.submitted += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._acquire(admission.priority if admission else priority, tokens, admission)
+            try:
+                return await fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    self.failures += 1
+                    raise
+            finally:
+                self._release()
+            await asyncio.sleep(self._backoff(attempt))
+
+    def run_sync(self, fn, tokens: float = 1):
+        """Blocking variant for worker threads: rate limits and retries, no priority queue"""
+        self.submitted += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            delay = max(self.requests.delay(1), self.tokens.delay(tokens))
+            while delay > 0:
+                time.sleep(delay)
+                delay = max(self.requests.delay(1), self.tokens.delay(tokens))
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    self.failures += 1
+                    raise
+            time.sleep(self._backoff(attempt))
+
+    def stats(self) -> dict:
+        depth = {}
+        seen = set()  # a raised call has a second entry for the same future
+        for priority, _, _, future, _ in sorted(self._heap):
+            if not future.done() and id(future) not in seen:
+                seen.add(id(future))
+                name = _PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+        return {
+            "queue_depth": depth,
+            "running": self._running,
+            "max_concurrency": self.max_concurrency,
+            "submitted": self.submitted,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "wait": {_PRIORITY_NAMES.get(p, str(p)): w.summary() for p, w in sorted(self._waits.items())},
+        }
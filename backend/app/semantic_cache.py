@@ -0,0 +1,288 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from app.explanations import DIFFICULTIES, normalize_difficulty
+from app.fallback import _NON_WORD, _deletes, _stem, _within_one_edit
+
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", 512))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+# Minimum cosine similarity per difficulty; harder levels are more specific, so
+# they need a closer match to reuse an answer
+DEFAULT_THRESHOLDS = {"Easy": 0.85, "Medium": 0.88, "Hard": 0.92}
+
+_STOPWORDS = frozenset("""
+a an and are can define definition describe detail details difference do does explain explained explaining
+explanation for how i in introduction is it me of on overview please tell the to topic what whats why with
+""".split())
+# Core words this long may differ by one edit and still name the same topic
+# ('deadlok'); shorter ones must match exactly ('tree' is not 'trie')
+FUZZY_MIN_LENGTH = 5
+# Common course abbreviations, expanded so 'OS' and 'operating system' share features
+_EXPANSIONS = {
+    "os": "operating system",
+    "dbms": "database management system",
+    "db": "database",
+    "oop": "object oriented programming",
+    "oops": "object oriented programming",
+    "ds": "data structure",
+    "dsa": "data structure algorithm",
+    "ml": "machine learning",
+    "ai": "artificial intelligence",
+    "cn": "computer network",
+    "dl": "deep learning",
+    "nlp": "natural language processing",
+}
+
+
+# Words that place a topic in a subject rather than name it ("deadlock in OS"
+# asks about deadlock); they count for a quarter of a topic word
+_QUALIFIERS = frozenset("""
+operating system computer science programming language network networking database
+software engineering theory algorithm basic concept
+""".split())
+QUALIFIER_WEIGHT = 0.25
+# Programming languages are qualifiers too, but two topics must name the same
+# ones to match ("class in Java" / "class in Python" / "class" are all distinct)
+SUBJECTS = ("java", "python", "javascript", "typescript", "kotlin", "swift", "rust", "ruby", "php", "cpp",
+            "csharp", "golang", "scala", "haskell")
+_SUBJECT_INDEX = {subject: i for i, subject in enumerate(SUBJECTS)}
+
+
+def parse_thresholds(spec: str) -> dict:
+    """'Easy=0.75,Hard=0.9' -> thresholds, defaults for levels not mentioned"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        level, value = part.split("=", 1)
+        thresholds[normalize_difficulty(level)] = float(value)
+    return thresholds
+
+
+def topic_words(topic: str):
+    """Content words of a topic: lower case, abbreviations expanded, plurals folded"""
+    words = []
+    for word in _NON_WORD.sub(" ", topic.lower()).split():
+        for part in _EXPANSIONS.get(word, word).split():
+            if part not in _STOPWORDS:
+                words.append(_stem(part))
+    return words
+
+
+def _bucket(feature: str, dim: int) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little") % dim
+
+
+def _names_topic(word: str) -> bool:
+    return word not in _QUALIFIERS and word not in _SUBJECT_INDEX
+
+
+def subjects(words) -> np.ndarray:
+    """Which SUBJECTS a topic's words name, as a boolean vector"""
+    flags = np.zeros(len(SUBJECTS), dtype=bool)
+    for word in words:
+        if word in _SUBJECT_INDEX:
+            flags[_SUBJECT_INDEX[word]] = True
+    return flags
+
+
+def core_words(words) -> tuple:
+    """The words that name a topic, in order: its content words without qualifiers or subjects"""
+    return tuple(dict.fromkeys(filter(_names_topic, words)))
+
+
+def _same_word(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    return min(len(a), len(b)) >= FUZZY_MIN_LENGTH and _within_one_edit(a, b)
+
+
+def _covers(a: tuple, b: tuple) -> bool:
+    return all(any(_same_word(word, other) for other in b) for word in a)
+
+
+def same_topic_words(a: tuple, b: tuple) -> bool:
+    """Each topic's core words all appear in the other, allowing a typo in long
+    words, or both spell the same words with different spacing ('dead lock').
+
+    Similarity alone is not enough: 'binary search' is close to 'binary
+    search tree' but asks about something else.
+    """
+    return (_covers(a, b) and _covers(b, a)) or "".join(a) == "".join(b)
+
+
+def embed(words, dim: int = SEMANTIC_CACHE_DIM) -> np.ndarray:
+    """Hashed bag of a topic's words and their character trigrams, with sublinear term frequency"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in words:
+        weight = 1.0 if _names_topic(word) else QUALIFIER_WEIGHT
+        vector[_bucket(word, dim)] += weight
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            vector[_bucket(padded[i:i + 3], dim)] += 0.5 * weight
+    np.log1p(vector, out=vector)
+    return vector
+
+
+class _Index:
+    """Embeddings of one difficulty level: a ring buffer of rows in a NumPy matrix"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        self.matrix = np.zeros((min(capacity, 64), dim), dtype=np.float32)
+        self.subjects = np.zeros((len(self.matrix), len(SUBJECTS)), dtype=bool)
+        self.df = np.zeros(dim, dtype=np.float32)  # rows with a non-zero value per feature
+        self.keys = []
+        self.words = []  # core_words() of each row's topic
+        self.next = 0  # row to overwrite once full
+        self.vocabulary = {}  # core word -> number of rows using it
+        self._variants = {}  # core word or single-deletion variant -> {core word}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _count_words(self, words: tuple, delta: int):
+        for word in words:
+            count = self.vocabulary.get(word, 0) + delta
+            if count > 0:
+                self.vocabulary[word] = count
+                if count == delta:
+                    for key in {word} | (_deletes(word) if len(word) >= FUZZY_MIN_LENGTH else set()):
+                        self._variants.setdefault(key, set()).add(word)
+                continue
+            del self.vocabulary[word]
+            for key in {word} | (_deletes(word) if len(word) >= FUZZY_MIN_LENGTH else set()):
+                self._variants[key].discard(word)
+                if not self._variants[key]:
+                    del self._variants[key]
+
+    def spell(self, words) -> list:
+        """`words` spelled as this index knows them: split words that it has seen
+        joined are joined ('dead lock'), and an unknown word within one edit of
+        a known one becomes that word ('deadlok')"""
+        spelled = []
+        i = 0
+        while i < len(words):
+            word = words[i]
+            if i + 1 < len(words) and word + words[i + 1] in self.vocabulary:
+                spelled.append(word + words[i + 1])
+                i += 2
+                continue
+            if word not in self.vocabulary and len(word) >= FUZZY_MIN_LENGTH and _names_topic(word):
+                near = {known for key in {word} | _deletes(word) for known in self._variants.get(key, ())}
+                # The most used candidate, then alphabetical so the choice is stable
+                near = sorted((k for k in near if _within_one_edit(word, k)), key=lambda k: (-self.vocabulary[k], k))
+                word = near[0] if near else word
+            spelled.append(word)
+            i += 1
+        return spelled
+
+    def add(self, vector: np.ndarray, flags: np.ndarray, words: tuple, key: str):
+        if len(self.keys) < self.capacity:
+            row = len(self.keys)
+            if row == len(self.matrix):
+                size = min(self.capacity, 2 * row)
+                self.matrix = np.resize(self.matrix, (size, self.matrix.shape[1]))
+                self.subjects = np.resize(self.subjects, (size, len(SUBJECTS)))
+            self.keys.append(key)
+            self.words.append(words)
+        else:
+            row = self.next
+            self.next = (row + 1) % self.capacity
+            self.df -= self.matrix[row] > 0
+            self._count_words(self.words[row], -1)
+            self.keys[row] = key
+            self.words[row] = words
+        self._count_words(words, 1)
+        self.matrix[row] = vector
+        self.subjects[row] = flags
+        self.df += vector > 0
+
+    def search(self, vector: np.ndarray, flags: np.ndarray, words: tuple, candidates: int = 8):
+        """(row, cosine similarity) of the closest entry under smoothed IDF weights
+        that names the same subjects and the same topic words; (None, -1.0) if none"""
+        count = len(self.keys)
+        idf2 = np.square(np.log((1.0 + count) / (1.0 + self.df)) + 1.0)
+        matrix = self.matrix[:count]
+        # cos(M*idf, q*idf) without materializing the weighted matrix
+        dots = matrix @ (vector * idf2)
+        norms = np.sqrt(np.einsum("ij,ij,j->i", matrix, matrix, idf2) * float(np.dot(vector * vector, idf2)))
+        scores = dots / np.where(norms > 0, norms, 1.0)
+        # Rows naming other subjects than the query (or none where it names one) are ruled out
+        scores[(self.subjects[:count] != flags).any(axis=1)] = -1.0
+        top = np.argsort(-scores)[:candidates]
+        for row in map(int, top):
+            if scores[row] < 0:
+                break
+            if same_topic_words(words, self.words[row]):
+                return row, float(scores[row])
+        return None, -1.0
+
+
+class SemanticCache:
+    """Maps a topic to the response-cache key of a near-identical earlier request.
+
+    Only keys are kept here; the text itself stays in the response cache, so
+    memory is bounded by that cache and an evicted response simply misses.
+    """
+
+    def __init__(self, thresholds: dict = None, dim: int = SEMANTIC_CACHE_DIM,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.thresholds = thresholds or dict(DEFAULT_THRESHOLDS)
+        self.dim = dim
+        self._indexes = {level: _Index(dim, max_entries) for level in DIFFICULTIES}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, topic: str, difficulty: str):
+        """Cache key of the closest earlier request above the level's threshold, or None"""
+        level = normalize_difficulty(difficulty)
+        words = topic_words(topic)
+        with self._lock:
+            index = self._indexes[level]
+            if not len(index) or not words:
+                self.misses += 1
+                return None
+            # Scored as the index spells the words, so a typo costs no similarity
+            words = index.spell(words)
+            row, score = index.search(embed(words, self.dim), subjects(words), core_words(words))
+            if row is None or score < self.thresholds[level]:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return index.keys[row]
+
+    def add(self, topic: str, difficulty: str, key: str):
+        words = topic_words(topic)
+        if not words:
+            return
+        with self._lock:
+            index = self._indexes[normalize_difficulty(difficulty)]
+            words = index.spell(words)
+            vector = embed(words, self.dim)
+            flags = subjects(words)
+            core = core_words(words)
+            if len(index):
+                row, score = index.search(vector, flags, core)
+                if row is not None and score > 0.999:
+                    index.keys[row] = key  # same topic: point at the newest response
+                    return
+            index.add(vector, flags, core, key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": {level: len(index) for level, index in self._indexes.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def create_semantic_cache():
+    """SemanticCache configured by SEMANTIC_CACHE* variables, or None when disabled"""
+    if os.getenv("SEMANTIC_CACHE", "on").lower() in ("off", "none", "0", "false"):
+        return None
+    return SemanticCache(parse_thresholds(os.getenv("SEMANTIC_CACHE_THRESHOLDS", "")))
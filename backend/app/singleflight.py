@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) starts the work; callers arriving
+    while it is still running wait on the same result instead of repeating it.
+    Nothing is remembered once the call finishes - that is the cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}  # key -> asyncio.Task
+        self._contexts = {}  # key -> the leader's context
+        self._futures = {}  # key -> concurrent.futures.Future
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do_async(self, key: str, fn, context=None, on_join=None):
+        """Await fn() once per key across concurrent callers; fn returns a coroutine.
+
+        The leader's `context` is handed to on_join(context) of every caller
+        that joins it (e.g. to raise the shared call's priority).
+        """
+        joined = False
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._tasks[key] = task
+                self._contexts[key] = context
+                task.add_done_callback(lambda t, key=key: self._forget_task(key, t))
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+                joined, leader_context = True, self._contexts.get(key)
+        if joined and on_join is not None:
+            on_join(leader_context)
+        # shield: a caller that goes away must not cancel the work others wait on
+        return await asyncio.shield(task)
+
+    def do(self, key: str, fn):
+        """Blocking variant of do_async for code running in worker threads"""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._futures[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def _forget_task(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+                self._contexts.pop(key, None)
+        # Mark the exception as retrieved if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = self.leaders + self.coalesced
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._tasks) + len(self._futures),
+                "coalesce_ratio": round(self.coalesced / calls, 4) if calls else 0.0,
+            }
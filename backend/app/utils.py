@@ -1,12 +1,162 @@
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
 from pypdf import PdfReader
 from fastapi import UploadFile
 
-async def extract_text_from_pdf(file: UploadFile):
+from app.metrics import pdf_page_seconds
+
+# Pages are extracted in batches of PDF_PAGES_PER_TASK on a process pool, so
+# large PDFs are parsed in parallel and never on the event loop.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+
+_pool = None
+
+
+@dataclass
+class PdfPage:
+    number: int  # 1-based page number
+    text: str
+    seconds: float
+
+
+@dataclass
+class PdfExtraction:
+    pages: List[PdfPage] = field(default_factory=list)
+    total_pages: int = 0
+    truncated: bool = False
+    seconds: float = 0.0
+
+    @property
+    def text(self) -> str:
+        # Blank line between pages so chunking can split on page boundaries
+        return "\n\n".join(page.text for page in self.pages)
+
+    def timing(self) -> dict:
+        """Per-page extraction timing summary"""
+        slowest = max(self.pages, key=lambda page: page.seconds, default=None)
+        return {
+            "pages_extracted": len(self.pages),
+            "total_pages": self.total_pages,
+            "truncated": self.truncated,
+            "seconds": round(self.seconds, 4),
+            "page_seconds": [round(page.seconds, 4) for page in self.pages],
+            "slowest_page": slowest.number if slowest else None,
+        }
+
+
+# --- Worker-side helpers (run inside the process pool or a thread) ---
+
+_worker_reader = (None, None)
+
+
+def _open_reader(path: str) -> PdfReader:
+    # Each worker process keeps the last document open so consecutive batches
+    # of the same PDF do not re-parse its cross-reference table. Only pool
+    # processes (one task at a time) may use this: threads share the global.
+    global _worker_reader
+    if _worker_reader[0] != path:
+        _worker_reader = (path, PdfReader(path))
+    return _worker_reader[1]
+
+
+def _count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _extract_pages(path: str, start: int, stop: int, cached: bool = True):
+    """Extract (index, text, seconds) for pages [start, stop) of a PDF"""
+    reader = _open_reader(path) if cached else PdfReader(path)
+    results = []
+    for index in range(start, min(stop, len(reader.pages))):
+        started = time.perf_counter()
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception:
+            text = ""
+        results.append((index, text, time.perf_counter() - started))
+    return results
+
+
+# --- Event-loop side ---
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+    return _pool
+
+
+def shutdown_pdf_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+async def iter_pdf_pages(path: str, max_chars: Optional[int] = None, total_pages: Optional[int] = None):
+    """Yield PdfPage objects in order, stopping once max_chars have been produced.
+
+    Batches of pages are dispatched PDF_EXTRACT_WORKERS at a time ahead of the
+    consumer; nothing past the character budget is scheduled.
+    """
+    loop = asyncio.get_running_loop()
+    if total_pages is None:
+        total_pages = await loop.run_in_executor(None, _count_pages, path)
+    # Small documents are not worth the process hop
+    executor = _get_pool() if total_pages > PDF_PAGES_PER_TASK else None
+
+    batches = [(start, start + PDF_PAGES_PER_TASK) for start in range(0, total_pages, PDF_PAGES_PER_TASK)]
+    pending = []
+    produced = 0
+    try:
+        while batches or pending:
+            while batches and len(pending) < PDF_EXTRACT_WORKERS:
+                start, stop = batches.pop(0)
+                pending.append(loop.run_in_executor(executor, _extract_pages, path, start, stop, executor is not None))
+            for index, text, seconds in await pending.pop(0):
+                pdf_page_seconds.observe(seconds)
+                yield PdfPage(index + 1, text, seconds)
+                produced += len(text)
+                if max_chars is not None and produced >= max_chars:
+                    return
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def extract_pdf(file: UploadFile, max_chars: Optional[int] = None) -> PdfExtraction:
+    """Extract text from an uploaded PDF off the event loop, with per-page timing"""
+    return await extract_pdf_bytes(await file.read(), max_chars)
+
+
+async def extract_pdf_bytes(data: bytes, max_chars: Optional[int] = None) -> PdfExtraction:
+    """Extract text from PDF bytes off the event loop, with per-page timing"""
+    started = time.perf_counter()
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        extraction = PdfExtraction()
+        extraction.total_pages = await asyncio.get_running_loop().run_in_executor(None, _count_pages, path)
+        async for page in iter_pdf_pages(path, max_chars, extraction.total_pages):
+            extraction.pages.append(page)
+        extraction.truncated = len(extraction.pages) < extraction.total_pages
+        extraction.seconds = time.perf_counter() - started
+        return extraction
+    finally:
+        os.remove(path)
+
+
+async def extract_text_from_pdf(file: UploadFile, max_chars: Optional[int] = None):
     try:
-        reader = PdfReader(file.file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() if page.extract_text() else ""
-        return text
+        extraction = await extract_pdf(file, max_chars)
+        return extraction.text
     except Exception as e:
         return ""
@@ -0,0 +1,177 @@
+"""Pre-generate explanations for a syllabus of common topics.
+
+    cd backend && python -m app.warmup syllabus.txt [--rpm 6] [--difficulties Easy,Hard]
+
+The syllabus has one topic per line; blank lines and lines starting with '#'
+are ignored. Each (topic, difficulty) pair that is not stored yet is generated
+at batch priority, no faster than --rpm, and saved to the explanation store,
+from which get_explanation and the offline fallback serve it directly.
+
+With WARMUP_SYLLABUS set, the server runs the same job in the background,
+only during the WARMUP_HOURS window (local time, e.g. "1-6" or "22-5").
+Runs hold a lock on WARMUP_LOCK_PATH, so of several server workers (and a
+command-line run) only one warms the store at a time.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+
+from app import ai_service
+from app.explanations import DIFFICULTIES, explanation_store, normalize_difficulty
+from app.postprocess import clean_response
+from app.router import router
+from app.scheduler import PRIORITY_BATCH, TokenBucket
+
+try:
+    import fcntl  # POSIX only; elsewhere the server runs a single process anyway
+except ImportError:
+    fcntl = None
+
+WARMUP_SYLLABUS = os.getenv("WARMUP_SYLLABUS")
+WARMUP_RPM = float(os.getenv("WARMUP_RPM", 6))
+WARMUP_HOURS = os.getenv("WARMUP_HOURS", "1-6")
+WARMUP_LOCK_PATH = os.getenv("WARMUP_LOCK_PATH", "data/warmup.lock")
+# Batch calls queue behind interactive ones, so they get longer than the
+# interactive "explain" deadline
+WARMUP_DEADLINE = float(os.getenv("WARMUP_DEADLINE", 900))
+_LOCK_RETRY_SECONDS = 600
+
+
+def load_syllabus(path: str):
+    """Topics listed in a syllabus file, in order and without duplicates"""
+    topics = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            topic = line.strip()
+            if topic and not topic.startswith("#") and topic.lower() not in seen:
+                seen.add(topic.lower())
+                topics.append(topic)
+    return topics
+
+
+def parse_hours(spec: str):
+    """'1-6' -> (1, 6): the window starts at 01:00 and ends at 06:00"""
+    start, end = (int(part) % 24 for part in spec.split("-", 1))
+    return start, end
+
+
+def seconds_until_window(hours, now: datetime.datetime = None) -> float:
+    """0 inside the off-peak window, else the seconds until it next opens"""
+    now = now or datetime.datetime.now()
+    start, end = hours
+    hour = now.hour
+    inside = start <= hour < end if start <= end else hour >= start or hour < end
+    if inside:
+        return 0.0
+    opens = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if opens <= now:
+        opens += datetime.timedelta(days=1)
+    return (opens - now).total_seconds()
+
+
+def acquire_lock(path: str = WARMUP_LOCK_PATH):
+    """Open file holding an exclusive lock on `path`, or None if another process has it.
+
+    The lock goes with the file: closing it, or the process exiting, releases it.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock = open(path, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+    return lock
+
+
+async def warm(topics, difficulties=DIFFICULTIES, rpm: float = WARMUP_RPM, force: bool = False, hours=None):
+    """Generate and store every missing explanation; returns counts by outcome, or None if
+    another process is already warming up"""
+    lock = acquire_lock()
+    if lock is None:
+        return None
+    try:
+        return await _warm_locked(topics, difficulties, rpm, force, hours)
+    finally:
+        lock.close()
+
+
+async def _warm_locked(topics, difficulties, rpm: float, force: bool, hours):
+    counts = {"generated": 0, "skipped": 0, "failed": 0}
+    if not await ai_service.get_model_async():
+        print("Warm-up skipped: no Gemini model available")
+        return counts
+
+    budget = TokenBucket(rpm)
+    for topic in topics:
+        for difficulty in difficulties:
+            if not force and explanation_store.has(topic, difficulty):
+                counts["skipped"] += 1
+                continue
+            if hours is not None:
+                await asyncio.sleep(seconds_until_window(hours))
+            await asyncio.sleep(budget.delay(1))
+            budget.take(1)
+
+            prompt, max_tokens = ai_service._explanation_prompt(topic, difficulty)
+            try:
+                text = await ai_service._generate_async(
+                    "explain", prompt, {"max_output_tokens": max_tokens}, PRIORITY_BATCH, difficulty, WARMUP_DEADLINE
+                )
+            except Exception as e:
+                print(f"Warm-up failed for {topic!r} ({difficulty}): {e}")
+                counts["failed"] += 1
+                continue
+            model_name = router.preferred(router.tier_for("explain", difficulty)) or ai_service.available_model
+            explanation_store.put(topic, difficulty, clean_response(text), model_name)
+            counts["generated"] += 1
+    return counts
+
+
+async def _warm_in_background(path: str):
+    try:
+        topics = load_syllabus(path)
+    except OSError as e:
+        print(f"Warm-up skipped: could not read syllabus {path}: {e}")
+        return
+    # Another worker holds the lock: try again later in case it stops before finishing
+    while (counts := await warm(topics, hours=parse_hours(WARMUP_HOURS))) is None:
+        await asyncio.sleep(_LOCK_RETRY_SECONDS)
+    print(f"Warm-up finished: {counts}")
+
+
+def start_background_warmup():
+    """Start the off-peak warm-up task if WARMUP_SYLLABUS is set; returns the task or None"""
+    if not WARMUP_SYLLABUS:
+        return None
+    return asyncio.get_running_loop().create_task(_warm_in_background(WARMUP_SYLLABUS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("syllabus", help="file with one topic per line")
+    parser.add_argument("--difficulties", default=",".join(DIFFICULTIES), help="comma-separated levels")
+    parser.add_argument("--rpm", type=float, default=WARMUP_RPM, help="generations per minute")
+    parser.add_argument("--force", action="store_true", help="regenerate stored explanations")
+    parser.add_argument("--off-peak", action="store_true", help=f"only run during WARMUP_HOURS ({WARMUP_HOURS})")
+    args = parser.parse_args()
+
+    difficulties = [normalize_difficulty(level) for level in args.difficulties.split(",") if level.strip()]
+    hours = parse_hours(WARMUP_HOURS) if args.off_peak else None
+    counts = asyncio.run(warm(load_syllabus(args.syllabus), difficulties, args.rpm, args.force, hours))
+    if counts is None:
+        print(f"Another warm-up is running (lock: {WARMUP_LOCK_PATH})")
+        sys.exit(1)
+    print(f"Generated {counts['generated']}, already stored {counts['skipped']}, failed {counts['failed']}")
+    print(f"Store: {explanation_store.stats()}")
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
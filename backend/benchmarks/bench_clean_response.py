@@ -0,0 +1,97 @@
+"""Micro-benchmark: clean_response on realistic ~30 KB model responses.
+
+Compares the original implementation, a fused single-scan alternation of the
+same rules, and the PostProcessor (whole responses and streamed in chunks).
+
+    cd backend && python -m benchmarks.bench_clean_response
+"""
+import argparse
+import random
+import re
+import timeit
+
+from app.postprocess import StreamCleaner, clean_response
+
+
+def legacy_clean_response(text: str) -> str:
+    """clean_response as it was before the PostProcessor (one re.sub per rule)"""
+    import re
+    text = re.sub(r'\$[^$]*\$', '', text)
+    text = re.sub(r'#{4,}', '###', text)
+    text = re.sub(r'\n\* ', '\n• ', text)
+    text = re.sub(r'\*\*', '', text)
+    return text
+
+
+_FUSED = re.compile(r"(\$[^$]*\$|####+|\n\* |\*\*)")
+_FUSED_REPLACEMENTS = {"$": "", "#": "###", "\n": "\n• ", "*": ""}
+
+
+def fused_clean_response(text: str) -> str:
+    """All rules as one alternation, scanned once with re.split"""
+    parts = _FUSED.split(text)
+    parts[1::2] = [_FUSED_REPLACEMENTS[match[0]] for match in parts[1::2]]
+    return "".join(parts)
+
+
+_WORDS = ("process resource lock thread scheduler deadlock memory page allocation "
+          "graph cycle safe state request release mutex semaphore condition").split()
+
+
+def make_response(size: int, seed: int = 0) -> str:
+    """Markdown resembling a Hard explanation: headings, bullets, bold terms, stray math"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    section = 0
+    while length < size:
+        section += 1
+        block = [f"\n#### {section}. {' '.join(rng.choices(_WORDS, k=3)).title()}\n"]
+        for _ in range(rng.randint(3, 8)):
+            sentence = " ".join(rng.choices(_WORDS, k=rng.randint(8, 20)))
+            if rng.random() < 0.5:
+                sentence = sentence.replace(" ", " **", 1).replace(" ", "** ", 2)
+            if rng.random() < 0.1:
+                sentence += " $O(n^2)$"
+            block.append(f"* {sentence}.\n" if rng.random() < 0.6 else f"{sentence}.\n")
+        text = "".join(block)
+        parts.append(text)
+        length += len(text)
+    return "".join(parts)
+
+
+def streamed(text: str, chunk_size: int) -> str:
+    cleaner = StreamCleaner()
+    out = [cleaner.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    out.append(cleaner.flush())
+    return "".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=30000, help="response size in characters")
+    parser.add_argument("--number", type=int, default=200, help="calls per timing run")
+    parser.add_argument("--chunk", type=int, default=64, help="chunk size for the streaming run")
+    args = parser.parse_args()
+
+    text = make_response(args.size)
+    assert clean_response(text) == legacy_clean_response(text), "outputs differ"
+    assert fused_clean_response(text) == legacy_clean_response(text), "fused output differs"
+    assert streamed(text, args.chunk) == clean_response(text), "streamed output differs"
+
+    def best(fn):
+        return min(timeit.repeat(lambda: fn(text), number=args.number, repeat=5)) / args.number
+
+    legacy = best(legacy_clean_response)
+    fused = best(fused_clean_response)
+    engine = best(clean_response)
+    stream = best(lambda t: streamed(t, args.chunk))
+    print(f"response size          {len(text):>10,d} chars")
+    print(f"legacy re.sub x4       {legacy * 1e6:>10.1f} us/call")
+    print(f"fused single scan      {fused * 1e6:>10.1f} us/call  ({legacy / fused:.2f}x)")
+    print(f"PostProcessor          {engine * 1e6:>10.1f} us/call  ({legacy / engine:.2f}x)")
+    print(f"streamed ({args.chunk}B chunks)  {stream * 1e6:>10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
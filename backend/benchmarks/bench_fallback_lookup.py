@@ -0,0 +1,91 @@
+"""Benchmark: fallback topic lookup on a synthetic corpus of many topics.
+
+Compares the old approach (a dict literal scanned with `key in topic_lower`)
+with FallbackCorpus (Aho-Corasick over aliases plus fuzzy word matching over a
+memory-mapped JSONL file).
+
+    cd backend && python -m benchmarks.bench_fallback_lookup --topics 5000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import timeit
+
+from app.fallback import FallbackCorpus
+
+_SYLLABLES = "ka lo mi ne ru sa te vo xi zu bar cen dor fel gam hul jin kor".split()
+
+
+def make_topics(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    topics = set()
+    while len(topics) < count:
+        words = ["".join(rng.choices(_SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        topics.add(" ".join(words))
+    return sorted(topics)
+
+
+def write_corpus(path: str, topics, text_size: int):
+    with open(path, "w", encoding="utf-8") as f:
+        for topic in topics:
+            levels = {level: f"## {topic} ({level})\n\n" + "x" * text_size for level in ("Easy", "Medium", "Hard")}
+            f.write(json.dumps({"topic": topic, "aliases": [f"{topic} basics"], "levels": levels}) + "\n")
+
+
+def legacy_lookup(explanations: dict, topic: str):
+    topic_lower = topic.lower()
+    for key in explanations:
+        if key in topic_lower:
+            return explanations[key]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", type=int, default=5000)
+    parser.add_argument("--text-size", type=int, default=2000, help="characters per explanation level")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    topics = make_topics(args.topics)
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        topic = rng.choice(topics)
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(f"What is {topic}?")
+        elif kind < 0.7:
+            # one typo in the longest word
+            word = max(topic.split(), key=len)
+            i = rng.randrange(len(word))
+            queries.append(topic.replace(word, word[:i] + word[i + 1:]))
+        else:
+            queries.append("unrelated question about nothing in particular")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.jsonl")
+        write_corpus(path, topics, args.text_size)
+        corpus = FallbackCorpus(path)
+        started = time.perf_counter()
+        len(corpus)
+        load = time.perf_counter() - started
+
+        explanations = {topic: {"Medium": "x" * args.text_size} for topic in topics}
+        legacy = min(timeit.repeat(lambda: [legacy_lookup(explanations, q) for q in queries], number=1, repeat=3))
+        indexed = min(timeit.repeat(lambda: [corpus.lookup(q) for q in queries], number=1, repeat=3))
+        found_legacy = sum(legacy_lookup(explanations, q) is not None for q in queries)
+        found_indexed = sum(corpus.lookup(q) is not None for q in queries)
+
+        print(f"corpus                 {len(topics):,d} topics, {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"index load             {load * 1e3:>10.1f} ms")
+        print(f"legacy scan            {legacy / len(queries) * 1e6:>10.1f} us/lookup  ({found_legacy} found)")
+        print(f"FallbackCorpus.lookup  {indexed / len(queries) * 1e6:>10.1f} us/lookup  ({found_indexed} found)")
+        corpus._mmap.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Corpus benchmark: parse success rate and parse time of quiz responses.
+
+Runs the legacy parse_quiz_response and the new parser over the responses in
+data/quiz_responses.jsonl (JSON, fenced/truncated JSON and the text formats
+models fall back to). Each entry records how many complete questions it holds.
+Exits with status 1 if the new parser recovers less than --min-rate of them.
+
+    cd backend && python -m benchmarks.bench_quiz_parser
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from app.quiz_parser import QuizParser, parse_quiz
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "quiz_responses.jsonl")
+
+
+def legacy_parse_quiz_response(response_text: str, num_questions: int):
+    """parse_quiz_response as it was, without the placeholder fallback"""
+    questions = []
+    for block in response_text.split("Question ")[1:]:
+        lines = block.strip().split('\n')
+        if len(lines) < 5:
+            continue
+        question_line = lines[0].split(':', 1)
+        if len(question_line) < 2:
+            continue
+        question_text = question_line[1].strip()
+        options = {}
+        correct_answer = None
+        for line in lines[1:]:
+            line = line.strip()
+            for letter in "ABCD":
+                if line.startswith(f"{letter})") or line.startswith(f"{letter} )"):
+                    options[letter] = line[2:].strip()
+            if 'Correct Answer:' in line:
+                correct_answer = line.split(':')[1].strip().upper()
+        if question_text and len(options) == 4 and correct_answer:
+            questions.append({"question": question_text, "options": options, "correct_answer": correct_answer})
+    return questions[:num_questions]
+
+
+def streamed(text: str, chunk_size: int):
+    parser = QuizParser()
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+    return parser.close()
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(name, parse, corpus, number):
+    recovered = expected = 0
+    failures = []
+    for entry in corpus:
+        got = len(parse(entry["text"]))
+        recovered += min(got, entry["expected"])
+        expected += entry["expected"]
+        if got != entry["expected"]:
+            failures.append(f"{entry['name']} ({got}/{entry['expected']})")
+    seconds = min(timeit.repeat(
+        lambda: [parse(entry["text"]) for entry in corpus], number=number, repeat=5
+    )) / number / len(corpus)
+    rate = recovered / expected if expected else 1.0
+    print(f"{name:<22} {rate:>7.1%} questions  {seconds * 1e6:>8.1f} us/response")
+    for failure in failures:
+        print(f"    mismatch: {failure}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--number", type=int, default=200, help="corpus passes per timing run")
+    parser.add_argument("--chunk", type=int, default=16, help="chunk size for the streaming run")
+    parser.add_argument("--min-rate", type=float, default=0.95, help="required success rate")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    print(f"corpus                 {len(corpus)} responses, {sum(e['expected'] for e in corpus)} questions")
+    evaluate("legacy parser", lambda text: legacy_parse_quiz_response(text, 10), corpus, args.number)
+    rate = evaluate("parse_quiz", lambda text: parse_quiz(text, 10), corpus, args.number)
+    streamed_rate = evaluate(f"streamed ({args.chunk}B chunks)", lambda text: streamed(text, args.chunk), corpus, args.number)
+    if min(rate, streamed_rate) < args.min_rate:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Local stand-in for the Gemini API, for load tests and benchmarks.
+
+FakeGemini is a model factory (see ai_service.use_model_factory): the models
+it builds answer generate_content / generate_content_async, streamed or not,
+after a simulated delay - a log-normal time to first token plus the output
+tokens at a fixed throughput - and fail with the Gemini client's own 503 and
+429 errors at a given rate. Answers have the shape each endpoint parses
+(JSON quiz arrays, "Card N" flashcards, prose otherwise).
+
+Every draw comes from a generator seeded by (seed, model, prompt, call number),
+so a run makes the same decisions whatever order concurrent calls arrive in.
+
+The fake lives in-process rather than behind a local HTTP server: the client
+talks gRPC by default, so a fake REST endpoint would not exercise production's
+transport either, and a network hop only adds noise to runs compared across
+commits. Client serialization and request_options timeouts are not measured.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from google.api_core import exceptions
+
+_WORDS = """process thread memory page cache lock queue stack heap tree graph node edge index table
+query schedule kernel buffer signal socket packet route protocol layer model state event""".split()
+
+
+class FakeGemini:
+    """Model factory with a configurable latency distribution, error rate and token throughput.
+
+    ttft_ms / sigma: median and log-normal spread of the time to first token
+    tokens_per_second: output speed after the first token
+    error_rate / throttle_rate: share of calls failing with 503 / 429
+    model_latency: optional {model name: multiplier}, e.g. to make one model slow
+    """
+
+    def __init__(self, ttft_ms: float = 300, sigma: float = 0.5, tokens_per_second: float = 2000,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, seed: int = 0, model_latency: dict = None):
+        self.ttft = ttft_ms / 1000
+        self.sigma = sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self.model_latency = model_latency or {}
+        self.calls = 0
+        self.errors = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, model_name: str):
+        return FakeModel(self, model_name)
+
+    def plan(self, model_name: str, prompt: str, generation_config):
+        """(first token delay, output tokens, seconds per token, error or None) for one call"""
+        with self._lock:
+            self.calls += 1
+            n = self._seen[(model_name, prompt)] = self._seen.get((model_name, prompt), 0) + 1
+        digest = hashlib.blake2b(f"{self.seed}:{model_name}:{n}:{prompt}".encode("utf-8"), digest_size=8)
+        rng = random.Random(digest.digest())
+
+        draw = rng.random()
+        if draw < self.error_rate:
+            error = exceptions.ServiceUnavailable("fake: model overloaded")
+        elif draw < self.error_rate + self.throttle_rate:
+            error = exceptions.ResourceExhausted("fake: quota exceeded")
+        else:
+            error = None
+        if error is not None:
+            with self._lock:
+                self.errors += 1
+
+        scale = self.model_latency.get(model_name, 1.0)
+        ttft = self.ttft * scale * math.exp(rng.gauss(0, self.sigma))
+        max_tokens = (generation_config or {}).get("max_output_tokens", 1000)
+        tokens = max(16, int(max_tokens * rng.uniform(0.4, 0.9)))
+        return ttft, tokens, scale / self.tokens_per_second, error
+
+
+def fake_answer(prompt: str, tokens: int) -> str:
+    """Text in the format the prompt asks for, about `tokens` tokens long"""
+    rng = random.Random(len(prompt))
+    if "JSON array" in prompt:
+        count = max(1, tokens // 120)
+        return json.dumps([
+            {
+                "question": f"Question {i}: which {rng.choice(_WORDS)} is correct?",
+                "options": {letter: f"{rng.choice(_WORDS)} {letter}" for letter in "ABCD"},
+                "correct_answer": rng.choice("ABCD"),
+            }
+            for i in range(1, count + 1)
+        ])
+    if "Front:" in prompt:
+        count = max(1, tokens // 60)
+        return "\n\n".join(
+            f"Card {i}\nFront: What is a {rng.choice(_WORDS)}?\nBack: A {rng.choice(_WORDS)} of {rng.choice(_WORDS)}s."
+            for i in range(1, count + 1)
+        )
+    words = [rng.choice(_WORDS) for _ in range(int(tokens / 1.3))]
+    lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return "\n".join(f"* **{line}**" if i % 4 == 0 else line for i, line in enumerate(lines))
+
+
+def _response(text: str, prompt: str):
+    usage = SimpleNamespace(prompt_token_count=max(1, len(prompt) // 4), candidates_token_count=max(1, len(text) // 4))
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+class FakeModel:
+    def __init__(self, gemini: FakeGemini, model_name: str):
+        self.gemini = gemini
+        self.model_name = model_name
+
+    def _chunks(self, text: str, tokens: int):
+        size = max(1, len(text) // max(1, tokens // 20))  # about 20 tokens per chunk
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        ttft, tokens, per_token, error = self.gemini.plan(self.model_name, prompt, generation_config)
+        time.sleep(ttft)
+        if error is not None:
+            raise error
+        text = fake_answer(prompt, tokens)
+        if not stream:
+            time.sleep(tokens * per_token)
+            return _response(text, prompt)
+
+        def chunks():
+            parts = self._chunks(text, tokens)
+            for part in parts:
+                time.sleep(tokens * per_token / len(parts))
+                yield _response(part, prompt)
+        return chunks()
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        ttft, tokens, per_token, error = self.gemini.plan(self.model_name, prompt, generation_config)
+        await asyncio.sleep(ttft)
+        if error is not None:
+            raise error
+        text = fake_answer(prompt, tokens)
+        if not stream:
+            await asyncio.sleep(tokens * per_token)
+            return _response(text, prompt)
+
+        async def chunks():
+            parts = self._chunks(text, tokens)
+            for part in parts:
+                await asyncio.sleep(tokens * per_token / len(parts))
+                yield _response(part, prompt)
+        return chunks()
@@ -0,0 +1,183 @@
+"""Load test: throughput and latency per endpoint against main.app and a fake Gemini.
+
+Requests go through httpx's ASGI transport straight into the app (no sockets),
+with every model call answered by benchmarks.fake_gemini. Each concurrency
+level sends --requests requests per endpoint from that many closed-loop
+clients, with payloads unique to the level so the response cache only hits
+where --repeat asks for it. The same --seed gives the same payloads and the
+same simulated latencies and errors, so runs are comparable across commits:
+
+    cd backend && python -m benchmarks.load_test --concurrency 1,8,32 --json before.json
+    cd backend && python -m benchmarks.load_test --concurrency 1,8,32 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+ENDPOINTS = ("explain", "explain/stream", "summarize-text", "quiz", "flashcards")
+_SYLLABLES = "ka lo mi ne ru sa te vo xi zu bar cen dor fel gam hul jin kor".split()
+
+
+def _configure_environment(tmp: str):
+    """Keep the run self-contained: no quota throttling, no shared on-disk state"""
+    os.environ.update({
+        "GEMINI_RPM": "1000000000",
+        "GEMINI_TPM": "1000000000000",
+        "MODEL_STATE_PATH": os.path.join(tmp, "model_state.json"),
+        "RESPONSE_CACHE": "memory",
+        "EXPLANATION_STORE_PATH": os.path.join(tmp, "explanations.sqlite3"),
+        "DOCUMENT_STORE_DIR": os.path.join(tmp, "documents"),
+        "WARMUP_SYLLABUS": "",
+    })
+
+
+def _topic(rng: random.Random) -> str:
+    return " ".join("".join(rng.choices(_SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(2, 3)))
+
+
+def make_payload(endpoint: str, rng: random.Random) -> dict:
+    topic = _topic(rng)
+    if endpoint.startswith("explain"):
+        return {"topic": topic, "difficulty": rng.choice(("Easy", "Medium", "Hard"))}
+    if endpoint == "summarize-text":
+        return {"text": " ".join(f"{_topic(rng)} is a kind of {topic}." for _ in range(rng.randint(20, 200)))}
+    if endpoint == "quiz":
+        return {"material": " ".join(f"The {_topic(rng)} uses {topic}." for _ in range(rng.randint(5, 40))),
+                "num_questions": rng.randint(3, 5)}
+    return {"topic": topic, "num_cards": rng.randint(3, 8)}
+
+
+def payloads(endpoint: str, level: int, count: int, seed: int, repeat: float):
+    rng = random.Random(f"{seed}:{endpoint}:{level}")
+    sent = []
+    for _ in range(count):
+        if sent and rng.random() < repeat:
+            sent.append(rng.choice(sent))
+        else:
+            sent.append(make_payload(endpoint, rng))
+    return sent
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _fallback_total(metrics) -> float:
+    return sum(metrics.fallbacks._values.values())
+
+
+async def run_level(client, metrics, endpoint: str, concurrency: int, bodies):
+    queue = list(reversed(bodies))
+    latencies = []
+    errors = 0
+    fallbacks = _fallback_total(metrics)
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            body = queue.pop()
+            started = time.perf_counter()
+            try:
+                async with client.stream("POST", f"/{endpoint}", json=body) as response:
+                    await response.aread()
+                    failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "errors": errors,
+        "fallbacks": int(_fallback_total(metrics) - fallbacks),
+    }
+
+
+def print_results(results, baseline=None):
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline or []}
+    print(f"{'endpoint':<16}{'conc':>5}{'reqs':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'errors':>8}{'fallbk':>8}" + ("   rps / p95 vs baseline" if previous else ""))
+    for r in results:
+        line = (f"{r['endpoint']:<16}{r['concurrency']:>5}{r['requests']:>6}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}"
+                f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['errors']:>8}{r['fallbacks']:>8}")
+        old = previous.get((r["endpoint"], r["concurrency"]))
+        if old and old["rps"] and old["p95_ms"]:
+            line += f"   {r['rps'] / old['rps'] - 1:+7.1%} / {r['p95_ms'] / old['p95_ms'] - 1:+7.1%}"
+        print(line)
+
+
+async def run(args):
+    import httpx
+
+    from app import ai_service, metrics
+    from benchmarks.fake_gemini import FakeGemini
+    import main
+
+    gemini = FakeGemini(args.ttft_ms, args.sigma, args.tokens_per_second, args.error_rate, args.throttle_rate,
+                        args.seed)
+    ai_service.use_model_factory(gemini, "fake-gemini")
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for endpoint in args.endpoints:
+            for level in args.concurrency:
+                bodies = payloads(endpoint, level, args.requests, args.seed, args.repeat)
+                results.append(await run_level(client, metrics, endpoint, level, bodies))
+    return results, gemini
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=list(ENDPOINTS),
+                        help=f"comma-separated, from {','.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=32, help="requests per endpoint and concurrency level")
+    parser.add_argument("--repeat", type=float, default=0.0, help="share of requests repeating an earlier payload")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="median simulated time to first token")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-normal spread of the first-token delay")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="simulated output throughput")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of model calls failing with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of model calls failing with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_environment(tmp)
+        results, gemini = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+    print(f"\nfake Gemini: {gemini.calls} calls, {gemini.errors} failed")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
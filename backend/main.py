@@ -1,10 +1,42 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from contextlib import asynccontextmanager
+import json
+import os
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware # <--- IMPORTANT
-from app.models import ExplainRequest, TextRequest, QuizRequest, FlashcardRequest
-from app.ai_service import get_explanation, get_summary, get_quiz, get_flashcards
-from app.utils import extract_text_from_pdf
+from app.models import ExplainRequest, TextRequest, QuizRequest, FlashcardRequest, QuizBatchRequest, FlashcardBatchRequest, ReviewGradesRequest
+from app.ai_service import get_explanation_async, stream_explanation_async, get_summary_async, get_quiz_async, get_flashcards_async, get_quiz_batch_async, get_flashcards_batch_async, get_explanation_job_async, response_cache, inflight, scheduler, hedger, semantic_cache, start_model_resolution, model_status
+from app.utils import extract_pdf_bytes, shutdown_pdf_pool
+from app.documents import document_store, hash_bytes
+from app import http_cache, metrics, profiling
+from app.explanations import explanation_store
+from app.jobs import job_queue
+from app.prompt_budget import QUIZ_INPUT_TOKENS
+from app.retrieval import document_context
+from app.reviews import review_store
+from app.router import router
+from app.warmup import start_background_warmup
 
-app = FastAPI(title="AI Study Buddy API", version="2.0")
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", 500000))
+# Longest a GET /jobs/{id}?wait= request is held open
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", 30))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resolve the Gemini model in the background so the worker can serve right away
+    start_model_resolution()
+    # Off-peak generation of syllabus explanations (only if WARMUP_SYLLABUS is set)
+    warmup = start_background_warmup()
+    # Background jobs (/jobs/...), including any left unfinished by a previous worker
+    job_queue.start()
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    await job_queue.stop()
+    shutdown_pdf_pool()
+
+app = FastAPI(title="AI Study Buddy API", version="2.0", lifespan=lifespan)
 
 # --- CORS SETTINGS (Enables communication with React frontend) ---
 app.add_middleware(
@@ -16,60 +48,342 @@ app.add_middleware(
 )
 # -----------------------------------------------------------------
 
+# ETags, 304s and gzip/brotli for JSON responses; compressed bodies are cached
+app.add_middleware(http_cache.HttpCacheMiddleware)
+
+# Per-route latency histograms (exported at /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Opt-in sampling profiler (PROFILE_SAMPLE_RATE / PROFILE_HEADER); not installed at all when off
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+
 @app.get("/")
 def home():
-    return {"message": "AI Study Buddy Backend is Running!"}
+    return {"message": "AI Study Buddy Backend is Running!", "model": model_status()}
+
+def _stats():
+    return {
+        "cache": response_cache.stats(),
+        "singleflight": inflight.stats(),
+        "scheduler": scheduler.stats(),
+        "explanations": explanation_store.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else {},
+        "router": router.stats(),
+        "hedging": hedger.stats(),
+        "jobs": job_queue.stats(),
+        "reviews": review_store.stats(),
+        "http": http_cache.stats(),
+    }
+
+@app.get("/stats")
+def stats():
+    return _stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text format: latency histograms, fallbacks, tokens and the /stats gauges"""
+    return PlainTextResponse(
+        metrics.render(_stats()),
+        media_type="text/plain; version=0.0.4",
+    )
 
 # 1. Explain
 @app.post("/explain")
-def explain_endpoint(request: ExplainRequest):
+async def explain_endpoint(request: ExplainRequest):
     try:
-        result = get_explanation(request.topic, request.difficulty)
+        result = await get_explanation_async(request.topic, request.difficulty)
         return {"explanation": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 1b. Explain (streamed as Server-Sent Events)
+@app.post("/explain/stream")
+async def explain_stream_endpoint(request: ExplainRequest):
+    async def events():
+        # Comment line so headers and the first bytes go out immediately
+        yield ": stream opened\n\n"
+        async for chunk in stream_explanation_async(request.topic, request.difficulty):
+            yield f"data: {json.dumps({'text': chunk})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # 2. Summarize Text (Copy-Paste)
 @app.post("/summarize-text")
-def summarize_text_endpoint(request: TextRequest):
+async def summarize_text_endpoint(request: TextRequest):
     try:
-        result = get_summary(request.text)
+        result = await get_summary_async(request.text)
         return {"summary": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 3. Summarize PDF (File Upload)
+async def summarize_document(doc_hash: str, text: str, progress=None):
+    """Summarize a stored document once; later requests reuse the stored summary"""
+    summary = await run_in_threadpool(document_store.get_summary, doc_hash)
+    if summary is None:
+        summary, complete = await get_summary_async(text, progress, with_complete=True)
+        # Do not pin a fallback, or a summary missing sections, to the document
+        if complete:
+            await run_in_threadpool(document_store.put_summary, doc_hash, summary)
+    return summary
+
+async def summarize_pdf(data: bytes, filename: str, progress=None):
+    """Extract (or look up) an uploaded PDF and summarize it"""
+    doc_hash = await run_in_threadpool(hash_bytes, data)
+    document = await run_in_threadpool(document_store.get, doc_hash)
+    # Already processed: skip PdfReader entirely (unless its text file has gone)
+    pdf_text = await run_in_threadpool(document_store.get_text, doc_hash) if document is not None else None
+    extraction = None
+    if pdf_text is None:
+        if progress:
+            progress(0.0, "Extracting text")
+        # Long documents are summarized in chunks, so only very large uploads
+        # are cut off; extraction stops once PDF_MAX_CHARS have been read
+        try:
+            extraction = await extract_pdf_bytes(data, max_chars=PDF_MAX_CHARS)
+        except Exception:
+            raise HTTPException(status_code=400, detail="PDF is empty or unreadable.")
+        if not extraction.text.strip():
+            raise HTTPException(status_code=400, detail="PDF is empty or unreadable.")
+        document = await run_in_threadpool(document_store.put, doc_hash, filename, len(data), extraction)
+        pdf_text = extraction.text
+
+    # Extraction counts for the first 10% of a job's progress
+    summary_progress = (lambda fraction, message=None: progress(0.1 + 0.9 * fraction, message)) if progress else None
+    result = await summarize_document(doc_hash, pdf_text[:PDF_MAX_CHARS], summary_progress)
+    response = {"summary": result, "document_hash": doc_hash}
+    if extraction is not None:
+        response["extraction"] = extraction.timing()
+    return response
+
 @app.post("/summarize-pdf")
 async def summarize_pdf_endpoint(file: UploadFile = File(...)):
     try:
-        pdf_text = await extract_text_from_pdf(file)
-        if not pdf_text.strip():
-            raise HTTPException(status_code=400, detail="PDF is empty or unreadable.")
-        
-        # Limit text to first 10,000 characters to ensure speed
-        result = get_summary(pdf_text[:10000])
-        return {"summary": result}
+        data = await file.read()
+        return await summarize_pdf(data, file.filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 3b. Previously uploaded documents, referenced by the SHA-256 of their bytes
+def _get_document_or_404(doc_hash: str):
+    document = document_store.get(doc_hash)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return document
+
+def _get_text_or_404(doc_hash: str):
+    # The metadata can outlive the text file (e.g. a cleaned-up disk); upload the PDF again
+    text = document_store.get_text(doc_hash)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Document text not found; upload the PDF again.")
+    return text
+
+@app.get("/documents/{doc_hash}")
+def get_document_endpoint(doc_hash: str):
+    document = _get_document_or_404(doc_hash)
+    return {"document": document, "summaries": document_store.summaries(doc_hash)}
+
+@app.get("/documents/{doc_hash}/text")
+def get_document_text_endpoint(doc_hash: str):
+    document = _get_document_or_404(doc_hash)
+    return {"text": _get_text_or_404(doc_hash), "page_offsets": document["page_offsets"]}
+
+@app.post("/documents/{doc_hash}/summary")
+async def summarize_document_endpoint(doc_hash: str):
+    await run_in_threadpool(_get_document_or_404, doc_hash)
+    text = await run_in_threadpool(_get_text_or_404, doc_hash)
+    try:
+        result = await summarize_document(doc_hash, text[:PDF_MAX_CHARS])
+        return {"summary": result, "document_hash": doc_hash}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 4. Generate Quiz
+async def _document_passages(doc_hash: str, query: str):
+    """The passages of a stored document most relevant to `query`, within the quiz input budget"""
+    # Loading (or first building) the document's index reads and tokenizes it
+    passages = await run_in_threadpool(document_context, doc_hash, query, QUIZ_INPUT_TOKENS)
+    if passages is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return passages
+
+async def _quiz_material(request: QuizRequest):
+    if request.document_hash:
+        return await _document_passages(request.document_hash, request.material)
+    if not request.material.strip():
+        raise HTTPException(status_code=400, detail="Provide material or a document_hash.")
+    return request.material
+
 @app.post("/quiz")
-def quiz_endpoint(request: QuizRequest):
+async def quiz_endpoint(request: QuizRequest):
+    material = await _quiz_material(request)
     try:
-        result = get_quiz(request.material, request.num_questions)
+        result = await get_quiz_async(material, request.num_questions)
         return {"questions": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 5. Generate Flashcards (NEW)
+async def _flashcard_material(request: FlashcardRequest):
+    if request.document_hash:
+        return await _document_passages(request.document_hash, request.topic)
+    return None
+
+async def _saved_deck(request: FlashcardRequest):
+    """The user's deck for this request, if it already has enough cards"""
+    if not request.user_id:
+        return None
+    return await run_in_threadpool(
+        review_store.find_deck, request.user_id, request.topic, request.document_hash, request.num_cards
+    )
+
+async def _save_deck(request: FlashcardRequest, flashcards, fallback: bool):
+    """Add generated cards to the user's deck; returns the response for them"""
+    # Do not pin a fallback answer to the deck
+    if not request.user_id or fallback:
+        return {"flashcards": flashcards}
+    deck = await run_in_threadpool(
+        review_store.save_cards, request.user_id, request.topic, request.document_hash, flashcards
+    )
+    # The stored copies (with their card ids) of the cards just generated, not
+    # the deck's oldest: cards already in the deck keep their original entry
+    stored = {card["front"]: card for card in deck["cards"]}
+    fronts = dict.fromkeys(card["front"] for card in flashcards)
+    return {"flashcards": [stored[front] for front in fronts][:request.num_cards], "deck_id": deck["id"]}
+
 @app.post("/flashcards")
-def flashcard_endpoint(request: FlashcardRequest):
+async def flashcard_endpoint(request: FlashcardRequest):
+    deck = await _saved_deck(request)
+    if deck is not None:
+        return {"flashcards": deck["cards"][:request.num_cards], "deck_id": deck["id"]}
+    material = await _flashcard_material(request)
     try:
-        result = get_flashcards(request.topic, request.num_cards)
-        return {"flashcards": result}
+        result, fallback = await get_flashcards_async(
+            request.topic, request.num_cards, material=material, with_fallback=True
+        )
+        return await _save_deck(request, result, fallback)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 6. Batch generation, streamed back as NDJSON in completion order
+def _ndjson(results, key: str):
+    async def lines():
+        async for index, result in results:
+            yield json.dumps({"index": index, key: result}) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/quiz/batch")
+async def quiz_batch_endpoint(request: QuizBatchRequest):
+    # Resolved up front, so an unknown document fails the request rather than the stream
+    items = [(await _quiz_material(item), item.num_questions) for item in request.items]
+    return _ndjson(get_quiz_batch_async(items), "questions")
+
+@app.post("/flashcards/batch")
+async def flashcard_batch_endpoint(request: FlashcardBatchRequest):
+    saved = {}  # index -> cards from the user's deck
+    pending = []  # indexes of the items to generate
+    items = []
+    for index, item in enumerate(request.items):
+        deck = await _saved_deck(item)
+        if deck is not None:
+            saved[index] = deck["cards"][:item.num_cards]
+            continue
+        material = await _flashcard_material(item)
+        pending.append(index)
+        items.append((item.topic, item.num_cards) if material is None else (item.topic, item.num_cards, material))
+
+    async def results():
+        for index, cards in saved.items():
+            yield index, cards
+        async for n, cards, fallback in get_flashcards_batch_async(items, with_fallback=True):
+            index = pending[n]
+            yield index, (await _save_deck(request.items[index], cards, fallback))["flashcards"]
+
+    return _ndjson(results(), "flashcards")
+
+# 7. Spaced-repetition reviews of saved flashcards (see /flashcards user_id)
+@app.get("/reviews/due")
+def reviews_due_endpoint(user_id: str, limit: int = Query(20, ge=1, le=100)):
+    cards = review_store.due(user_id, limit)
+    return {"cards": cards, "next_due_at": cards[0]["due_at"] if cards else review_store.next_due_at(user_id)}
+
+@app.post("/reviews/grades")
+def review_grades_endpoint(request: ReviewGradesRequest):
+    cards, unknown = review_store.grade(request.user_id, [(g.card_id, g.grade) for g in request.grades])
+    return {"cards": cards, "unknown_card_ids": unknown}
+
+# 8. Saved request profiles, slowest first (open the files in speedscope.app)
+@app.get("/profiles")
+def list_profiles_endpoint(limit: int = Query(20, ge=1, le=500)):
+    return {"enabled": profiling.enabled(), "profiles": profiling.list_profiles()[:limit]}
+
+@app.get("/profiles/{profile_id}")
+def get_profile_endpoint(profile_id: str):
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, filename=os.path.basename(path))
+
+# 9. Background jobs: submit returns a job id at once; poll GET /jobs/{id}
+# (or long-poll with ?wait=seconds) for progress and the result. Jobs are kept
+# in a durable queue and resumed if the worker running them goes away.
+async def _explain_job(payload, progress):
+    explanation = await get_explanation_job_async(payload["topic"], payload["difficulty"], progress)
+    return {"explanation": explanation}
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+async def _summarize_pdf_job(payload, progress):
+    blob = payload["blob"]
+    data = await run_in_threadpool(_read_file, job_queue.blob_path(blob))
+    # The upload is removed by the queue once the job is done or failed
+    try:
+        return await summarize_pdf(data, payload["filename"], progress)
+    except HTTPException as e:
+        raise ValueError(e.detail)
+
+job_queue.register("explain", _explain_job)
+job_queue.register("summarize-pdf", _summarize_pdf_job)
+
+def _job_accepted(job_id: str):
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.post("/jobs/explain", status_code=202)
+def explain_job_endpoint(request: ExplainRequest):
+    job_id = job_queue.submit("explain", {"topic": request.topic, "difficulty": request.difficulty})
+    return _job_accepted(job_id)
+
+@app.post("/jobs/summarize-pdf", status_code=202)
+async def summarize_pdf_job_endpoint(file: UploadFile = File(...)):
+    data = await file.read()
+    if not data:
+        raise HTTPException(status_code=400, detail="PDF is empty or unreadable.")
+    # The upload is kept on disk until the job finishes, so a restart can resume it
+    job_id = job_queue.new_id()
+    await run_in_threadpool(job_queue.put_blob, job_id, data)
+    await run_in_threadpool(job_queue.submit, "summarize-pdf", {"blob": job_id, "filename": file.filename}, job_id)
+    return _job_accepted(job_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str, wait: float = Query(0, ge=0)):
+    if wait:
+        job = await job_queue.wait(job_id, min(wait, JOB_MAX_WAIT))
+    else:
+        job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
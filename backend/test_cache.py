@@ -0,0 +1,63 @@
+import asyncio
+import sqlite3
+
+from app.cache import MemoryCache, SQLiteCache, TieredCache
+
+
+def _table_totals(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+
+def test_sqlite_evicts_least_recently_used_within_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteCache, "TOUCH_SECONDS", 0)
+    path = str(tmp_path / "responses.sqlite3")
+    cache = SQLiteCache(path, max_bytes=1000)
+    for i in range(4):
+        cache.set(f"k{i}", "x" * 200)
+    assert cache.get("k0") is not None  # k1 is now the least recently used
+
+    cache.set("k4", "x" * 300)
+    assert cache.get("k1") is None
+    assert all(cache.get(f"k{i}") is not None for i in (0, 2, 3, 4))
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert stats["evictions"] == 1
+    assert (stats["entries"], stats["bytes"]) == _table_totals(path)
+
+
+def test_sqlite_totals_follow_replace_expire_and_clear(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = SQLiteCache(path, max_bytes=10_000, ttl=60)
+    cache.set("a", "x" * 100)
+    cache.set("a", "x" * 40)
+    cache.set("b", b"y" * 10)
+    assert (cache.stats()["entries"], cache.stats()["bytes"]) == (2, 50) == _table_totals(path)
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE responses SET expires_at = 1 WHERE key = 'a'")
+    assert cache.get("a") is None
+    assert (cache.stats()["entries"], cache.stats()["bytes"]) == (1, 10) == _table_totals(path)
+
+    cache.clear()
+    assert (cache.stats()["entries"], cache.stats()["bytes"]) == (0, 0)
+
+
+def test_sqlite_totals_survive_reopen(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    SQLiteCache(path).set("a", "x" * 100)
+    assert SQLiteCache(path).stats()["bytes"] == 100
+
+
+def test_async_access_to_a_tiered_sqlite_cache(tmp_path):
+    cache = TieredCache(MemoryCache(max_entries=10), SQLiteCache(str(tmp_path / "responses.sqlite3")))
+    assert cache.blocking and not MemoryCache(max_entries=10).blocking
+
+    async def run():
+        await cache.set_async("k", "value")
+        cache.first.clear()
+        return await cache.get_async("k")
+
+    assert asyncio.run(run()) == "value"
+    assert cache.first.get("k") == "value"
@@ -0,0 +1,61 @@
+import asyncio
+
+from app.hedging import Hedger
+from app.router import ROUTER_MIN_SAMPLES
+from app.scheduler import CallScheduler
+
+
+def _hedger(scheduler, **kwargs):
+    hedger = Hedger(scheduler=scheduler, min_delay=0.01, **kwargs)
+    for _ in range(ROUTER_MIN_SAMPLES):
+        hedger.record("quiz", 0.001)
+    return hedger
+
+
+async def _slow_first_model(model_name):
+    await asyncio.sleep(5 if model_name == "slow" else 0.01)
+    return model_name
+
+
+def test_hedge_is_charged_to_the_scheduler_and_gives_its_slot_back():
+    async def run():
+        scheduler = CallScheduler(rpm=60, tpm=6000, max_concurrency=2)
+        hedger = _hedger(scheduler)
+        result = await hedger.run("quiz", _slow_first_model, "slow", "fast", tokens=1000)
+        await asyncio.sleep(0)  # the slot is released from the hedge's done callback
+        return result, hedger, scheduler
+
+    result, hedger, scheduler = asyncio.run(run())
+    assert result == "fast"
+    assert (hedger.fired, hedger.won) == (1, 1)
+    assert scheduler.submitted == 1 and scheduler.stats()["running"] == 0
+    assert scheduler.requests.delay(60) > 0  # one request was taken
+    assert scheduler.tokens.delay(5500) > 0  # and its 1000 tokens
+    assert scheduler.tokens.delay(4900) == 0
+
+
+def test_hedge_is_skipped_when_the_scheduler_is_full():
+    async def run():
+        scheduler = CallScheduler(rpm=60, tpm=6000, max_concurrency=1)
+        hedger = _hedger(scheduler)
+        assert scheduler.try_acquire()  # the primary's own slot
+        result = await hedger.run("quiz", lambda name: asyncio.sleep(0.05, result=name), "slow", "fast")
+        scheduler.release()
+        return result, hedger, scheduler
+
+    result, hedger, scheduler = asyncio.run(run())
+    assert result == "slow"
+    assert (hedger.fired, hedger.no_capacity) == (0, 1)
+    assert scheduler.submitted == 1 and scheduler.stats()["running"] == 0
+
+
+def test_hedge_budget_bounds_the_hedge_rate():
+    async def run():
+        hedger = _hedger(None, max_rate=0.25)
+        for _ in range(8):
+            await hedger.run("quiz", lambda name: asyncio.sleep(0.03, result=name), "slow", "fast")
+        return hedger
+
+    hedger = asyncio.run(run())
+    # The starting budget of one hedge plus a quarter of one per call
+    assert hedger.calls == 8 and hedger.fired == 3
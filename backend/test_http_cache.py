@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+
+from app.cache import MemoryCache
+from app.http_cache import HttpCacheMiddleware, add_vary, etag_matches
+
+saved = []
+app = FastAPI()
+# Same order as main.py: CORS inside, so its Vary reaches the cache middleware
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True)
+app.add_middleware(HttpCacheMiddleware, cache=MemoryCache(max_entries=100))
+
+
+@app.get("/notes")
+def notes():
+    return {"text": "mitochondria " * 100}
+
+
+@app.post("/decks")
+def save_deck():
+    saved.append(1)
+    return {"saved": len(saved)}
+
+
+@app.get("/stream")
+def stream():
+    return StreamingResponse(iter([b"data: 1\n\n"]), media_type="text/event-stream")
+
+
+def _request(method, path, **headers):
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, headers=headers)
+
+    return asyncio.run(send())
+
+
+def test_etag_then_304_for_get():
+    first = _request("GET", "/notes", **{"accept-encoding": "identity"})
+    assert first.status_code == 200 and first.headers["etag"].startswith('W/"')
+    again = _request("GET", "/notes", **{"if-none-match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_post_is_never_answered_with_304():
+    saved.clear()
+    response = _request("POST", "/decks", **{"if-none-match": "*"})
+    assert response.status_code == 200
+    assert response.json() == {"saved": 1}
+
+
+def test_compressed_variant_is_cached_and_decodes():
+    first = _request("GET", "/notes", **{"accept-encoding": "gzip"})
+    second = _request("GET", "/notes", **{"accept-encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.content == second.content  # httpx decodes both
+    assert first.num_bytes_downloaded < len(first.content)
+    assert first.json() == {"text": "mitochondria " * 100}
+
+
+def test_vary_keeps_upstream_values():
+    response = _request("GET", "/notes", origin="http://x.com", cookie="session=1")
+    assert response.headers["access-control-allow-origin"] == "http://x.com"
+    assert [v.strip() for v in response.headers["vary"].split(",")] == ["Origin", "Accept-Encoding"]
+
+
+def test_streams_pass_through():
+    response = _request("GET", "/stream", **{"accept-encoding": "gzip"})
+    assert "etag" not in response.headers
+    assert "content-encoding" not in response.headers
+
+
+def test_header_helpers():
+    assert add_vary([], "Accept-Encoding") == "Accept-Encoding"
+    assert add_vary(["Origin, accept-encoding"], "Accept-Encoding") == "Origin, accept-encoding"
+    assert add_vary(["*"], "Accept-Encoding") == "*"
+    assert etag_matches('"abc", W/"def"', 'W/"def"')
+    assert etag_matches("*", 'W/"x"')
+    assert not etag_matches('"abc"', 'W/"def"')
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from app import jobs
+from app.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+async def _until(queue, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.get(job_id)
+        if job["status"] in statuses or time.monotonic() > deadline:
+            return job
+        await asyncio.sleep(0.02)
+
+
+def test_job_stopped_at_shutdown_keeps_its_upload_and_runs_again(tmp_path):
+    root = str(tmp_path)
+
+    async def first_run():
+        queue = JobQueue(root)
+        running = asyncio.Event()
+
+        async def handler(payload, progress):
+            running.set()
+            await asyncio.sleep(60)
+
+        queue.register("pdf", handler)
+        job_id = queue.new_id()
+        queue.put_blob(job_id, b"%PDF upload")
+        queue.submit("pdf", {"blob": job_id}, job_id)
+        queue.start(workers=1)
+        await asyncio.wait_for(running.wait(), 5)
+        await queue.stop()
+        return job_id
+
+    job_id = asyncio.run(first_run())
+    queue = JobQueue(root)
+    job = queue.get(job_id)
+    assert job["status"] == QUEUED
+    assert job["attempts"] == 0  # an interrupted run is not counted
+    with open(queue.blob_path(job_id), "rb") as f:
+        assert f.read() == b"%PDF upload"
+
+    async def second_run():
+        async def handler(payload, progress):
+            with open(queue.blob_path(payload["blob"]), "rb") as f:
+                return {"size": len(f.read())}
+
+        queue.register("pdf", handler)
+        queue.start(workers=1)
+        job = await _until(queue, job_id, (DONE, FAILED))
+        await queue.stop()
+        return job
+
+    job = asyncio.run(second_run())
+    assert job["status"] == DONE
+    assert job["result"] == {"size": 11}
+    assert not (tmp_path / "blobs" / job_id).exists()
+
+
+def test_failed_job_removes_its_upload(tmp_path):
+    queue = JobQueue(str(tmp_path))
+
+    async def run():
+        async def handler(payload, progress):
+            raise ValueError("PDF is empty or unreadable.")
+
+        queue.register("pdf", handler)
+        job_id = queue.new_id()
+        queue.put_blob(job_id, b"x")
+        queue.submit("pdf", {"blob": job_id}, job_id)
+        queue.start(workers=1)
+        job = await _until(queue, job_id, (DONE, FAILED))
+        await queue.stop()
+        return job
+
+    job = asyncio.run(run())
+    assert job["status"] == FAILED
+    assert job["error"] == "PDF is empty or unreadable."
+    assert not (tmp_path / "blobs" / job["id"]).exists()
+
+
+def test_recover_requeues_expired_leases_then_fails_them(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    queue = JobQueue(str(tmp_path))
+    job_id = queue.submit("pdf", {})
+    stale = time.time() - jobs.JOB_LEASE_SECONDS - 1
+
+    def lose_worker(attempts):
+        queue._connect().execute(
+            "UPDATE jobs SET status = ?, worker = 'gone', attempts = ?, heartbeat_at = ? WHERE id = ?",
+            (RUNNING, attempts, stale, job_id),
+        )
+
+    lose_worker(1)
+    assert queue.recover() == 1
+    assert queue.get(job_id)["status"] == QUEUED
+
+    lose_worker(2)
+    assert queue.recover() == 0
+    assert queue.get(job_id)["status"] == FAILED
+
+    # A live lease is left alone
+    queue._connect().execute(
+        "UPDATE jobs SET status = ?, attempts = 1, heartbeat_at = ? WHERE id = ?", (RUNNING, time.time(), job_id)
+    )
+    assert queue.recover() == 0
+    assert queue.get(job_id)["status"] == RUNNING
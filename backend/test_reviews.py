@@ -0,0 +1,51 @@
+from app.reviews import DAY, MIN_EASE, START_EASE, ReviewStore, schedule
+
+NEW_CARD = {"ease": START_EASE, "interval_days": 0.0, "repetitions": 0, "lapses": 0}
+
+
+def test_schedule_follows_sm2_intervals():
+    card = NEW_CARD
+    intervals = []
+    for grade in (4, 4, 4, 5):
+        card = schedule(card, grade, now=0)
+        intervals.append(card["interval_days"])
+    assert intervals == [1.0, 6.0, 15.0, 39.0]
+    assert card["repetitions"] == 4 and card["ease"] == 2.6
+    assert card["due_at"] == 39 * DAY and card["reviewed_at"] == 0
+
+
+def test_lapse_restarts_the_card_and_lowers_ease():
+    card = dict(NEW_CARD, interval_days=15.0, repetitions=3)
+    card = schedule(card, 1, now=100)
+    assert (card["interval_days"], card["repetitions"], card["lapses"]) == (1.0, 0, 1)
+    assert card["ease"] == 1.96 and card["due_at"] == 100 + DAY
+    for _ in range(5):
+        card = schedule(card, 0, now=100)
+    assert card["ease"] == MIN_EASE
+
+
+def test_due_returns_the_users_overdue_cards_first(tmp_path):
+    store = ReviewStore(str(tmp_path / "reviews.sqlite3"))
+    assert store.due("ann", 10) == []
+    cards = [{"front": f"Q{i}", "back": f"A{i}"} for i in range(3)]
+    deck = store.save_cards("ann", "Deadlock", "", cards, now=1000)
+    store.save_cards("bob", "Deadlock", "", cards, now=0)
+    first, second, third = (card["id"] for card in deck["cards"])
+
+    store.grade("ann", [(first, 5)], now=2000)  # due a day later
+    store.grade("ann", [(third, 0)], now=500)  # relearn at 500 + DAY
+    due = store.due("ann", 10, now=1500 + DAY)
+    assert [card["id"] for card in due] == [second, third]
+    assert [card["id"] for card in store.due("ann", 1, now=1500 + DAY)] == [second]
+    assert store.due("ann", 10, now=999) == []
+    assert store.next_due_at("ann") == 1000
+
+
+def test_grade_reports_unknown_cards(tmp_path):
+    store = ReviewStore(str(tmp_path / "reviews.sqlite3"))
+    deck = store.save_cards("ann", "Deadlock", "", [{"front": "Q", "back": "A"}], now=0)
+    card_id = deck["cards"][0]["id"]
+    other = store.save_cards("bob", "Deadlock", "", [{"front": "Q", "back": "A"}], now=0)["cards"][0]["id"]
+    updated, unknown = store.grade("ann", [(card_id, 4), (card_id, 4), (other, 5)], now=0)
+    assert [card["repetitions"] for card in updated] == [2]
+    assert unknown == [other]
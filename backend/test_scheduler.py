@@ -0,0 +1,86 @@
+import asyncio
+
+from app.scheduler import PRIORITY_BATCH, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE, Admission, CallScheduler
+
+
+def _scheduler(**kwargs):
+    return CallScheduler(rpm=kwargs.pop("rpm", 6000), tpm=kwargs.pop("tpm", 10**7), max_concurrency=1, **kwargs)
+
+
+async def _queue_behind_a_busy_slot(scheduler, calls):
+    """Start `calls` [(name, priority or Admission)] while the only slot is taken; returns (order, release, tasks)"""
+    order = []
+    busy = asyncio.Event()
+
+    async def hold():
+        await busy.wait()
+
+    async def record(name):
+        order.append(name)
+
+    blocker = asyncio.ensure_future(scheduler.run(hold))
+    await asyncio.sleep(0)
+    tasks = []
+    for name, priority in calls:
+        if isinstance(priority, Admission):
+            run = scheduler.run(lambda name=name: record(name), admission=priority)
+        else:
+            run = scheduler.run(lambda name=name: record(name), priority)
+        tasks.append(asyncio.ensure_future(run))
+        await asyncio.sleep(0)
+    return order, busy, [blocker] + tasks
+
+
+def test_queued_calls_run_in_priority_order():
+    async def run():
+        scheduler = _scheduler()
+        order, busy, tasks = await _queue_behind_a_busy_slot(
+            scheduler, [("batch", PRIORITY_BATCH), ("default", PRIORITY_DEFAULT), ("interactive", PRIORITY_INTERACTIVE)]
+        )
+        assert scheduler.stats()["queue_depth"] == {"interactive": 1, "default": 1, "batch": 1}
+        busy.set()
+        await asyncio.gather(*tasks)
+        assert scheduler.stats()["running"] == 0
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "default", "batch"]
+
+
+def test_raised_priority_overtakes_the_queue_once():
+    async def run():
+        scheduler = _scheduler()
+        batch = Admission(PRIORITY_BATCH)
+        order, busy, tasks = await _queue_behind_a_busy_slot(
+            scheduler, [("batch", batch), ("default", PRIORITY_DEFAULT)]
+        )
+        scheduler.raise_priority(batch, PRIORITY_INTERACTIVE)
+        scheduler.raise_priority(batch, PRIORITY_BATCH)  # never lowered
+        assert batch.priority == PRIORITY_INTERACTIVE
+        assert scheduler.stats()["queue_depth"] == {"interactive": 1, "default": 1}
+        busy.set()
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()["running"]
+
+    assert asyncio.run(run()) == (["batch", "default"], 0)
+
+
+def test_retryable_errors_are_retried_and_release_their_slot():
+    class Throttled(Exception):
+        code = 429
+
+    async def run():
+        scheduler = _scheduler(base_delay=0.001)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise Throttled()
+            return "ok"
+
+        result = await scheduler.run(flaky)
+        return result, len(attempts), scheduler.stats()
+
+    result, attempts, stats = asyncio.run(run())
+    assert (result, attempts) == ("ok", 3)
+    assert stats["retries"] == 2 and stats["throttled"] == 2 and stats["running"] == 0
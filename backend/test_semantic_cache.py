@@ -0,0 +1,63 @@
+from app.semantic_cache import SemanticCache, same_topic_words
+
+
+def _cache_with(*topics, difficulty="Medium"):
+    cache = SemanticCache()
+    for topic in topics:
+        cache.add(topic, difficulty, f"key:{topic}")
+    return cache
+
+
+def test_rephrasings_hit():
+    cache = _cache_with("binary search tree", "deadlock in operating systems", "inheritance in java")
+    assert cache.lookup("what is a binary search tree", "Medium") == "key:binary search tree"
+    assert cache.lookup("Binary Search Trees", "Medium") == "key:binary search tree"
+    assert cache.lookup("deadlock in OS", "Medium") == "key:deadlock in operating systems"
+    assert cache.lookup("explain inheritance in Java", "Medium") == "key:inheritance in java"
+    assert cache.lookup("binary search trees explained", "Medium") == "key:binary search tree"
+
+
+def test_typos_and_spacing_hit():
+    cache = _cache_with("binary search tree", "deadlock in operating systems")
+    assert cache.lookup("deadlok in os", "Medium") == "key:deadlock in operating systems"
+    assert cache.lookup("dead lock", "Medium") == "key:deadlock in operating systems"
+    assert cache.lookup("binary serach tree", "Medium") == "key:binary search tree"
+
+
+def test_short_words_need_an_exact_match():
+    cache = _cache_with("binary tree")
+    assert cache.lookup("binary trie", "Medium") is None
+    assert same_topic_words(("deadlock",), ("deadlok",))
+    assert same_topic_words(("dead", "lock"), ("deadlock",))
+    assert not same_topic_words(("tree",), ("trie",))
+
+
+def test_threshold_decides_qualified_topics():
+    cache = _cache_with("deadlock in operating systems", difficulty="Medium")
+    assert cache.lookup("deadlock", "Medium") == "key:deadlock in operating systems"
+    cache.thresholds["Medium"] = 0.95
+    assert cache.lookup("deadlock", "Medium") is None
+
+
+def test_narrower_or_broader_topic_misses():
+    cache = _cache_with("binary search tree", "linked list")
+    assert cache.lookup("binary search", "Medium") is None
+    assert cache.lookup("doubly linked list", "Medium") is None
+
+    cache = _cache_with("binary search")
+    assert cache.lookup("binary search tree", "Medium") is None
+
+
+def test_subject_must_match_both_ways():
+    cache = _cache_with("inheritance in java")
+    assert cache.lookup("inheritance", "Medium") is None
+    assert cache.lookup("inheritance in python", "Medium") is None
+
+    cache = _cache_with("inheritance")
+    assert cache.lookup("inheritance in java", "Medium") is None
+
+
+def test_closest_allowed_entry_wins():
+    # "binary search" is the nearest vector, but only the tree entry names the same topic
+    cache = _cache_with("binary search", "binary search trees")
+    assert cache.lookup("binary search tree", "Medium") == "key:binary search trees"
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_joiners_share_one_call_and_see_the_leader_context():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+        joined = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do_async("k", work, "leader", joined.append))
+        await asyncio.sleep(0)
+        joiner = asyncio.ensure_future(flight.do_async("k", work, "joiner", joined.append))
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, await joiner, calls, joined, flight.stats()
+
+    leader, joiner, calls, joined, stats = asyncio.run(run())
+    assert leader == joiner == "answer"
+    assert calls == [1]
+    assert joined == ["leader"]  # only the joiner is told, and about the leader
+    assert stats["coalesced"] == 1 and stats["in_flight"] == 0
+
+
+def test_a_joiner_times_out_on_its_own_without_cancelling_the_call():
+    async def run():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do_async("k", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flight.do_async("k", slow), 0.01)
+        return await leader
+
+    assert asyncio.run(run()) == "done"
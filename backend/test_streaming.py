@@ -0,0 +1,51 @@
+import asyncio
+
+from app import ai_service
+from app.cache import MemoryCache
+from app.scheduler import CallScheduler
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class _StreamingModel:
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, request_options=None):
+        async def chunks():
+            for i in range(3):
+                yield _Chunk(f"Part {i} of the explanation.\n\n")
+
+        return chunks()
+
+
+def test_slot_is_released_when_the_model_finishes_not_the_client(monkeypatch):
+    scheduler = CallScheduler(rpm=6000, tpm=10**7, max_concurrency=1)
+
+    async def model():
+        return True
+
+    monkeypatch.setattr(ai_service, "scheduler", scheduler)
+    monkeypatch.setattr(ai_service, "response_cache", MemoryCache(max_entries=10))
+    monkeypatch.setattr(ai_service, "semantic_cache", None)
+    monkeypatch.setattr(ai_service, "get_model_async", model)
+    monkeypatch.setattr(ai_service.explanation_store, "get", lambda topic, difficulty: None)
+    monkeypatch.setattr(ai_service.router, "ladder", lambda tier: ["fake-model"])
+    monkeypatch.setattr(ai_service.router, "model", lambda name: _StreamingModel())
+
+    async def run():
+        stream = ai_service.stream_explanation_async("deadlock", "Medium")
+        first = await stream.__anext__()
+        # The client has read one chunk; the model is already done with its slot
+        for _ in range(10):
+            await asyncio.sleep(0)
+        running = scheduler.stats()["running"]
+        rest = [chunk async for chunk in stream]
+        return first, running, rest
+
+    first, running, rest = asyncio.run(run())
+    assert first.startswith("Part 0")
+    assert running == 0
+    assert "Part 2" in "".join(rest)
+    assert scheduler.submitted == 1
@@ -0,0 +1,50 @@
+import asyncio
+from collections import Counter
+
+from app import ai_service
+
+
+def _summarize(monkeypatch, fail_prompt=None):
+    calls = Counter()
+
+    async def generate(endpoint, prompt, generation_config=None, *args, **kwargs):
+        calls[endpoint] += 1
+        if fail_prompt is not None and fail_prompt in prompt:
+            raise RuntimeError("503 Service Unavailable")
+        return "- point " * 12
+
+    async def model():
+        return True
+
+    monkeypatch.setattr(ai_service, "_generate_async", generate)
+    monkeypatch.setattr(ai_service, "get_model_async", model)
+    monkeypatch.setattr(ai_service, "SUMMARY_CHUNK_TOKENS", 60)
+    text = "\n\n".join(f"Section {i} " + "word " * 40 for i in range(40))
+    result = asyncio.run(ai_service.get_summary_async(text, with_complete=True))
+    return result, calls
+
+
+def test_each_chunk_is_mapped_once(monkeypatch):
+    (summary, complete), calls = _summarize(monkeypatch)
+    assert complete
+    assert calls["summary_map"] == 40
+    # Each level merges pairs of the one below: 20 + 10 + 5 + 3 + 2
+    assert calls["summary_reduce"] == 40
+    assert calls["summary"] == 1
+
+
+def test_failed_section_marks_the_summary_incomplete(monkeypatch):
+    (summary, complete), calls = _summarize(monkeypatch, fail_prompt="Section 7 ")
+    assert summary.startswith("- point")
+    assert not complete
+
+
+def test_fallback_is_not_complete(monkeypatch):
+    async def no_model():
+        return None
+
+    monkeypatch.setattr(ai_service, "get_model_async", no_model)
+    summary, complete = asyncio.run(ai_service.get_summary_async("some notes", with_complete=True))
+    assert summary == ai_service.generate_mock_summary("some notes")
+    assert not complete
+    assert asyncio.run(ai_service.get_summary_async("some notes")) == summary